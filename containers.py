@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""Codec/container compatibility used to keep stream copy possible"""
+
+import re
+
+
+containers = ("auto", "mp4", "webm", "mkv")
+
+# codec families every container can hold without transcoding
+_allowed = {
+    "mp4": {
+        "video": {"h264", "hevc", "av1", "mpeg4"},
+        "audio": {"aac", "mp3", "ac3", "eac3", "alac"},
+    },
+    "webm": {
+        "video": {"vp8", "vp9", "av1"},
+        "audio": {"opus", "vorbis"},
+    },
+    "mkv": {
+        "video": None,      # anything
+        "audio": None,
+    },
+}
+
+# codecs to use for the stream not fitting into the container
+_fallback = {
+    "mp4": {"video": "h264", "audio": "aac"},
+    "webm": {"video": "libvpx-vp9", "audio": "libopus"},
+    "mkv": {"video": "h264", "audio": "aac"},
+}
+
+# yt-dlp codec strings (avc1.64001F, vp09.00.40.08, mp4a.40.2, ...)
+# and ffmpeg encoder names mapped to codec families
+_families = [
+    (re.compile(r"^(avc|h264|libx264)"), "h264"),
+    (re.compile(r"^(hev|hvc|h265|hevc|libx265)"), "hevc"),
+    (re.compile(r"^(av01|av1|libaom|libsvtav1)"), "av1"),
+    (re.compile(r"^(vp09|vp9|libvpx-vp9)"), "vp9"),
+    (re.compile(r"^(vp08|vp8|libvpx$)"), "vp8"),
+    (re.compile(r"^(mp4v|mpeg4)"), "mpeg4"),
+    (re.compile(r"^(opus|libopus)"), "opus"),
+    (re.compile(r"^(vorbis|libvorbis)"), "vorbis"),
+    (re.compile(r"^(mp3|libmp3lame|mp4a\.40\.34|mp4a\.6b)"), "mp3"),
+    (re.compile(r"^(mp4a|aac)"), "aac"),
+    (re.compile(r"^(ac-3|ac3)"), "ac3"),
+    (re.compile(r"^(ec-3|eac3)"), "eac3"),
+    (re.compile(r"^alac"), "alac"),
+]
+
+
+def codec_family(codec):
+    """Return codec family name for yt-dlp codec string
+       or ffmpeg encoder name, `None` if there is no stream"""
+    if not codec or codec in ("none", "NA"):
+        return None
+    codec = codec.lower()
+    if codec.endswith(("_nvenc", "_qsv", "_amf", "_vaapi")):
+        codec = codec.rsplit("_", 1)[0]
+    for pat, family in _families:
+        if pat.match(codec):
+            return family
+    return codec
+
+
+def _fits(container, kind, family):
+    allowed = _allowed[container][kind]
+    return family is None or allowed is None or family in allowed
+
+
+def choose(vcodec, acodec, codecs, container="auto"):
+    """Return `(extension, {"video": codec, "audio": codec})` keeping
+       as many streams copied as possible.
+
+       `vcodec` and `acodec` are source codecs as reported by yt-dlp,
+       `codecs` are codecs requested by user ("copy" or encoder name).
+       With "auto" container the first one holding all output streams
+       is chosen. Otherwise only streams not fitting into the container
+       are transcoded to its fallback codec."""
+    source = {"video": vcodec, "audio": acodec}
+    result = dict(codecs)
+    output = {kind: codec_family(source[kind] if codecs[kind] == "copy"
+                                 else codecs[kind])
+              for kind in ("video", "audio")}
+
+    if container == "auto":
+        for ext in containers[1:]:
+            if all(_fits(ext, kind, output[kind]) for kind in output):
+                return ext, result
+        container = "mkv"
+
+    for kind in output:
+        if not _fits(container, kind, output[kind]):
+            result[kind] = _fallback[container][kind]
+    return container, result
+
+
+if __name__ == "__main__":
+    def ok(v):
+        return "[OK]" if v else "[FAILED]"
+
+    copy = {"video": "copy", "audio": "copy"}
+    tests = [
+        (("avc1.64001F", "mp4a.40.2", copy, "auto"), ("mp4", copy)),
+        (("vp09.00.40.08", "opus", copy, "auto"), ("webm", copy)),
+        (("av01.0.08M.08", "mp4a.40.2", copy, "auto"), ("mp4", copy)),
+        (("vp9", "mp4a.40.2", copy, "auto"), ("mkv", copy)),
+        (("avc1.4d401f", "opus", copy, "mp4"),
+         ("mp4", {"video": "copy", "audio": "aac"})),
+        (("vp9", "none", copy, "auto"), ("webm", copy)),
+    ]
+    print("Test choose(): ",
+          ok(all([choose(*args) == ans for args, ans in tests])))
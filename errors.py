@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+"""Classification of yt-dlp and ffmpeg error output"""
+
+import random
+import re
+
+
+transient = "transient"        # network trouble, worth retrying
+expired = "expired"            # media URLs expired, re-resolve them
+auth = "auth"                  # login, cookies or age confirmation needed
+unsupported = "unsupported"    # codec, container or site not supported
+disk_full = "disk full"
+fatal = "fatal"                # anything else
+
+# checked in order, the first match wins
+categories = [
+    (disk_full, re.compile(
+        r"No space left on device|Disk quota exceeded|ENOSPC"
+        r"|There is not enough space on the disk", re.IGNORECASE)),
+    (expired, re.compile(
+        r"HTTP [Ee]rror 403|403 Forbidden|Server returned 403")),
+    (auth, re.compile(
+        r"Sign in to confirm|HTTP [Ee]rror 401|401 Unauthorized"
+        r"|[Ll]ogin required|[Pp]rivate video|members-only"
+        r"|--cookies|[Aa]ccount cookies")),
+    (unsupported, re.compile(
+        r"not currently supported in container|Could not find tag for codec"
+        r"|Unsupported codec|Unknown encoder|Encoder not found"
+        r"|Requested format is not available|Unsupported URL"
+        r"|Invalid data found when processing input")),
+    (transient, re.compile(
+        r"HTTP [Ee]rror (429|5\d\d)|Server returned 5(\d\d|XX)"
+        r"|Too Many Requests"
+        r"|Connection (reset|refused|timed out)|[Tt]imed? ?out"
+        r"|Temporary failure in name resolution|Network is unreachable"
+        r"|IncompleteRead|Broken pipe"
+        r"|Failed to resolve hostname|getaddrinfo failed")),
+]
+
+error_re = re.compile(r"error", re.IGNORECASE)
+
+# lines mentioning errors which do not make the result unusable
+harmless_re = re.compile(
+    r"^WARNING:|error while decoding MB|concealing \d+ DC"
+    r"|Error while decoding stream|corrupt decoded frame|Packet corrupt"
+    r"|Invalid NAL unit|non monotonically increasing dts"
+    r"|error.?resilience|errors? in (the )?stream ignored",
+    re.IGNORECASE)
+
+
+def is_harmless(line):
+    return harmless_re.search(line) is not None
+
+
+def error_lines(output):
+    """Return lines of `output` reporting errors or known failures"""
+    return [line for line in output.splitlines()
+            if not is_harmless(line) and
+            (error_re.search(line) or
+             any(pat.search(line) for _, pat in categories))]
+
+
+def has_error(output):
+    return bool(error_lines(output))
+
+
+def classify(output):
+    """Return category of the failure reported in `output`,
+       None if there are no errors"""
+    lines = error_lines(output)
+    for category, pat in categories:
+        if any(pat.search(line) for line in lines):
+            return category
+    return fatal if lines else None
+
+
+def backoff(attempt, base=2.0, cap=60.0):
+    """Return delay before the retry `attempt` (counting from 0)
+       growing exponentially with jitter"""
+    delay = min(cap, base * 2**attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+if __name__ == "__main__":
+    tests = [
+        ("ERROR: [youtube] abc: HTTP Error 403: Forbidden", expired),
+        ("[https @ 0x1] HTTP error 503 Service Unavailable\n"
+         "Server returned 5XX Server Error reply", transient),
+        ("ERROR: unable to download video data: "
+         "HTTP Error 503: Service Unavailable", transient),
+        ("[tcp @ 0x1] Connection timed out", transient),
+        ("ERROR: [youtube] abc: Unable to download webpage:"
+         " HTTP Error 404: Not Found", fatal),
+        ("ERROR: unable to download video data: HTTP Error 410: Gone",
+         fatal),
+        ("ERROR: Sign in to confirm your age", auth),
+        ("[mp4 @ 0x1] Could not find tag for codec vp8 in stream #0,"
+         " codec not currently supported in container", unsupported),
+        ("av_interleaved_write_frame(): No space left on device",
+         disk_full),
+        ("[h264 @ 0x1] error while decoding MB 10 20, bytestream -5\n"
+         "[h264 @ 0x1] concealing 100 DC, 100 AC, 100 MV errors", None),
+        ("WARNING: [youtube] Falling back to generic n function search\n"
+         "[download]  10.0% of 20.00MiB", None),
+        ("Something unexpected: error", fatal),
+    ]
+    for output, category in tests:
+        result = classify(output)
+        print("[OK]" if result == category else "[FAILED]", category)
+    assert all(0 < backoff(n) <= 60 for n in range(10))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import json
+import re
+
+from PyQt6.QtCore import (pyqtSignal, pyqtSlot, QObject, QProcess, QTimer)
+
+import gui.ytvideo as ytv
+
+import utils as ut
+
+
+# the cheapest streams are enough to find cut points
+video_filter = "wv/wv*/w"
+audio_filter = "wa/wa*/w"
+
+scene_re = re.compile(r"pts_time:\s*(\d+(?:\.\d+)?)")
+silence_start_re = re.compile(r"silence_start:\s*(-?\d+(?:\.\d+)?)")
+silence_end_re = re.compile(r"silence_end:\s*(\d+(?:\.\d+)?)")
+
+
+def parse_scenes(log):
+    return [float(t) for t in scene_re.findall(log)]
+
+
+def parse_silences(log, duration=None):
+    starts = [max(0.0, float(t)) for t in silence_start_re.findall(log)]
+    ends = [float(t) for t in silence_end_re.findall(log)]
+    if duration is not None and len(starts) > len(ends):
+        ends.append(float(duration))    # silence lasts until the end
+    return [list(pair) for pair in zip(starts, ends)]
+
+
+def suggest_intervals(scenes, silences, duration, min_length=5.0):
+    """Return intervals `(start, end, reason)` between cut points
+       found as scene changes and middles of silences"""
+    points = [(t, "scene") for t in scenes] + \
+             [((s + e) / 2, "silence") for s, e in silences]
+    intervals = []
+    start = 0.0
+    for t, reason in sorted(points):
+        if t - start < min_length or duration - t < min_length:
+            continue
+        intervals.append((start, t, reason))
+        start = t
+    if duration - start > 0:
+        intervals.append((start, duration, "end"))
+    return intervals
+
+
+class CutAnalyzer(QObject):
+    """Find scene changes in the lowest bitrate video stream
+       and silences in the audio-only stream"""
+    suggested = pyqtSignal(list)
+    failed = pyqtSignal(str)
+
+    def __init__(self, video, scene=0.4, noise="-35dB", silence=1.0):
+        super().__init__()
+        self.video = video
+        self.scene = scene
+        self.noise = noise
+        self.silence = silence
+        self.duration = ut.to_seconds(video.duration)
+        self.result = dict()
+        self.resolvers = []
+        self.processes = []
+
+    def _cache_file(self):
+        path = ut.user_dir("cache")/"analysis"
+        path.mkdir(exist_ok=True)
+        return path/f"{self.video.id}.json"
+
+    def start(self):
+        try:
+            self.result = json.loads(self._cache_file().read_text())
+            QTimer.singleShot(0, self._suggest)
+            return
+        except (OSError, ValueError):
+            self.result = dict()
+        for filter, slot in ((video_filter, self.find_scenes),
+                             (audio_filter, self.find_silences)):
+            resolver = ytv.StreamUrls(self.video.url, filter)
+            resolver.resolved.connect(slot)
+            resolver.failed.connect(self._fail)
+            self.resolvers.append(resolver)
+            resolver.request()
+
+    def _run(self, key, args, parse):
+        p = QProcess()
+        p.finished.connect(lambda code, status: self._parsed(
+            key, p, code == 0 and status == QProcess.ExitStatus.NormalExit,
+            parse))
+        self.processes.append(p)
+        ut.logger().debug(f"analysis: ffmpeg {args}")
+        try:
+            p.start(f"{ut.ffmpeg()}", ["-hide_banner", "-nostats"] + args)
+        except RuntimeError as e:   # no ffmpeg found
+            self._fail(f"{e}")
+
+    @pyqtSlot(list)
+    def find_scenes(self, urls):
+        # cuts of copied streams snap to key frames, so decoding key frames
+        # only is enough and much faster than decoding every frame
+        self._run("scenes",
+                  ["-skip_frame", "nokey", "-i", urls[0], "-an", "-sn",
+                   "-vf", f"scale=160:-2,select='gt(scene,{self.scene})',"
+                          "showinfo",
+                   "-f", "null", "-"],
+                  parse_scenes)
+
+    @pyqtSlot(list)
+    def find_silences(self, urls):
+        self._run("silences",
+                  ["-i", urls[-1], "-vn", "-sn",
+                   "-af", f"silencedetect=n={self.noise}:d={self.silence}",
+                   "-f", "null", "-"],
+                  lambda log: parse_silences(log, self.duration))
+
+    def _parsed(self, key, p, ok, parse):
+        log = ut.decode(p.readAllStandardError())
+        if not ok:
+            self._fail(f"ffmpeg failed\n{log[-1000:]}")
+            return
+        self.result[key] = parse(log)
+        if "scenes" in self.result and "silences" in self.result:
+            try:
+                self._cache_file().write_text(json.dumps(self.result))
+            except OSError as e:
+                ut.logger().warning(f"{e}")
+            self._suggest()
+
+    def _suggest(self):
+        self.suggested.emit(suggest_intervals(self.result["scenes"],
+                                              self.result["silences"],
+                                              self.duration))
+
+    @pyqtSlot(str)
+    def _fail(self, msg):
+        if self.resolvers or self.processes:
+            self.cancel()
+            self.failed.emit(msg)
+
+    def cancel(self):
+        for resolver in self.resolvers:
+            resolver.cancel()
+        for p in self.processes:
+            p.finished.disconnect()
+            p.kill()
+        self.resolvers, self.processes = [], []
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+import hmac
+import json
+import os
+import pathlib
+import re
+import secrets
+
+from PyQt6.QtCore import (pyqtSlot, QObject)
+from PyQt6.QtNetwork import (QHostAddress, QTcpServer)
+
+import gui.scheduler as sch
+
+import sinks as snk
+import utils as ut
+
+
+statuses = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+}
+
+max_request_size = 64 * 1024
+
+
+def load_token(path=None):
+    """Return API token stored in the user data directory
+       generating it on the first call"""
+    path = pathlib.Path(path) if path else ut.user_dir("data")/"api-token"
+    if path.exists():
+        return path.read_text(encoding="utf8").strip()
+    token = secrets.token_urlsafe(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf8") as f:
+        f.write(token)
+    return token
+
+
+class Request:
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+
+def parse_request(data):
+    """Return `Request` if `data` holds a complete HTTP request,
+       None if more data is expected"""
+    head, sep, body = data.partition(b"\r\n\r\n")
+    if not sep:
+        if len(data) > max_request_size:
+            raise ValueError(413)
+        return None
+    lines = ut.decode(head).split("\r\n")
+    try:
+        method, path, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise ValueError(400)
+    headers = dict()
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = ut.int_or_none(headers.get("content-length", "0"), -1)
+    if length < 0:
+        raise ValueError(400)
+    if length > max_request_size:
+        raise ValueError(413)
+    if len(body) < length:
+        return None
+    return Request(method, path.split("?", 1)[0], headers, body[:length])
+
+
+def make_job(spec):
+    """Return job given by the API `spec` dictionary"""
+    url = spec["url"]
+    if not isinstance(url, str) or not url.strip():
+        raise ValueError("url is required")
+    start, end = spec.get("start", "0"), spec.get("end")
+    output = pathlib.Path(spec.get("output", pathlib.Path.cwd()))
+    if snk.parse(spec.get("output", "")) is not None:
+        directory, filename = pathlib.Path.cwd(), spec["output"]
+    elif output.is_dir() or f"{spec.get('output', '')}".endswith("/"):
+        directory, filename = output, None
+    else:
+        directory, filename = output.parent, f"{output}"
+    interval = sch.Interval(f"{start}", f"{end}" if end else None)
+    return sch.Job(url, directory, interval,
+                   filename=filename, format_id=spec.get("format"))
+
+
+class ApiServer(QObject):
+    """Local HTTP/JSON API to submit and control jobs of the scheduler
+
+       POST   /jobs               submit {url, start, end, format, output}
+                                  output may be a sink, see `sinks`
+       GET    /jobs               list jobs
+       GET    /jobs/<id>          get job
+       DELETE /jobs/<id>          cancel job
+       GET    /jobs/<id>/events   job progress as server-sent events
+    """
+    job_re = re.compile(r"^/jobs/(\d+)(/events)?$")
+
+    def __init__(self, scheduler, token, port=0):
+        super().__init__()
+        self.scheduler = scheduler
+        self.token = token
+        self.server = QTcpServer(self)
+        self.server.newConnection.connect(self.accept)
+        if not self.server.listen(QHostAddress(
+                QHostAddress.SpecialAddress.LocalHost), port):
+            raise RuntimeError(f"API server: {self.server.errorString()}")
+        self.buffers = dict()
+        self.streams = dict()
+        ut.logger().info(f"API server listening on port {self.port()}")
+
+    def port(self):
+        return self.server.serverPort()
+
+    def close(self):
+        self.server.close()
+
+    @pyqtSlot()
+    def accept(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            if not socket.peerAddress().isLoopback():
+                socket.abort()
+                continue
+            self.buffers[socket] = b""
+            socket.readyRead.connect(lambda s=socket: self.read(s))
+            socket.disconnected.connect(lambda s=socket: self.drop(s))
+
+    def drop(self, socket):
+        self.buffers.pop(socket, None)
+        if socket in self.streams:
+            job, send = self.streams.pop(socket)
+            job.changed.disconnect(send)
+        socket.deleteLater()
+
+    def read(self, socket):
+        if socket not in self.buffers:
+            return  # request already handled
+        self.buffers[socket] += bytes(socket.readAll())
+        try:
+            request = parse_request(self.buffers[socket])
+        except ValueError as e:
+            self.reply(socket, e.args[0], {"error": statuses[e.args[0]]})
+            return
+        if request is None:
+            return
+        del self.buffers[socket]
+        try:
+            self.handle(socket, request)
+        except (ValueError, KeyError, TypeError) as e:
+            self.reply(socket, 400, {"error": f"{e}"})
+
+    def reply(self, socket, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf8")
+        socket.write(f"HTTP/1.1 {status} {statuses[status]}\r\n"
+                     "Content-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\n"
+                     "Connection: close\r\n\r\n".encode("ascii") + body)
+        socket.disconnectFromHost()
+
+    def authorized(self, request):
+        auth = request.headers.get("authorization", "")
+        scheme, _, token = auth.partition(" ")
+        return scheme.lower() == "bearer" and \
+            hmac.compare_digest(token.encode(), self.token.encode())
+
+    def handle(self, socket, request):
+        if not self.authorized(request):
+            self.reply(socket, 401, {"error": statuses[401]})
+            return
+
+        if request.path == "/jobs":
+            if request.method == "GET":
+                self.reply(socket, 200,
+                           [job.dump() for job in self.scheduler.jobs])
+            elif request.method == "POST":
+                job = make_job(json.loads(request.body))
+                self.scheduler.submit(job)
+                self.reply(socket, 201, job.dump())
+            else:
+                self.reply(socket, 405, {"error": statuses[405]})
+            return
+
+        m = self.job_re.match(request.path)
+        job = self.scheduler.find(int(m.group(1))) if m else None
+        if job is None:
+            self.reply(socket, 404, {"error": statuses[404]})
+        elif m.group(2) and request.method == "GET":
+            self.stream_events(socket, job)
+        elif m.group(2):
+            self.reply(socket, 405, {"error": statuses[405]})
+        elif request.method == "GET":
+            self.reply(socket, 200, job.dump())
+        elif request.method == "DELETE":
+            self.scheduler.cancel(job)
+            self.reply(socket, 200, job.dump())
+        else:
+            self.reply(socket, 405, {"error": statuses[405]})
+
+    def stream_events(self, socket, job):
+        socket.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"Connection: close\r\n\r\n")
+
+        def send():
+            data = json.dumps(job.dump(), ensure_ascii=False)
+            socket.write(f"event: {job.state}\ndata: {data}\n\n"
+                         .encode("utf8"))
+            if job.is_finished():
+                socket.disconnectFromHost()
+
+        self.streams[socket] = (job, send)
+        job.changed.connect(send)
+        send()
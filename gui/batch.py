@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+from pathlib import Path
+
+from PyQt6.QtCore import (pyqtSlot, Qt)
+from PyQt6.QtWidgets import (
+     QWidget, QLabel, QLineEdit, QPushButton, QComboBox, QSpinBox,
+     QTreeWidget, QTreeWidgetItem, QFileDialog, QMessageBox,
+     QHBoxLayout, QVBoxLayout)
+
+import gui.bulkresolve as bkr
+import gui.common as com
+import gui.scheduler as sch
+import gui.ytplaylist as ytp
+import gui.ytvideo as ytv
+
+import metacache as mch
+import procmon as pmn
+import utils as ut
+
+
+cut_kinds = {
+    "first seconds": "Cut first seconds of every video"
+                     " / Вырезать первые секунды каждого видео",
+    "chapter": "Cut chapter with the given number"
+               " / Вырезать главу с указанным номером",
+}
+
+
+class BatchTab(QWidget):
+    """Queue cuts for every entry of a playlist or channel"""
+    columns = ("#", "Title", "Cut", "State", "Progress", "Usage")
+
+    def __init__(self, scheduler, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+        self.scheduler.job_added.connect(self.add_job)
+        self.playlist = None
+        self.resolver = None
+        self.items = dict()
+
+        label = QLabel("Playlist:")
+        label.setToolTip("Playlist or channel link"
+                         " / Ссылка на плейлист или канал")
+        self.linkLineEdit = QLineEdit()
+        self.linkLineEdit.setPlaceholderText("playlist link or links"
+                                             " / ссылка на плейлист"
+                                             " или ссылки")
+
+        self.addPushButton = QPushButton(com.icon("icons/go-next.png"), "")
+        self.addPushButton.setToolTip("Queue cuts of all entries"
+                                      " / Поставить в очередь все видео")
+        self.addPushButton.clicked.connect(self.list_entries)
+
+        self.importPushButton = QPushButton(com.icon("icons/edit.png"), "")
+        self.importPushButton.setToolTip("Queue cuts of links listed in"
+                                         " a text file / Поставить в"
+                                         " очередь ссылки из файла")
+        self.importPushButton.clicked.connect(self.import_list)
+
+        self.stopPushButton = QPushButton(com.icon("icons/cancel.png"), "")
+        self.stopPushButton.setToolTip("Stop listing entries"
+                                       " / Остановить получение списка")
+        self.stopPushButton.clicked.connect(self.stop_listing)
+        self.stopPushButton.setEnabled(False)
+
+        linkLayout = QHBoxLayout()
+        linkLayout.addWidget(label)
+        linkLayout.addWidget(self.linkLineEdit)
+        linkLayout.addWidget(self.addPushButton)
+        linkLayout.addWidget(self.importPushButton)
+        linkLayout.addWidget(self.stopPushButton)
+
+        cutLabel = QLabel("Cut:")
+        cutLabel.setToolTip("Вырезать")
+        self.cutComboBox = QComboBox()
+        self.cutComboBox.setEditable(False)
+        for kind in cut_kinds:
+            self.cutComboBox.addItem(kind)
+        self.cutComboBox.currentTextChanged.connect(self.set_cut_kind)
+        self.cutSpinBox = QSpinBox()
+        self.cutSpinBox.setRange(1, 24*60*60)
+        self.set_cut_kind(self.cutComboBox.currentText())
+
+        dirLabel = QLabel("Save to:")
+        dirLabel.setToolTip("Сохранить в")
+        self.dirLineEdit = QLineEdit()
+        self.dirLineEdit.setPlaceholderText(f"{Path.cwd()}")
+        dirPushButton = QPushButton()
+        dirPushButton.setIcon(com.icon("icons/saveAs.png"))
+        dirPushButton.setToolTip("Choose where to save / "
+                                 "Выбрать, куда сохранить")
+        dirPushButton.clicked.connect(self.browse)
+
+        cutLayout = QHBoxLayout()
+        cutLayout.addWidget(cutLabel)
+        cutLayout.addWidget(self.cutComboBox)
+        cutLayout.addWidget(self.cutSpinBox)
+        cutLayout.addSpacing(5)
+        cutLayout.addWidget(dirLabel)
+        cutLayout.addWidget(self.dirLineEdit)
+        cutLayout.addWidget(dirPushButton)
+
+        self.jobsTreeWidget = QTreeWidget()
+        self.jobsTreeWidget.setHeaderLabels(self.columns)
+        self.jobsTreeWidget.setRootIsDecorated(False)
+        self.jobsTreeWidget.setSelectionMode(
+            QTreeWidget.SelectionMode.ExtendedSelection)
+
+        self.cancelPushButton = QPushButton(com.icon("icons/cancel.png"),
+                                            "Cancel / Отменить")
+        self.cancelPushButton.setToolTip("Cancel selected jobs"
+                                         " / Отменить выбранные задания")
+        self.cancelPushButton.clicked.connect(self.cancel_jobs)
+
+        layout = QVBoxLayout()
+        layout.addLayout(linkLayout)
+        layout.addLayout(cutLayout)
+        layout.addWidget(self.jobsTreeWidget)
+        layout.addWidget(self.cancelPushButton,
+                         alignment=Qt.AlignmentFlag.AlignRight)
+        self.setLayout(layout)
+
+    @pyqtSlot(str)
+    def set_cut_kind(self, kind):
+        self.cutComboBox.setToolTip(cut_kinds[kind])
+        if kind == "chapter":
+            self.cutSpinBox.setSuffix("")
+            self.cutSpinBox.setValue(1)
+        else:
+            self.cutSpinBox.setSuffix(" s")
+            self.cutSpinBox.setValue(60)
+
+    def get_cut(self):
+        value = self.cutSpinBox.value()
+        if self.cutComboBox.currentText() == "chapter":
+            return sch.Chapter(value)
+        return sch.FirstSeconds(value)
+
+    def get_directory(self):
+        return com.getLineEditValue(self.dirLineEdit)
+
+    def browse(self):
+        path = QFileDialog.getExistingDirectory(
+                             self, caption="Save to",
+                             directory=self.get_directory())
+        if path:
+            self.dirLineEdit.setText(path)
+
+    @pyqtSlot()
+    def list_entries(self):
+        url = self.linkLineEdit.text().strip()
+        if not url or self.playlist is not None or self.resolver is not None:
+            return
+        if len(urls := url.split()) > 1:
+            self.queue_urls(urls)
+            return
+        self.playlist = ytp.YoutubePlaylist(url)
+        self.playlist.entry_found.connect(self.queue_entry)
+        self.playlist.finished.connect(self.listing_finished)
+        try:
+            self.playlist.request_entries()
+        except RuntimeError as e:
+            ut.logger().exception(f"{e}")
+            QMessageBox.critical(self.parent(), "Error", f"{e}")
+            self.playlist = None
+            return
+        self.addPushButton.setEnabled(False)
+        self.importPushButton.setEnabled(False)
+        self.stopPushButton.setEnabled(True)
+
+    @pyqtSlot(dict)
+    def queue_entry(self, entry):
+        title = entry["title"] if entry["title"] != "NA" else None
+        job = sch.Job(entry["url"], self.get_directory(),
+                      self.get_cut(), title)
+        self.scheduler.submit(job)
+
+    @pyqtSlot()
+    def import_list(self):
+        path, _ = QFileDialog.getOpenFileName(
+                             self, caption="Links",
+                             directory=self.get_directory(),
+                             filter="Text files (*.txt);;All files (*)")
+        if not path or self.playlist is not None or \
+           self.resolver is not None:
+            return
+        try:
+            text = Path(path).read_text(encoding="utf8", errors="replace")
+        except OSError as e:
+            QMessageBox.critical(self.parent(), "Error", f"{e}")
+            return
+        urls = [line.strip() for line in text.splitlines()
+                if line.strip() and not line.lstrip().startswith("#")]
+        if urls:
+            self.queue_urls(urls)
+
+    def queue_urls(self, urls):
+        """Resolve metadata of all `urls` in a few runs of yt-dlp
+           and queue their cuts as soon as they are resolved"""
+        self.resolver = bkr.BulkResolver(list(dict.fromkeys(urls)))
+        self.resolver.resolved.connect(self.queue_url)
+        self.resolver.failed.connect(self.resolve_failed)
+        self.resolver.finished.connect(self.resolving_finished)
+        try:
+            self.resolver.start()
+        except RuntimeError as e:
+            ut.logger().exception(f"{e}")
+            QMessageBox.critical(self.parent(), "Error", f"{e}")
+            self.resolver = None
+            return
+        self.addPushButton.setEnabled(False)
+        self.importPushButton.setEnabled(False)
+        self.stopPushButton.setEnabled(True)
+
+    @pyqtSlot(str)
+    def queue_url(self, url):
+        info = mch.cache.get(ytv.info_key(url))
+        title = info["title"] if info else None
+        self.scheduler.submit(sch.Job(url, self.get_directory(),
+                                      self.get_cut(), title))
+
+    @pyqtSlot(str, str)
+    def resolve_failed(self, url, errmsg):
+        ut.logger().warning(f"{url}: {errmsg}")
+        self.queue_url(url)     # to be resolved once more and shown
+
+    @pyqtSlot()
+    def resolving_finished(self):
+        self.resolver = None
+        self.addPushButton.setEnabled(True)
+        self.importPushButton.setEnabled(True)
+        self.stopPushButton.setEnabled(False)
+
+    @pyqtSlot()
+    def stop_listing(self):
+        if self.playlist is not None:
+            self.playlist.cancel()
+        if self.resolver is not None:
+            self.resolver.cancel()
+            self.resolving_finished()
+
+    @pyqtSlot(bool, str)
+    def listing_finished(self, ok, errmsg):
+        count, self.playlist = self.playlist.count, None
+        ut.logger().info(f"{count} playlist entries queued")
+        if not ok and errmsg:
+            QMessageBox.critical(self.parent(), "Error", errmsg)
+        self.addPushButton.setEnabled(True)
+        self.importPushButton.setEnabled(True)
+        self.stopPushButton.setEnabled(False)
+
+    @pyqtSlot(sch.Job)
+    def add_job(self, job):
+        item = QTreeWidgetItem(self.jobsTreeWidget)
+        item.setData(0, Qt.ItemDataRole.UserRole, job.id)
+        self.items[job.id] = (item, job)
+        job.changed.connect(lambda: self.update_job(job))
+        self.update_job(job)
+
+    def update_job(self, job):
+        item, _ = self.items[job.id]
+        item.setText(0, f"{job.id}")
+        item.setText(1, job.title)
+        item.setToolTip(1, job.filename if job.filename else job.url)
+        item.setText(2, f"{job.cut}")
+        item.setText(3, job.state)
+        item.setToolTip(3, job.error)
+        item.setText(4, f"{job.percent}%")
+        item.setText(5, pmn.describe(job.usage))
+
+    @pyqtSlot()
+    def cancel_jobs(self):
+        for item in self.jobsTreeWidget.selectedItems():
+            _, job = self.items[item.data(0, Qt.ItemDataRole.UserRole)]
+            self.scheduler.cancel(job)
+
+    def dump(self):
+        return {
+            "playlist": self.linkLineEdit.text(),
+            "jobs": [job.dump() for job in self.scheduler.jobs],
+        }
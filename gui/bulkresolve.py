@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+"""Metadata of URL lists resolved by a few yt-dlp runs"""
+
+import json
+import re
+
+from PyQt6.QtCore import (pyqtSignal, pyqtSlot, QObject, QProcess, QTimer)
+
+import gui.ytvideo as ytv
+
+import errors as ers
+import metacache as mch
+import utils as ut
+
+
+na_re = re.compile(r" NA(?=\s*[,}])")  # yt-dlp prints missing fields bare
+# yt-dlp names the video by its id in the extractor prefix
+error_id_re = re.compile(r"\[[\w:]+\] ([\w-]+): ")
+
+
+def errors_of(url, errors):
+    """Return lines of `errors` of the yt-dlp run about the `url`"""
+    return [line for line in errors
+            if url in line or
+            ((m := error_id_re.search(line)) and m.group(1) in url)]
+
+
+def parse_line(line):
+    """Return kind ("info" or "format"), URL and fields
+       of a line printed by the bulk run"""
+    kind, _, rest = line.partition(" ")
+    url, end = json.JSONDecoder().raw_decode(rest)
+    return kind, url, json.loads(na_re.sub(' "NA"', rest[end:]))
+
+
+class Batch:
+    """yt-dlp run resolving `urls` one after another"""
+    def __init__(self, urls):
+        self.urls = urls
+        self.p = None
+        self.buffer = b""
+        self.url = None
+        self.info = None
+        self.formats = []
+        self.errors = []
+
+
+class BulkResolver(QObject):
+    """Resolve info and formats of many URLs in batches per yt-dlp run
+       filling the metadata cache, as `YoutubeVideo.load()` would do
+       for each URL, and reporting every URL as soon as it is done"""
+    resolved = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+    finished = pyqtSignal()
+
+    def __init__(self, urls, filter=ytv.YoutubeVideo.default_filter,
+                 batch_size=50, max_processes=3):
+        super().__init__()
+        self.filter = filter
+        self.max_processes = max_processes
+        self.cached = [url for url in urls if self._is_cached(url)]
+        urls = [url for url in urls if url not in self.cached]
+        self.queue = [urls[i:i + batch_size]
+                      for i in range(0, len(urls), batch_size)]
+        self.batches = []
+
+    def _is_cached(self, url):
+        return mch.cache.get(ytv.info_key(url)) is not None and \
+            mch.cache.get(ytv.formats_key(url, self.filter)) is not None
+
+    def start(self):
+        QTimer.singleShot(0, self._emit_cached)
+        self._run()
+
+    def _emit_cached(self):
+        for url in self.cached:
+            self.resolved.emit(url)
+        self._check_done()
+
+    def _run(self):
+        while self.queue and len(self.batches) < self.max_processes:
+            batch = Batch(self.queue.pop(0))
+            batch.p = QProcess()
+            batch.p.readyReadStandardOutput.connect(
+                lambda batch=batch: self._read(batch))
+            batch.p.readyReadStandardError.connect(
+                lambda batch=batch: self._read_errors(batch))
+            batch.p.finished.connect(
+                lambda *_, batch=batch: self._finished(batch))
+            self.batches.append(batch)
+            ut.logger().info(f"resolve {len(batch.urls)} URLs")
+            try:
+                # info is printed once per video before its formats
+                batch.p.start(f"{ut.yt_dlp()}",
+                              ytv.ytdl_cookies() + ytv.prefer_avc() +
+                              ["--ignore-errors", "--no-playlist",
+                               "--format", self.filter,
+                               "--print", "pre_process:info"
+                               f" %(original_url)j {ytv.info_template}",
+                               "--print", "format %(original_url)j"
+                               f" {ytv.format_template}",
+                               *batch.urls])
+            except RuntimeError as e:   # no yt-dlp found
+                ut.logger().error(f"{e}")
+                self.batches.remove(batch)
+                for url in batch.urls:
+                    self.failed.emit(url, f"{e}")
+
+    def _read(self, batch):
+        batch.buffer += bytes(batch.p.readAllStandardOutput())
+        *lines, batch.buffer = batch.buffer.split(b"\n")
+        for line in lines:
+            if not (line := ut.decode(line).strip()):
+                continue
+            try:
+                kind, url, js = parse_line(line)
+            except (ValueError, json.JSONDecodeError) as e:
+                ut.logger().warning(f"{e}: {line}")
+                continue
+            if kind == "info":
+                self._complete(batch)
+                batch.url, batch.info = url, js
+            elif url == batch.url:
+                batch.formats.append(js)
+
+    def _read_errors(self, batch):
+        err = ut.decode(batch.p.readAllStandardError())
+        batch.errors += ers.error_lines(err)
+
+    def _complete(self, batch):
+        """Cache the video whose lines are over"""
+        url, info, formats = batch.url, batch.info, batch.formats
+        batch.url, batch.info, batch.formats = None, None, []
+        if url is None:
+            return
+        if url in batch.urls:
+            batch.urls.remove(url)
+        if not formats:
+            self.failed.emit(url, "no formats / нет форматов")
+            return
+        mch.cache.put(ytv.info_key(url), info)
+        mch.cache.put(ytv.formats_key(url, self.filter), formats)
+        self.resolved.emit(url)
+
+    def _finished(self, batch):
+        batch.buffer += b"\n"     # the last line may be unterminated
+        self._read(batch)
+        self._complete(batch)
+        for url in batch.urls:
+            errors = errors_of(url, batch.errors)
+            if not errors and len(batch.urls) == 1:
+                errors = batch.errors
+            self.failed.emit(url, "\n".join(errors) if errors else
+                             "no metadata / нет метаданных")
+        self.batches.remove(batch)
+        self._run()
+        self._check_done()
+
+    def _check_done(self):
+        if not self.queue and not self.batches:
+            self.finished.emit()
+
+    @pyqtSlot()
+    def cancel(self):
+        self.queue.clear()
+        for batch in self.batches:
+            batch.p.finished.disconnect()
+            batch.p.kill()
+        self.batches.clear()
+
+
+if __name__ == "__main__":
+    url = "https://www.youtube.com/watch?v=live"
+    kind, got, js = parse_line(f'info "{url}" {{ "id": "live",'
+                               ' "title": "Live", "duration": NA }')
+    assert (kind, got) == ("info", url)
+    assert js == {"id": "live", "title": "Live", "duration": "NA"}
+    kind, _, js = parse_line(f'format "{url}" {{ "format_id": "96",'
+                             ' "vbr": NA, "urls": "https://host/96" }')
+    assert kind == "format" and js["vbr"] == "NA"
+    errors = ["ERROR: [youtube] gone-id_1: Video unavailable",
+              "ERROR: [generic] Unable to download webpage:"
+              " https://host/clip (caused by 404)"]
+    assert errors_of("https://youtu.be/gone-id_1", errors) == errors[:1]
+    assert errors_of("https://host/clip", errors) == errors[1:]
+    assert errors_of(url, errors) == []
+    print("[OK]")
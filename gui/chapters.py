@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import (
+     QDialog, QDialogButtonBox, QListWidget, QListWidgetItem, QVBoxLayout)
+
+import gui.common as com
+
+import utils as ut
+
+
+class ChaptersButton(com.ToggleSwitch):
+    def __init__(self):
+        views = [(com.icon("icons/cancel.png"), "Cancel / Отменить", ""),
+                 (com.icon("icons/download.png"), "Chapters / Главы",
+                  "Save chapters to separate files /\n"
+                  "Сохранить главы в отдельные файлы")]
+        super().__init__(views)
+
+
+class ChaptersDialog(QDialog):
+    """Choose chapters to save"""
+    def __init__(self, chapters, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setWindowTitle("Chapters / Главы")
+
+        self.chaptersListWidget = QListWidget()
+        for i, chapter in enumerate(chapters):
+            s, f = (ut.to_hhmmss(chapter["start_time"]),
+                    ut.to_hhmmss(chapter["end_time"]))
+            item = QListWidgetItem(f"{i+1:02d}. {s} - {f}"
+                                   f" {chapter.get('title', '')}")
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Checked)
+            self.chaptersListWidget.addItem(item)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok |
+                                   QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.chaptersListWidget)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+
+    def selected(self):
+        return [i for i in range(self.chaptersListWidget.count())
+                if self.chaptersListWidget.item(i).checkState() ==
+                Qt.CheckState.Checked]
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+
+from PyQt6.QtCore import (pyqtSignal, pyqtSlot, Qt, QObject, QProcess)
+from PyQt6.QtGui import QImage, QPixmap
+from PyQt6.QtWidgets import QLabel
+
+import utils as ut
+
+
+class FrameCache:
+    """LRU cache of decoded frames keyed by (video, format, time)"""
+    def __init__(self, size=64):
+        self.size = size
+        self.frames = OrderedDict()
+
+    def get(self, key):
+        frame = self.frames.get(key)
+        if frame is not None:
+            self.frames.move_to_end(key)
+        return frame
+
+    def put(self, key, frame):
+        self.frames[key] = frame
+        self.frames.move_to_end(key)
+        while len(self.frames) > self.size:
+            self.frames.popitem(last=False)
+
+
+cache = FrameCache()
+
+
+class FrameGrabber(QObject):
+    """Decode single frames of a video format with a fast seek
+       of ffmpeg on the media URL, one grab per `kind` at a time"""
+    grabbed = pyqtSignal(str, float, QImage)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, height=360):
+        super().__init__()
+        self.height = height
+        self.processes = dict()
+
+    def grab(self, kind, video, format, t):
+        fmt = video.formats[format]
+        key = (video.id, fmt["format_id"], round(t, 3))
+        self.cancel(kind)
+        if (frame := cache.get(key)) is not None:
+            self.grabbed.emit(kind, t, frame)
+            return
+        url = fmt["urls"].split()[0]
+        try:
+            ffmpeg = f"{ut.ffmpeg()}"
+        except RuntimeError as e:   # no ffmpeg found
+            ut.logger().warning(f"{e}")
+            self.failed.emit(kind, f"{e}")
+            return
+        p = QProcess()
+        p.finished.connect(lambda: self._decoded(kind, key, t, p))
+        self.processes[kind] = p
+        # input seeking jumps to the preceding key frame and then decodes
+        # up to the exact time, so only one GOP is fetched and decoded
+        p.start(ffmpeg,
+                ["-hide_banner", "-loglevel", "error", "-nostdin",
+                 "-ss", f"{t:.3f}", "-i", url,
+                 "-frames:v", "1", "-an", "-sn",
+                 "-vf", f"scale=-2:'min({self.height},ih)'",
+                 "-f", "image2pipe", "-c:v", "png", "-"])
+
+    def _decoded(self, kind, key, t, p):
+        if self.processes.get(kind) is not p:
+            return
+        del self.processes[kind]
+        frame = QImage.fromData(bytes(p.readAllStandardOutput()))
+        if p.exitStatus() != QProcess.ExitStatus.NormalExit or \
+           p.exitCode() != 0 or frame.isNull():
+            err = ut.decode(p.readAllStandardError())
+            ut.logger().warning(f"frame at {t}: {err}")
+            self.failed.emit(kind, err if err else
+                             f"no frame at {ut.to_hhmmss(t)}")
+            return
+        cache.put(key, frame)
+        self.grabbed.emit(kind, t, frame)
+
+    def cancel(self, kind=None):
+        for k in [kind] if kind else list(self.processes):
+            if (p := self.processes.pop(k, None)) is not None:
+                p.finished.disconnect()
+                p.kill()
+
+
+class FramePreview(QLabel):
+    """Window showing a grabbed frame"""
+    def __init__(self, title, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.title = title
+        self.setWindowFlag(Qt.WindowType.Tool)
+        self.setAlignment(Qt.AlignmentFlag.AlignCenter)
+
+    @pyqtSlot(float, QImage)
+    def show_frame(self, t, frame):
+        self.setWindowTitle(f"{self.title} {ut.to_hhmmss(t)}")
+        self.setPixmap(QPixmap.fromImage(frame))
+        self.adjustSize()
+        self.show()
+        self.raise_()
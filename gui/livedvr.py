@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+
+"""Recording of the last minutes of a live stream from its HLS playlist
+
+To try it with a local stream generate a sliding window playlist with
+
+    ffmpeg -re -f lavfi -i testsrc=size=640x360:rate=25 -f lavfi -i sine \\
+           -c:v libx264 -g 50 -c:a aac -f hls -hls_time 2 \\
+           -hls_list_size 60 -hls_flags delete_segments /tmp/live/index.m3u8
+
+and record the last 30 seconds following the stream for 10 more seconds
+
+    python -m gui.livedvr file:///tmp/live/index.m3u8 30 10 /tmp/clip.mp4
+
+Without arguments a self-test records a playlist served locally.
+"""
+
+from collections import deque
+import pathlib
+
+from PyQt6.QtCore import (pyqtSignal, pyqtSlot, QObject, QProcess, QTimer,
+                          QUrl)
+from PyQt6.QtNetwork import (QNetworkAccessManager, QNetworkReply,
+                             QNetworkRequest)
+
+import hls
+import utils as ut
+
+
+class HlsTrack(QObject):
+    """Fetch segments of a media playlist covering the last `last` seconds
+       concurrently and write them in order, then keep polling the
+       playlist for new segments if `follow` is set until `stop()`"""
+    progress = pyqtSignal()
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, network, url, path, last, follow=True,
+                 max_requests=4):
+        super().__init__()
+        self.network = network
+        self.url = url
+        self.path = path
+        self.last = last
+        self.follow = follow
+        self.max_requests = max_requests
+        self.file = None
+        self.next_sequence = None
+        self.queue = deque()
+        self.order = deque()
+        self.requests = dict()
+        self.fetched = dict()
+        self.durations = dict()
+        self.recorded = 0.0
+        self.listing = True
+        self.poll = None
+
+    def start(self):
+        self.file = open(self.path, "wb")
+        self._reload()
+
+    def _get(self, url, slot):
+        reply = self.network.get(QNetworkRequest(QUrl(url)))
+        reply.finished.connect(lambda: slot(reply))
+        return reply
+
+    def _reload(self):
+        self.poll = self._get(self.url, self._playlist)
+
+    def _failed(self, reply):
+        if reply.error() == QNetworkReply.NetworkError.NoError:
+            return False
+        self._fail(f"{reply.url().toString()}: {reply.errorString()}")
+        return True
+
+    def _playlist(self, reply):
+        self.poll = None
+        reply.deleteLater()
+        if not self.listing or self._failed(reply):
+            return
+        text = ut.decode(bytes(reply.readAll()))
+        base = reply.url().toString()
+        try:
+            if hls.is_master(text):
+                self.url = hls.parse_master(text, base)[0]
+                self._reload()
+                return
+            playlist = hls.parse_media(text, base)
+        except (ValueError, IndexError) as e:
+            self._fail(f"{self.url}: {e}")
+            return
+
+        if self.next_sequence is None:
+            segments = hls.trailing(playlist, self.last)
+            if playlist.map_uri:
+                self._add(playlist.map_uri, "map", 0.0)
+        else:
+            segments = [s for s in playlist.segments
+                        if s.sequence >= self.next_sequence]
+            if segments and segments[0].sequence > self.next_sequence:
+                ut.logger().warning(f"live: segments {self.next_sequence}-"
+                                    f"{segments[0].sequence - 1} are lost")
+        for segment in segments:
+            self._add(segment.uri, segment.sequence, segment.duration)
+        if segments:
+            self.next_sequence = segments[-1].sequence + 1
+        elif self.next_sequence is None:
+            self.next_sequence = playlist.media_sequence
+        self._fetch()
+
+        if playlist.endlist or not self.follow:
+            self.listing = False
+            self._check_done()
+        else:
+            interval = max(playlist.target_duration, 1.0)
+            QTimer.singleShot(int(interval * 1000), self._repoll)
+
+    def _repoll(self):
+        if self.listing and self.poll is None and self.file is not None:
+            self._reload()
+
+    def _add(self, uri, key, duration):
+        self.queue.append((key, uri))
+        self.order.append(key)
+        self.durations[key] = duration
+
+    def _fetch(self):
+        while self.queue and len(self.requests) < self.max_requests:
+            key, uri = self.queue.popleft()
+            self.requests[key] = self._get(
+                uri, lambda reply, key=key: self._fetched(key, reply))
+
+    def _fetched(self, key, reply):
+        self.requests.pop(key, None)
+        reply.deleteLater()
+        if self.file is None or self._failed(reply):
+            return
+        self.fetched[key] = bytes(reply.readAll())
+        while self.order and self.order[0] in self.fetched:
+            key = self.order.popleft()
+            self.file.write(self.fetched.pop(key))
+            self.recorded += self.durations.pop(key)
+        self.progress.emit()
+        self._fetch()
+        self._check_done()
+
+    def _check_done(self):
+        if self.listing or self.queue or self.requests or \
+           self.order or self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        self.finished.emit(True, "")
+
+    def stop(self):
+        """Stop following the playlist and finish fetched segments"""
+        self.listing = False
+        if self.poll is not None:
+            self.poll.abort()
+            self.poll = None
+        self._check_done()
+
+    def _fail(self, msg):
+        self.cancel()
+        self.finished.emit(False, msg)
+
+    def cancel(self):
+        self.listing = False
+        for reply in [self.poll, *self.requests.values()]:
+            if reply is not None:
+                reply.finished.disconnect()
+                reply.abort()
+        self.poll = None
+        self.requests.clear()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class LiveRecorder(QObject):
+    """Record the last `last` seconds of live playlists `urls` (video and
+       audio or both muxed) and remux them to `filename` with ffmpeg"""
+    progress = pyqtSignal(float, str)
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, urls, filename, last, follow=True):
+        super().__init__()
+        self.filename = filename
+        self.network = QNetworkAccessManager(self)
+        self.parts = [pathlib.Path(f"{filename}.part{i}")
+                      for i in range(len(urls))]
+        self.tracks = [HlsTrack(self.network, url, part, last, follow)
+                       for url, part in zip(urls, self.parts)]
+        self.done = 0
+        self.p = None
+
+    def start(self):
+        try:
+            ut.ffmpeg()     # to remux the recording at the end
+        except RuntimeError as e:
+            err = f"{e}"
+            QTimer.singleShot(0, lambda: self.finished.emit(False, err))
+            return
+        for track in self.tracks:
+            track.progress.connect(self._progress)
+            track.finished.connect(self._track_finished)
+            track.start()
+
+    @pyqtSlot()
+    def _progress(self):
+        self.progress.emit(min(t.recorded for t in self.tracks), "s")
+
+    @pyqtSlot(bool, str)
+    def _track_finished(self, ok, err):
+        if not ok:
+            self.cancel()
+            self.finished.emit(False, err)
+            return
+        self.done += 1
+        if self.done == len(self.tracks):
+            self._remux()
+
+    def _remux(self):
+        inputs = []
+        for part in self.parts:
+            inputs += ["-i", f"{part}"]
+        try:
+            ffmpeg = f"{ut.ffmpeg()}"
+        except RuntimeError as e:
+            # keep the recorded parts to remux them later
+            parts = "\n".join(f"{part}" for part in self.parts)
+            ut.logger().error(f"{e}, recording kept in {parts}")
+            self.finished.emit(False, f"{e}\n{parts}")
+            return
+        self.p = QProcess()
+        self.p.finished.connect(self._remuxed)
+        self.p.start(ffmpeg,
+                     ["-hide_banner", "-loglevel", "error", "-nostdin"] +
+                     inputs + ["-c", "copy", "-y", f"{self.filename}"])
+
+    @pyqtSlot()
+    def _remuxed(self):
+        p, self.p = self.p, None
+        ok = p.exitStatus() == QProcess.ExitStatus.NormalExit and \
+            p.exitCode() == 0
+        self._remove_parts()
+        self.finished.emit(ok, "" if ok else
+                           ut.decode(p.readAllStandardError()))
+
+    def stop(self):
+        for track in self.tracks:
+            track.stop()
+
+    def cancel(self):
+        for track in self.tracks:
+            track.cancel()
+        if self.p is not None:
+            self.p.finished.disconnect()
+            self.p.kill()
+            self.p = None
+        self._remove_parts()
+
+    def _remove_parts(self):
+        for part in self.parts:
+            try:
+                part.unlink(missing_ok=True)
+            except OSError as e:
+                ut.logger().warning(f"{e}")
+
+
+def _self_test():
+    """Record a local live playlist which ends after one update"""
+    from functools import partial
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+    import sys
+    import tempfile
+    import threading
+    from PyQt6.QtCore import QCoreApplication
+
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    def write(root, first, last, end=False):
+        text = "#EXTM3U\n#EXT-X-TARGETDURATION:1\n" \
+               f"#EXT-X-MEDIA-SEQUENCE:{first}\n" + \
+               "".join(f"#EXTINF:2.000,\nseg{n}.ts\n"
+                       for n in range(first, last + 1)) + \
+               ("#EXT-X-ENDLIST\n" if end else "")
+        (root/"index.m3u8").write_text(text)
+
+    app = QCoreApplication(sys.argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = pathlib.Path(tmp)
+        for n in range(100, 110):
+            (root/f"seg{n}.ts").write_bytes(bytes([n]) * 1000)
+        (root/"master.m3u8").write_text(
+            "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000\nindex.m3u8\n")
+        write(root, 100, 105)
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), partial(Handler, directory=tmp))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        network = QNetworkAccessManager()
+        track = HlsTrack(network,
+                         f"http://127.0.0.1:{server.server_port}/master.m3u8",
+                         root/"clip.ts", last=5)
+        result, updated = [], []
+
+        def progress():
+            # the stream goes on and ends once the first segment is written
+            if not updated:
+                updated.append(True)
+                write(root, 102, 109, end=True)
+
+        track.progress.connect(progress)
+
+        def finished(ok, err):
+            result.append((ok, err))
+            app.exit()
+
+        track.finished.connect(finished)
+        QTimer.singleShot(10000, app.exit)
+        track.start()
+        app.exec()
+        server.shutdown()
+        assert result == [(True, "")], result
+        # the last 5 s of the first window and everything after it
+        assert (root/"clip.ts").read_bytes() == \
+            b"".join(bytes([n]) * 1000 for n in range(103, 110))
+    print("[OK]")
+
+
+if __name__ == "__main__":
+    from argparse import Namespace
+    import sys
+    from PyQt6.QtCore import QCoreApplication
+
+    if len(sys.argv) < 5:
+        _self_test()
+        sys.exit(0)
+    url, last, follow, output = sys.argv[1:5]
+    ut.args = Namespace(ffmpeg="ffmpeg")
+    app = QCoreApplication(sys.argv)
+    recorder = LiveRecorder([url], output, float(last), float(follow) > 0)
+
+    def finished(ok, err):
+        print("done" if ok else f"failed: {err}")
+        app.exit(0 if ok else 1)
+
+    recorder.progress.connect(lambda t, _: print(f"\r{t:.1f} s", end=""))
+    recorder.finished.connect(finished)
+    recorder.start()
+    QTimer.singleShot(int(float(follow) * 1000), recorder.stop)
+    sys.exit(app.exec())
@@ -1,24 +1,35 @@
 #!/usr/bin/env python3
 
 import pathlib as pl
-from pathvalidate import sanitize_filename
 import platform
 import shutil
+import time
 
-from PyQt6.QtCore import pyqtSlot, Qt, QSize, QUrl, QProcess
-from PyQt6.QtGui import QDesktopServices
+from PyQt6.QtCore import (pyqtSignal, pyqtSlot, Qt, QSize, QTimer, QUrl,
+                          QProcess)
+from PyQt6.QtGui import QDesktopServices, QImage
 from PyQt6.QtWidgets import (
-     QWidget, QLabel, QToolButton, QVBoxLayout, QHBoxLayout,
+     QWidget, QLabel, QToolButton, QVBoxLayout, QHBoxLayout, QFileDialog,
      QProgressBar, QSizePolicy, QMessageBox, QTabWidget,
      QMainWindow)
 
+import gui.batch as bat
+import gui.chapters as chp
 import gui.common as com
+import gui.framegrab as fgr
 import gui.saveas as svs
+import gui.scheduler as sch
+import gui.storyboard as stb
 import gui.timespan as tms
 import gui.ytlink as ytl
+import gui.waveform as wvf
 import gui.ytvideo as ytv
 
+import containers as cnt
+import history as hst
 import options as opt
+import procmon as pmn
+import profiler as prof
 import utils as ut
 import version as vrs
 
@@ -75,8 +86,11 @@ class DownloadButton(com.ToggleSwitch):
 
 
 class MainWindow(QMainWindow):
+    first_painted = pyqtSignal()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.painted = False
 
         self.ytLink = ytl.YoutubeLink()
         self.ytLink.got_link.connect(self.got_yt_link)
@@ -85,18 +99,49 @@ class MainWindow(QMainWindow):
         self.timeSpan = tms.TimeSpan()
         self.timeSpan.got_interval.connect(self.got_interval)
         self.timeSpan.edit_interval.connect(self.edit_interval)
+        self.timeSpan.suggest.connect(self.suggest_intervals)
+        self.analyzer = None
+        self.timeSpan.preview.connect(self.preview_frame)
+        self.frameGrabber = fgr.FrameGrabber()
+        self.frameGrabber.grabbed.connect(self.show_frame)
+        self.frameGrabber.failed.connect(self.frame_failed)
+        self.framePreviews = {
+            "start": fgr.FramePreview("Start / Начало"),
+            "end": fgr.FramePreview("End / Конец"),
+        }
         self.timeSpan.setEnabled(False)
 
+        self.previewStrip = stb.PreviewStrip()
+        self.previewStrip.from_picked.connect(self.timeSpan.set_from)
+        self.previewStrip.to_picked.connect(self.timeSpan.set_to)
+        self.previewStrip.setEnabled(False)
+
+        self.waveformView = wvf.WaveformView()
+        self.waveformView.requested.connect(self.load_waveform)
+        self.waveformView.from_picked.connect(self.timeSpan.set_from)
+        self.waveformView.to_picked.connect(self.timeSpan.set_to)
+        self.waveformLoader = None
+
         self.saveAs = svs.SaveAsFile()
         self.saveAs.setEnabled(False)
 
-        self.options = opt.Options()
-        ytv.options = self.options    # access to other modules
+        # the Options tab is built when shown for the first time
+        self.options = None
+        ytv.options = opt.ToolOptions()     # access to other modules
+        self.optionsTab = QWidget()
+        self.optionsTab.setLayout(QVBoxLayout())
+        self.optionsTab.layout().setContentsMargins(0, 0, 0, 0)
+
+        self.history = hst.JobHistory()
+        self.scheduler = sch.Scheduler(self.history)
+        self.batch = bat.BatchTab(self.scheduler)
+        self.apiServer = self.start_api_server()
 
         self.progressBar = QProgressBar()
         self.progressBar.setMaximum(100)
         self.progressBar.setValue(0)
         self.duration_in_sec = 1
+        self.job = None
 
         self.downloadButton = DownloadButton()
         self.downloadButton.clicked.connect(self.download)
@@ -109,27 +154,36 @@ class MainWindow(QMainWindow):
         self.showInFolderPushButton.setEnabled(False)
         self.saveAs.changed.connect(self.showInFolderPushButton.setEnabled)
 
+        self.chaptersButton = chp.ChaptersButton()
+        self.chaptersButton.clicked.connect(self.save_chapters)
+        self.chaptersButton.setEnabled(False)
+
         downloadHBoxLayout = QHBoxLayout()
         downloadHBoxLayout.addWidget(self.downloadButton)
+        downloadHBoxLayout.addWidget(self.chaptersButton)
         downloadHBoxLayout.addWidget(self.showInFolderPushButton)
 
         mainTabLayout = QVBoxLayout()
         mainTabLayout.addWidget(self.ytLink)
         mainTabLayout.addWidget(self.timeSpan)
+        mainTabLayout.addWidget(self.previewStrip)
+        mainTabLayout.addWidget(self.waveformView)
         mainTabLayout.addWidget(self.saveAs)
         mainTabLayout.addWidget(self.progressBar)
         mainTabLayout.addLayout(downloadHBoxLayout)
         mainTab = QWidget()
         mainTab.setLayout(mainTabLayout)
 
-        tabs = QTabWidget()
-        tabs.addTab(mainTab, "Main")
-        tabs.addTab(self.options, "Options")
-        tabs.setTabPosition(QTabWidget.TabPosition.East)
+        self.tabs = QTabWidget()
+        self.tabs.addTab(mainTab, "Main")
+        self.tabs.addTab(self.batch, "Batch")
+        self.tabs.addTab(self.optionsTab, "Options")
+        self.tabs.setTabPosition(QTabWidget.TabPosition.East)
+        self.tabs.currentChanged.connect(self.tab_changed)
 
         mainLayout = QHBoxLayout()
         mainLayout.addWidget(AboutButton(240))
-        mainLayout.addWidget(tabs)
+        mainLayout.addWidget(self.tabs)
 
         layout = QVBoxLayout()
         layout.addLayout(mainLayout)
@@ -144,40 +198,194 @@ class MainWindow(QMainWindow):
         self.setWindowTitle(f"YtCut {vrs.get_version()}"
                             " Share the positive / Делись позитивом")
         self.setWindowIcon(com.icon("icons/ytcut.png"))
+        self.first_painted.connect(self.probe_tools)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            QTimer.singleShot(0, self.first_painted.emit)
+
+    @pyqtSlot(int)
+    def tab_changed(self, index):
+        if self.tabs.widget(index) is self.optionsTab and \
+           self.options is None:
+            self.build_options()
+
+    def build_options(self):
+        self.options = opt.Options(ytv.options)
+        ytv.options = self.options
+        self.optionsTab.layout().addWidget(self.options)
+        height = self.sizeHint().height()
+        if height > self.height():
+            self.setFixedHeight(height)
+
+    @pyqtSlot()
+    def probe_tools(self):
+        """Look for tools in background once the window is shown"""
+        missing = []
+        for command, arg in ((ut.yt_dlp, "--version"),
+                             (ut.ffmpeg, "-version")):
+            try:
+                path = command()
+            except RuntimeError as e:
+                missing.append(f"{e}")
+                continue
+            p = QProcess(self)
+            p.finished.connect(lambda *_, p=p: self.tool_probed(p))
+            p.start(f"{path}", [arg])
+        if missing:
+            QMessageBox.warning(self, "Warning", "\n".join(missing) +
+                                "\nSee --help for tool paths"
+                                " / Пути к программам см. в --help")
+
+    def tool_probed(self, p):
+        version = ut.decode(p.readAllStandardOutput()).splitlines()
+        ut.logger().info(f"{p.program()}: {version[0] if version else '?'}")
+        p.deleteLater()
+
+    def start_api_server(self):
+        if not ut.args or not ut.args.api_port:
+            return None
+        import gui.apiserver as aps     # not needed unless enabled
+        try:
+            token = ut.args.api_token if ut.args.api_token \
+                else aps.load_token()
+            return aps.ApiServer(self.scheduler, token, ut.args.api_port)
+        except (RuntimeError, OSError) as e:
+            ut.logger().exception(f"{e}")
+            return None
 
     @pyqtSlot()
     def reset(self):
         self.progressBar.setValue(0)
+        self.progressBar.setToolTip("")
         self.downloadButton.turn_on(True)
+        self.chaptersButton.turn_on(True)
+        self.chaptersButton.setEnabled(False)
         self.showInFolderPushButton.turn_on(False)
         self.saveAs.reset()
         self.saveAs.setEnabled(False)
         self.timeSpan.reset()
         self.timeSpan.setEnabled(False)
+        self.previewStrip.reset()
+        self.previewStrip.setEnabled(False)
+        self.waveformView.reset()
+        if self.waveformLoader is not None:
+            self.waveformLoader.cancel()
+            self.waveformLoader = None
         self.ytLink.reset()
         self.ytLink.setEnabled(True)
         self.ytVideo = None
+        self.job = None
+        if self.analyzer is not None:
+            self.analyzer.cancel()
+            self.analyzer = None
+        self.frameGrabber.cancel()
+        for preview in self.framePreviews.values():
+            preview.hide()
 
     @pyqtSlot(ytv.YoutubeVideo)
     def got_yt_link(self, video):
         self.ytVideo = video
         self.ytVideo.finished.connect(self.download_finished)
         self.ytVideo.progress.connect(self.update_progress)
+        self.ytVideo.usage.connect(self.update_usage)
         self.timeSpan.set_format(video.get_formats())
         self.timeSpan.set_duration(video.duration, ut.get_url_time(video.url))
         self.timeSpan.setEnabled(True)
+        if video.is_live:
+            self.timeSpan.set_live(True)
+        else:
+            self.previewStrip.set_video(video)
+            self.previewStrip.setEnabled(True)
+            self.waveformView.set_duration(ut.to_seconds(video.duration))
+        duration = ut.to_seconds(video.duration)
+        self.timeSpan.set_intervals("chapter", [
+            (c.get("title", ""), c["start_time"],
+             min(c["end_time"], duration)) for c in video.chapters])
+        self.chaptersButton.setEnabled(bool(video.chapters))
 
     @pyqtSlot(str, str)
     def got_interval(self, start, finish):
-        name = sanitize_filename(self.ytVideo.title)
-        max_name_len = 64
-        if len(name) > max_name_len:
-            name = name[: max_name_len]
         format = self.timeSpan.get_format()
-        file = name + self.ytVideo.get_suffix(start, finish, format) + ".mp4"
+        file = self.ytVideo.get_filename(start, finish, format)
         self.saveAs.set_filename(file)
         self.saveAs.setEnabled(True)
 
+    @pyqtSlot()
+    def suggest_intervals(self):
+        import gui.analysis as ana     # needed on demand only
+        self.analyzer = ana.CutAnalyzer(self.ytVideo)
+        self.analyzer.suggested.connect(self.got_suggestions)
+        self.analyzer.failed.connect(self.suggestions_failed)
+        try:
+            self.analyzer.start()
+        except RuntimeError as e:
+            self.suggestions_failed(f"{e}")
+
+    @pyqtSlot(list)
+    def got_suggestions(self, intervals):
+        self.analyzer = None
+        self.timeSpan.set_intervals("suggested", [
+            (reason, start, end) for start, end, reason in intervals])
+        self.timeSpan.suggest_done()
+
+    @pyqtSlot(str)
+    def suggestions_failed(self, errmsg):
+        self.analyzer = None
+        ut.logger().error(errmsg)
+        QMessageBox.warning(self.parent(), "Warning", errmsg)
+        self.timeSpan.suggest_done()
+
+    @pyqtSlot()
+    def load_waveform(self):
+        self.waveformLoader = wvf.WaveformLoader(self.ytVideo)
+        self.waveformLoader.loaded.connect(self.waveformView.set_envelopes)
+        self.waveformLoader.failed.connect(self.waveform_failed)
+        self.waveformView.set_loading(True)
+        try:
+            self.waveformLoader.start()
+        except RuntimeError as e:
+            self.waveform_failed(f"{e}")
+
+    @pyqtSlot(str)
+    def waveform_failed(self, errmsg):
+        self.waveformLoader = None
+        self.waveformView.set_loading(False)
+        ut.logger().error(errmsg)
+        QMessageBox.warning(self.parent(), "Warning", errmsg)
+
+    @pyqtSlot(str)
+    def preview_frame(self, kind):
+        try:
+            self.timeSpan.check_and_beautify()
+        except ValueError as e:
+            QMessageBox.warning(self.parent(), "Warning", f"{e}")
+            return
+        start, end = [ut.to_seconds(t)
+                      for t in self.timeSpan.get_interval()]
+        # the end is exclusive, so show the frame just before it
+        t = start if kind == "start" else max(end - 0.05, start)
+        format = self.timeSpan.get_format()
+        if self.ytVideo.urls_expire_soon(format):
+            self.ytVideo.refresh_urls(
+                format, lambda ok, err: self._grab_frame(kind, format, t)
+                if ok else self.frame_failed(kind, err))
+            return
+        self._grab_frame(kind, format, t)
+
+    def _grab_frame(self, kind, format, t):
+        self.frameGrabber.grab(kind, self.ytVideo, format, t)
+
+    @pyqtSlot(str, float, QImage)
+    def show_frame(self, kind, t, frame):
+        self.framePreviews[kind].show_frame(t, frame)
+
+    @pyqtSlot(str, str)
+    def frame_failed(self, kind, errmsg):
+        QMessageBox.warning(self.parent(), "Warning", errmsg)
+
     @pyqtSlot()
     def edit_interval(self):
         self.saveAs.reset()
@@ -185,34 +393,51 @@ class MainWindow(QMainWindow):
         self.progressBar.setValue(0)
 
     @pyqtSlot()
+    @prof.span("download")
     def download(self):
         if self.downloadButton.on:
             file = self.saveAs.get_filename()
-            if not file.endswith(".mp4"):
-                file = file + ".mp4"
+            ext = self.ytVideo.get_extension(self.timeSpan.get_format())
+            if pl.Path(file).suffix[1:] in cnt.containers:
+                file = f"{pl.Path(file).with_suffix(f'.{ext}')}"
+            elif not file.endswith(f".{ext}"):
+                file = file + f".{ext}"
+            files = self.ytVideo.get_rendition_files(
+                file, self.timeSpan.get_format()) or [file]
             try:
-                need_approve = pl.Path(file).exists()
+                need_approve = any(pl.Path(f).exists() for f in files)
             except OSError as e:
                 ut.logger().exception(f"{e}")
                 QMessageBox.critical(self.parent(), "Error", f"{e}")
                 return
             if need_approve:
                 if QMessageBox.question(self.parent(), "Question",
-                                        f"'{file}'\n"
-                                        "File already exists. Overwrite it?"
+                                        "\n".join(f"'{f}'" for f in files) +
+                                        "\nFile already exists. Overwrite it?"
                                         " / Файл уже существует."
                                         " Перезаписать его?") \
                   is QMessageBox.StandardButton.No:
                     return
             s, f = self.timeSpan.get_interval()
+            format = self.timeSpan.get_format()
+            live = self.ytVideo.is_live     # `f` is "now", no history
+            if not live and self.reuse_clip(file, s, f, format):
+                return
             self.ytLink.lock()
             self.timeSpan.lock()
             self.saveAs.lock()
+            self.chaptersButton.setEnabled(False)
             self.downloadButton.toggle()
-            self.duration_in_sec = ut.to_seconds(f) - ut.to_seconds(s)
+            self.duration_in_sec = ut.to_seconds(s) if live else \
+                ut.to_seconds(f) - ut.to_seconds(s)
             self.progressBar.reset()
+            self.job = None if live else (file, s, f, format, time.time())
             try:
-                format = self.timeSpan.get_format()
+                if live:
+                    self.ytVideo.start_live_download(file,
+                                                     ut.to_seconds(s),
+                                                     format)
+                    return
                 self.ytVideo.start_download(file, s, f, format)
             except ut.CalledProcessError as e:
                 ut.logger().exception(f"{e}")
@@ -221,24 +446,92 @@ class MainWindow(QMainWindow):
         else:
             self.ytVideo.cancel_download()
 
+    @pyqtSlot()
+    def save_chapters(self):
+        if not self.chaptersButton.on:
+            self.ytVideo.cancel_download()
+            return
+        dialog = chp.ChaptersDialog(self.ytVideo.chapters, self)
+        if not dialog.exec() or not (indices := dialog.selected()):
+            return
+        directory = QFileDialog.getExistingDirectory(
+            self, caption="Save chapters to / Сохранить главы в",
+            directory=f"{pl.Path(self.saveAs.get_filename()).parent}")
+        if not directory:
+            return
+        format = self.timeSpan.get_format()
+        self.ytLink.lock()
+        self.timeSpan.lock()
+        self.saveAs.lock()
+        self.downloadButton.setEnabled(False)
+        self.chaptersButton.toggle()
+        chapters = [self.ytVideo.chapters[i] for i in indices]
+        self.duration_in_sec = chapters[-1]["end_time"] - \
+            chapters[0]["start_time"]
+        self.progressBar.reset()
+        self.job = None
+        try:
+            self.ytVideo.start_chapters_download(directory, indices, format)
+        except RuntimeError as e:
+            ut.logger().exception(f"{e}")
+            QMessageBox.critical(self.parent(), "Error", f"{e}")
+            self.download_finished(False, "")
+
+    def reuse_clip(self, file, start, finish, format):
+        """Offer to link or copy the same clip downloaded earlier"""
+        entry = self.history.lookup(
+            self.ytVideo.get_key(start, finish, format))
+        if entry is None or pl.Path(entry["path"]) == pl.Path(file).resolve():
+            return False
+        if QMessageBox.question(self.parent(), "Question",
+                                f"'{entry['path']}'\n"
+                                "The same clip was downloaded earlier."
+                                " Link or copy it instead of downloading? /"
+                                " Такой же фрагмент уже был загружен."
+                                " Скопировать его вместо загрузки?") \
+           is QMessageBox.StandardButton.No:
+            return False
+        try:
+            hst.link_or_copy(entry["path"], file)
+        except OSError as e:
+            ut.logger().exception(f"{e}")
+            QMessageBox.critical(self.parent(), "Error", f"{e}")
+            return False
+        self.progressBar.setValue(self.progressBar.maximum())
+        return True
+
     @pyqtSlot(float, str)
+    @prof.span("update_progress")
     def update_progress(self, val, unit):
         percent = 0
         if unit == "%":
             percent = int(val)
         elif unit == "s":
-            percent = int(val / self.duration_in_sec * 100)
+            # live recording in follow mode goes on past the interval
+            percent = min(int(val / max(self.duration_in_sec, 1) * 100),
+                          100)
         else:
             ut.logger().warning(f"unknown progress unit ({unit})")
         self.progressBar.setValue(percent)
 
+    @pyqtSlot(dict)
+    def update_usage(self, usage):
+        self.progressBar.setToolTip(pmn.describe(usage))
+
     @pyqtSlot(bool, str)
     def download_finished(self, ok, errmsg):
         if ok:
             self.progressBar.setValue(self.progressBar.maximum())
+            if self.job is not None:
+                self.ytVideo.record_to(self.history, *self.job)
         elif errmsg:
             QMessageBox.critical(self.parent(), "Error", errmsg)
-        self.downloadButton.toggle()
+        if not self.chaptersButton.on:
+            self.chaptersButton.toggle()
+            self.downloadButton.setEnabled(self.saveAs.isEnabled())
+        else:
+            self.downloadButton.toggle()
+            self.chaptersButton.setEnabled(bool(self.ytVideo.chapters))
         self.ytLink.unlock()
         self.timeSpan.unlock()
         self.saveAs.unlock()
@@ -267,5 +560,6 @@ class MainWindow(QMainWindow):
             "ytLink": self.ytLink.dump() if self.ytLink else None,
             "timeSpan": self.timeSpan.dump() if self.timeSpan else None,
             "saveAs": self.saveAs.dump() if self.saveAs else None,
+            "batch": self.batch.dump() if self.batch else None,
             "options": ytv.options.dump() if ytv.options else None,
         }
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+import re
+
+from PyQt6.QtCore import QObject
+
+import gui.ytvideo as ytv
+
+import utils as ut
+
+
+url_re = re.compile(r"^https?://[^\s/]+\.[^\s/]+/\S+$")
+
+
+def looks_like_url(text):
+    return url_re.match(text.strip()) is not None
+
+
+class Prefetcher(QObject):
+    """Load metadata of URLs in background to fill the metadata cache
+       before the user asks for them"""
+    def __init__(self, max_inflight=2):
+        super().__init__()
+        self.max_inflight = max_inflight
+        self.inflight = OrderedDict()
+        self.taken = set()  # URLs whose loading somebody waits for
+
+    def prefetch(self, url):
+        url = url.strip()
+        if not looks_like_url(url) or url in self.inflight:
+            return
+        while len(self.inflight) >= self.max_inflight:
+            oldest = next((u for u in self.inflight if u not in self.taken),
+                          None)
+            if oldest is None:
+                return
+            self.cancel(oldest)
+        video = ytv.YoutubeVideo(url)
+        video.formats_loaded.connect(lambda: self._done(url))
+        video.info_failed.connect(lambda msg: self._done(url))
+        self.inflight[url] = video
+        ut.logger().debug(f"prefetch {url}")
+        try:
+            video.load()
+        except RuntimeError as e:
+            ut.logger().warning(f"{e}")
+            del self.inflight[url]
+
+    def _done(self, url):
+        self.inflight.pop(url, None)
+        self.taken.discard(url)
+
+    def take(self, url):
+        """Return video being loaded for the `url` or None,
+           the loading is not cancelled to make room for others"""
+        url = url.strip()
+        if (video := self.inflight.get(url)) is not None:
+            self.taken.add(url)
+        return video
+
+    def cancel(self, url):
+        self.taken.discard(url)
+        if (video := self.inflight.pop(url, None)) is not None:
+            ut.logger().debug(f"prefetch of {url} cancelled")
+            video.cancel_load()
+
+    def cancel_all(self, keep=None):
+        for url in list(self.inflight):
+            if url != keep and url not in self.taken:
+                self.cancel(url)
@@ -74,7 +74,7 @@ class SaveAsFile(QWidget):
         file, filter = QFileDialog.getSaveFileName(
                                      self, caption="Save As",
                                      directory=self.get_filename(),
-                                     filter="Video Files (*.mp4)")
+                                     filter="Video Files (*.mp4 *.webm *.mkv)")
         self.set_filename(file)
 
     def dump(self):
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+
+from collections import deque
+import itertools
+import pathlib
+import re
+import time
+from urllib.parse import urlsplit
+
+from PyQt6.QtCore import (pyqtSignal, pyqtSlot, QObject, QTimer)
+
+import gui.ytvideo as ytv
+
+import history as hst
+import logs
+import procmon as pmn
+import sinks as snk
+import utils as ut
+
+
+class Interval:
+    """Cut interval from `start` to `end` (end of video if not given)"""
+    def __init__(self, start, end=None):
+        self.start = start
+        self.end = end
+
+    def interval(self, video):
+        duration = ut.to_seconds(video.duration)
+        start = ut.to_seconds(self.start)
+        end = ut.to_seconds(self.end) if self.end else duration
+        if not start < end <= duration:
+            raise ValueError(f"bad interval {self}"
+                             f" / неверный интервал {self}")
+        return ut.to_hhmmss(start), ut.to_hhmmss(end)
+
+    def __str__(self):
+        return f"{self.start}-{self.end if self.end else ''}"
+
+
+class FirstSeconds:
+    """Cut first `seconds` of a video"""
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def interval(self, video):
+        end = min(self.seconds, ut.to_seconds(video.duration))
+        return ut.to_hhmmss(0), ut.to_hhmmss(end)
+
+    def __str__(self):
+        return f"first {ut.to_hhmmss(self.seconds)}"
+
+
+class Chapter:
+    """Cut chapter with the given `index` (counting from 1)"""
+    def __init__(self, index):
+        self.index = index
+
+    def interval(self, video):
+        if not 0 < self.index <= len(video.chapters):
+            raise ValueError(f"no chapter #{self.index}"
+                             f" / нет главы №{self.index}")
+        chapter = video.chapters[self.index - 1]
+        end = min(chapter["end_time"], ut.to_seconds(video.duration))
+        return ut.to_hhmmss(chapter["start_time"]), ut.to_hhmmss(end)
+
+    def __str__(self):
+        return f"chapter #{self.index}"
+
+
+_job_ids = itertools.count(1)
+
+throttled_re = re.compile(r"HTTP [Ee]rror (403|429)|(403 Forbidden)"
+                          r"|(429 Too Many Requests)")
+
+
+class Job(QObject):
+    """Download of a video interval with lazily resolved metadata"""
+    changed = pyqtSignal()
+    state_changed = pyqtSignal()
+
+    queued = "queued"
+    resolving = "resolving"
+    ready = "ready"
+    running = "running"
+    done = "done"
+    failed = "failed"
+    cancelled = "cancelled"
+
+    def __init__(self, url, directory, cut, title=None,
+                 filename=None, format_id=None):
+        super().__init__()
+        self.id = next(_job_ids)
+        self.url = url
+        self.directory = pathlib.Path(directory)
+        self.cut = cut
+        self.title = title if title else url
+        self.state = Job.queued
+        self.percent = 0
+        self.error = ""
+        self.filename = filename
+        self.video = None
+        self.interval = None
+        self.format = None
+        self.format_id = format_id
+        self.history = None
+        self.started = None
+        self.throughput = 0.0
+        self.throttled = False
+        self.usage = None
+
+    def _set_state(self, state, error=""):
+        self.state = state
+        self.error = error
+        logs.job_logger(self.id).info(f"{state} {self.url} {error}")
+        self.state_changed.emit()
+        self.changed.emit()
+
+    def dump(self):
+        return {
+            "id": self.id,
+            "url": self.url,
+            "title": self.title,
+            "cut": f"{self.cut}",
+            "interval": self.interval,
+            "format": self.format,
+            "file": self.filename,
+            "state": self.state,
+            "percent": self.percent,
+            "error": self.error,
+            "host": self.host(),
+            "throughput": int(self.throughput),
+            "usage": self.usage,
+        }
+
+    def is_finished(self):
+        return self.state in (Job.done, Job.failed, Job.cancelled)
+
+    def is_active(self):
+        return self.state in (Job.resolving, Job.ready, Job.running)
+
+    def host(self):
+        """Return media host of the chosen format"""
+        if self.video is None or self.format is None:
+            return None
+        urls = self.video.formats[self.format]["urls"].split()
+        return urlsplit(urls[0]).hostname if urls else None
+
+    def resolve(self):
+        self.video = ytv.YoutubeVideo(self.url)
+        self.video.log = logs.job_logger(self.id)
+        self.video.formats_loaded.connect(self._resolved)
+        self.video.info_failed.connect(self._fail)
+        self._set_state(Job.resolving)
+        try:
+            self.video.load()
+        except RuntimeError as e:
+            self._fail(f"{e}")
+
+    @pyqtSlot()
+    def _resolved(self):
+        if self.state != Job.resolving:
+            return  # cancelled while restored from cache
+        self.title = self.video.title
+        try:
+            self.interval = self.cut.interval(self.video)
+        except ValueError as e:
+            self._fail(f"{e}")
+            return
+        formats = self.video.get_formats()
+        if self.format_id:
+            formats = [f for f in formats if self.format_id ==
+                       self.video.formats[f]["format_id"]]
+            if not formats:
+                self._fail(f"no format {self.format_id}"
+                           f" / нет формата {self.format_id}")
+                return
+        self.format = formats[0]
+        if not self.filename:
+            name = self.video.get_filename(*self.interval, self.format)
+            self.filename = f"{self.directory/name}"
+        self._set_state(Job.ready)
+
+    @pyqtSlot(str)
+    def _fail(self, msg):
+        self.video = None
+        self._set_state(Job.failed, msg)
+
+    def _reuse(self):
+        if self.history is None or snk.is_sink(self.filename):
+            return False
+        entry = self.history.lookup(
+            self.video.get_key(*self.interval, self.format))
+        if entry is None:
+            return False
+        try:
+            if pathlib.Path(entry["path"]) != \
+               pathlib.Path(self.filename).resolve():
+                hst.link_or_copy(entry["path"], self.filename)
+        except OSError as e:
+            ut.logger().warning(f"{e}")
+            return False
+        self.video = None
+        self.percent = 100
+        self._set_state(Job.done)
+        return True
+
+    def start(self):
+        if self._reuse():
+            return
+        self.started = time.time()
+        self.video.progress.connect(self._progress)
+        self.video.throughput.connect(self._throughput)
+        self.video.usage.connect(self._usage)
+        self.video.finished.connect(self._finished)
+        self._set_state(Job.running)
+        try:
+            self.video.start_download(self.filename, *self.interval,
+                                      self.format)
+        except RuntimeError as e:
+            self._fail(f"{e}")
+
+    @pyqtSlot(float, str)
+    def _progress(self, val, unit):
+        if unit == "%":
+            self.percent = int(val)
+        elif unit == "s":
+            start, end = [ut.to_seconds(t) for t in self.interval]
+            self.percent = int(val / max(end - start, 1) * 100)
+        self.changed.emit()
+
+    @pyqtSlot(float)
+    def _throughput(self, rate):
+        self.throughput = rate if not self.throughput else \
+            0.7 * self.throughput + 0.3 * rate
+
+    @pyqtSlot(dict)
+    def _usage(self, usage):
+        sampler = self.video.sampler
+        self.usage = {k: int(v) for k, v in usage.items()}
+        self.usage.update(cpu_time=round(sampler.cpu_time, 1),
+                          peak_rss=sampler.peak_rss)
+        self.changed.emit()
+
+    @pyqtSlot(bool, str)
+    def _finished(self, ok, err):
+        video, self.video = self.video, None   # release metadata
+        sampler = video.sampler
+        if sampler.last is not None:
+            self.usage = {"cpu_time": round(sampler.cpu_time, 1),
+                          "peak_rss": sampler.peak_rss}
+            logs.job_logger(self.id).info(
+                f"CPU {sampler.cpu_time:.1f} s,"
+                f" peak RSS {sampler.peak_rss >> 20} MB")
+        if self.state == Job.cancelled:
+            return
+        self.throttled = not ok and throttled_re.search(err) is not None
+        if ok:
+            self.percent = 100
+            if self.history is not None:
+                video.record_to(self.history, self.filename,
+                                *self.interval, self.format, self.started)
+        self._set_state(Job.done if ok else Job.failed, err)
+
+    def cancel(self):
+        if self.state == Job.running:
+            self._set_state(Job.cancelled)
+            self.video.cancel_download()
+        elif self.state in (Job.queued, Job.resolving, Job.ready):
+            if self.video is not None:
+                self.video.cancel_load()
+                self.video = None
+            self._set_state(Job.cancelled)
+
+
+class HostLimit:
+    """Concurrency limit of a media host adapted in AIMD style:
+       increased by one per round of successful jobs keeping per-job
+       throughput, halved when the host throttles or rejects us"""
+    def __init__(self, host, limit=2, maximum=8):
+        self.host = host
+        self.limit = float(limit)
+        self.maximum = maximum
+        self.rate = 0.0     # average per-job throughput
+
+    def allowed(self):
+        return max(1, int(self.limit))
+
+    def succeeded(self, throughput):
+        if self.rate and throughput < self.rate / 2:
+            # more connections only split the same bandwidth
+            self._decrease(0.75)
+        else:
+            self.limit = min(self.limit + 1 / self.allowed(), self.maximum)
+        if throughput:
+            self.rate = throughput if not self.rate else \
+                0.8 * self.rate + 0.2 * throughput
+
+    def throttled(self):
+        self._decrease(0.5)
+
+    def _decrease(self, factor):
+        self.limit = max(1.0, self.limit * factor)
+        ut.logger().info(f"{self.host}: limit {self.allowed()} jobs")
+
+
+class Scheduler(QObject):
+    """Run jobs with bounded concurrency resolving metadata on demand
+       and limiting concurrent downloads from the same media host;
+       the number of parallel jobs up to `max_jobs` follows the system
+       load and the time CPUs spend waiting for I/O; host limits start
+       below `max_jobs` so that they have room to grow"""
+    job_added = pyqtSignal(Job)
+
+    adapt_interval = 15000  # ms, the load average reacts slowly
+    high_load, low_load = 1.0, 0.7      # per CPU
+    high_iowait, low_iowait = 0.25, 0.1
+
+    def __init__(self, history=None, max_jobs=4, max_resolving=2,
+                 max_per_host=8):
+        super().__init__()
+        self.history = history
+        self.max_jobs = max_jobs
+        self.jobs_allowed = max_jobs
+        self.system = pmn.SystemSampler()
+        self.adaptTimer = QTimer()
+        self.adaptTimer.timeout.connect(self._adapt)
+        self.max_resolving = max_resolving
+        self.max_per_host = max_per_host
+        self.jobs = []
+        self.hosts = dict()
+        self._queue = deque()
+        self._running = dict()
+        self._scheduling = False
+
+    def submit(self, job):
+        job.history = self.history
+        self.jobs.append(job)
+        self._queue.append(job)
+        job.state_changed.connect(lambda: self._account(job))
+        job.state_changed.connect(self.schedule)
+        self.job_added.emit(job)
+        if pmn.available and not self.adaptTimer.isActive():
+            self.system.sample()
+            self.adaptTimer.start(self.adapt_interval)
+        self.schedule()
+
+    def cancel(self, job):
+        job.cancel()
+
+    def find(self, job_id):
+        for job in self.jobs:
+            if job.id == job_id:
+                return job
+        return None
+
+    def _count(self, *states):
+        return sum(1 for job in self.jobs if job.state in states)
+
+    def _limit(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = HostLimit(host, min(2, self.max_per_host),
+                                         self.max_per_host)
+        return self.hosts[host]
+
+    def _can_start(self, job):
+        host = job.host()
+        running = sum(1 for h in self._running.values() if h == host)
+        return running < self._limit(host).allowed()
+
+    def _account(self, job):
+        """Adapt limit of the job host when the job is over"""
+        if job not in self._running or job.state == Job.running:
+            return
+        limit = self._limit(self._running.pop(job))
+        if job.state == Job.done and job.throughput:
+            limit.succeeded(job.throughput)
+        elif job.state == Job.failed and job.throttled:
+            limit.throttled()
+
+    @pyqtSlot()
+    def _adapt(self):
+        """Run fewer jobs when CPUs or disks are saturated
+           and more again when they are not"""
+        if not any(job.is_active() or job.state == Job.queued
+                   for job in self.jobs):
+            self.adaptTimer.stop()
+            return
+        if (system := self.system.sample()) is None:
+            return
+        allowed = self.jobs_allowed
+        if system["load"] > self.high_load or \
+           system["iowait"] > self.high_iowait:
+            allowed = max(1, allowed - 1)
+        elif system["load"] < self.low_load and \
+                system["iowait"] < self.low_iowait:
+            allowed = min(allowed + 1, self.max_jobs)
+        if allowed != self.jobs_allowed:
+            ut.logger().info(f"load {system['load']:.2f} per CPU, iowait"
+                             f" {system['iowait']:.0%}: {allowed} jobs")
+            self.jobs_allowed = allowed
+            self.schedule()
+
+    @pyqtSlot()
+    def schedule(self):
+        if self._scheduling:
+            return  # state changes of jobs started below
+        self._scheduling = True
+        try:
+            self._schedule()
+        finally:
+            self._scheduling = False
+
+    def _schedule(self):
+        # metadata is resolved just before a job can start
+        # since media URLs expire and many entries may be queued
+        # ready jobs waiting for their busy hosts do not hold back
+        # resolving of jobs possibly going to other hosts
+        while self._queue and \
+                self._count(Job.resolving) < self.max_resolving and \
+                self._count(Job.resolving, Job.ready) < \
+                2 * self.jobs_allowed and \
+                self._count(Job.resolving) + sum(
+                    1 for job in self.jobs if job.state == Job.ready and
+                    self._can_start(job)) < self.jobs_allowed:
+            job = self._queue.popleft()
+            if job.state == Job.queued:
+                job.resolve()
+
+        for job in self.jobs:
+            if self._count(Job.running) >= self.jobs_allowed:
+                break
+            if job.state == Job.ready and self._can_start(job):
+                self._running[job] = job.host()
+                job.start()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+import itertools
+import json
+
+from PyQt6.QtCore import (pyqtSignal, pyqtSlot, Qt, QObject, QProcess,
+                          QRect, QUrl)
+from PyQt6.QtGui import QColor, QImage, QPainter
+from PyQt6.QtNetwork import (QNetworkAccessManager, QNetworkReply,
+                             QNetworkRequest)
+from PyQt6.QtWidgets import QWidget
+
+import gui.ytvideo as ytv
+
+import metacache as mch
+import utils as ut
+
+
+class Storyboard(QObject):
+    """Storyboard of a video, i.e. sprite sheets of `rows` x `columns`
+       tiles, each sheet is fetched on demand and kept decoded
+       in a cache bounded by `cache_bytes`"""
+    resolved = pyqtSignal()
+    sheet_loaded = pyqtSignal(int)
+    failed = pyqtSignal(str)
+
+    # small tiles are enough to recognize a scene
+    filter = "sb2/sb1/sb0/sb3"
+
+    def __init__(self, url, cache_bytes=32*1024*1024):
+        super().__init__()
+        self.url = url
+        self.cache_bytes = cache_bytes
+        self.width = self.height = 0
+        self.rows = self.columns = 0
+        self.fragments = []
+        self.starts = []
+        self.tile_duration = 0
+        self.sheets = OrderedDict()
+        self.pending = dict()
+        self.network = QNetworkAccessManager(self)
+        self.p = None
+
+    def _key(self):
+        return ("storyboard", self.url)
+
+    def request(self):
+        if (js := mch.cache.get(self._key())) is not None:
+            self._apply(js)
+            self.resolved.emit()
+            return
+        self.p = QProcess()
+        self.p.finished.connect(self.process_storyboard)
+        self.p.start(f"{ut.yt_dlp()}",
+                     ytv.ytdl_cookies() + [
+                         "--no-playlist", "--format", self.filter, "--print",
+                         '{ "width": %(width)j'
+                         ', "height": %(height)j'
+                         ', "rows": %(rows)j'
+                         ', "columns": %(columns)j'
+                         ', "fragments": %(fragments)j }',
+                         f"{self.url}"])
+
+    @pyqtSlot()
+    def process_storyboard(self):
+        try:
+            js = json.loads(ut.check_output(self.p))
+            self._apply(js)
+            mch.cache.put(self._key(), js)
+            self.resolved.emit()
+        except (ut.CalledProcessFailed, ValueError, TypeError,
+                KeyError) as e:
+            ut.logger().warning(f"no storyboard: {e}")
+            self.failed.emit(f"{e}")
+        finally:
+            self.p = None
+
+    def _apply(self, js):
+        self.width, self.height = int(js["width"]), int(js["height"])
+        self.rows, self.columns = int(js["rows"]), int(js["columns"])
+        self.fragments = [f for f in js["fragments"] if f.get("url")]
+        if not self.fragments:
+            raise ValueError("storyboard has no fragments")
+        durations = [float(f["duration"]) for f in self.fragments]
+        self.starts = list(itertools.accumulate(durations, initial=0.0))
+        self.tile_duration = durations[0] / (self.rows * self.columns)
+
+    def is_resolved(self):
+        return bool(self.fragments)
+
+    def tile(self, t):
+        """Return sheet image and tile rectangle in it showing time `t`,
+           None if the sheet is not loaded yet (it is requested then)"""
+        if not self.is_resolved():
+            return None
+        index = 0
+        while index + 1 < len(self.fragments) and \
+                self.starts[index + 1] <= t:
+            index += 1
+        image = self.sheets.get(index)
+        if image is None:
+            self.fetch(index)
+            return None
+        self.sheets.move_to_end(index)
+        n = int((t - self.starts[index]) / self.tile_duration)
+        n = max(0, min(n, self.rows * self.columns - 1))
+        width = image.width() // self.columns
+        height = image.height() // self.rows
+        return image, QRect((n % self.columns) * width,
+                            (n // self.columns) * height, width, height)
+
+    def fetch(self, index):
+        if index in self.pending or index in self.sheets:
+            return
+        reply = self.network.get(
+            QNetworkRequest(QUrl(self.fragments[index]["url"])))
+        reply.finished.connect(lambda: self._fetched(index, reply))
+        self.pending[index] = reply
+
+    def _fetched(self, index, reply):
+        self.pending.pop(index, None)
+        reply.deleteLater()
+        if reply.error() != QNetworkReply.NetworkError.NoError:
+            ut.logger().warning(f"storyboard sheet {index}:"
+                                f" {reply.errorString()}")
+            return
+        image = QImage.fromData(bytes(reply.readAll()))
+        if image.isNull():
+            ut.logger().warning(f"storyboard sheet {index}: bad image")
+            return
+        self.sheets[index] = image
+        while len(self.sheets) > 1 and \
+                sum(i.sizeInBytes() for i in self.sheets.values()) > \
+                self.cache_bytes:
+            self.sheets.popitem(last=False)
+        self.sheet_loaded.emit(index)
+
+    def cancel(self):
+        if self.p is not None:
+            self.p.finished.disconnect()
+            self.p.kill()
+            self.p = None
+        for reply in list(self.pending.values()):
+            reply.abort()
+        self.pending.clear()
+
+
+class PreviewStrip(QWidget):
+    """Strip of storyboard tiles of the visible time window
+
+       Left click picks start of the cut, right click picks its end,
+       mouse wheel zooms the time window in and out."""
+    from_picked = pyqtSignal(float)
+    to_picked = pyqtSignal(float)
+
+    def __init__(self, count=8, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count = count
+        self.storyboard = None
+        self.duration = 0
+        self.span = (0.0, 0.0)
+        self.setFixedHeight(72)
+        self.setMouseTracking(True)
+        self.setToolTip("Left click: cut from, right click: cut to,"
+                        " wheel: zoom /\n"
+                        "Левый щелчок: начало, правый щелчок: конец,"
+                        " колесо: масштаб")
+
+    def set_video(self, video):
+        self.reset()
+        self.duration = ut.to_seconds(video.duration)
+        self.span = (0.0, float(self.duration))
+        self.storyboard = Storyboard(video.url)
+        self.storyboard.resolved.connect(lambda: self.update())
+        self.storyboard.sheet_loaded.connect(lambda _: self.update())
+        try:
+            self.storyboard.request()
+        except RuntimeError as e:
+            # the strip still works as a time ruler
+            ut.logger().warning(f"{e}")
+        self.update()
+
+    def reset(self):
+        if self.storyboard is not None:
+            self.storyboard.cancel()
+            self.storyboard = None
+        self.duration = 0
+        self.span = (0.0, 0.0)
+        self.update()
+
+    def time_at(self, i):
+        start, end = self.span
+        return start + (i + 0.5) * (end - start) / self.count
+
+    def cell_at(self, x):
+        return max(0, min(int(x * self.count / max(self.width(), 1)),
+                          self.count - 1))
+
+    def cell_rect(self, i):
+        left = i * self.width() // self.count
+        right = (i + 1) * self.width() // self.count
+        return QRect(left, 0, right - left, self.height()).adjusted(1, 1,
+                                                                    -1, -1)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        background = self.palette().window().color().darker(120)
+        for i in range(self.count):
+            t = self.time_at(i)
+            rect = self.cell_rect(i)
+            tile = self.storyboard.tile(t) if self.storyboard else None
+            if tile is not None:
+                painter.drawImage(rect, *tile)
+            else:
+                painter.fillRect(rect, background)
+            if self.duration:
+                label = QRect(rect.left(), rect.bottom() - 14,
+                              rect.width(), 15)
+                painter.fillRect(label, QColor(0, 0, 0, 128))
+                painter.setPen(Qt.GlobalColor.white)
+                painter.drawText(label, Qt.AlignmentFlag.AlignCenter,
+                                 ut.to_hhmmss(int(t)))
+
+    def mousePressEvent(self, event):
+        if not self.duration:
+            return
+        t = self.time_at(self.cell_at(event.position().x()))
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.from_picked.emit(t)
+        elif event.button() == Qt.MouseButton.RightButton:
+            self.to_picked.emit(t)
+
+    def wheelEvent(self, event):
+        if not self.duration:
+            return
+        start, end = self.span
+        x = event.position().x() / max(self.width(), 1)
+        center = start + x * (end - start)
+        factor = 0.8 if event.angleDelta().y() > 0 else 1.25
+        tile = self.storyboard.tile_duration if self.storyboard and \
+            self.storyboard.is_resolved() else 1
+        length = max(self.count * tile,
+                     min((end - start) * factor, self.duration))
+        start = max(0.0, min(center - x * length, self.duration - length))
+        self.span = (start, min(start + length, self.duration))
+        self.update()
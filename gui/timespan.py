@@ -15,6 +15,8 @@ import utils as ut
 class TimeSpan(QWidget):
     got_interval = pyqtSignal(str, str)
     edit_interval = pyqtSignal()
+    suggest = pyqtSignal()
+    preview = pyqtSignal(str)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -28,6 +30,7 @@ class TimeSpan(QWidget):
 
         fromLabel = QLabel("Cut from:")
         fromLabel.setToolTip("Вырезать от")
+        self.fromLabel = fromLabel
         fromLineEdit = QLineEdit()
         fromLineEdit.setValidator(timingValidator)
         self.fromLineEdit = fromLineEdit
@@ -41,6 +44,8 @@ class TimeSpan(QWidget):
 
         toLabel = QLabel("to:")
         toLabel.setToolTip("до")
+        self.toLabel = toLabel
+        self.live = False
         toLineEdit = QLineEdit()
         toLineEdit.setValidator(timingValidator)
         self.toLineEdit = toLineEdit
@@ -60,9 +65,43 @@ class TimeSpan(QWidget):
         hLayout.addSpacing(5)
         hLayout.addWidget(goButton)
 
+        intervalsComboBox = QComboBox()
+        intervalsComboBox.setEditable(False)
+        intervalsComboBox.setToolTip("Choose interval / Выбрать интервал")
+        intervalsComboBox.activated.connect(self.interval_chosen)
+        self.intervalsComboBox = intervalsComboBox
+        self.intervals = dict()
+
+        suggestPushButton = QPushButton("Suggest / Предложить")
+        suggestPushButton.setToolTip(
+            "Suggest intervals by scene changes and silence /\n"
+            "Предложить интервалы по сменам сцен и тишине")
+        suggestPushButton.clicked.connect(self.suggest_clicked)
+        self.suggestPushButton = suggestPushButton
+
+        previewStartPushButton = QPushButton("Start frame / Первый кадр")
+        previewStartPushButton.setToolTip("Preview frame at the start /"
+                                          " Показать кадр в начале")
+        previewStartPushButton.clicked.connect(
+            lambda: self.preview.emit("start"))
+        previewEndPushButton = QPushButton("End frame / Последний кадр")
+        previewEndPushButton.setToolTip("Preview frame at the end /"
+                                        " Показать кадр в конце")
+        previewEndPushButton.clicked.connect(
+            lambda: self.preview.emit("end"))
+        self.previewPushButtons = (previewStartPushButton,
+                                   previewEndPushButton)
+
+        intervalsLayout = QHBoxLayout()
+        intervalsLayout.addWidget(intervalsComboBox, stretch=1)
+        intervalsLayout.addWidget(suggestPushButton)
+        intervalsLayout.addWidget(previewStartPushButton)
+        intervalsLayout.addWidget(previewEndPushButton)
+
         layout = QVBoxLayout()
         layout.addWidget(formatComboBox)
         layout.addLayout(hLayout)
+        layout.addLayout(intervalsLayout)
         self.setLayout(layout)
         self.reset()
         self.setEnabled(False)
@@ -74,6 +113,7 @@ class TimeSpan(QWidget):
         self.goButton.setEnabled(True)
 
     def reset(self):
+        self.set_live(False)
         self.clear_interval()
         zero = ut.to_hhmmss(0)
         self.fromLineEdit.setPlaceholderText(zero)
@@ -85,6 +125,11 @@ class TimeSpan(QWidget):
         self.moveTimePushButton.setEnabled(True)
         self.clear_format()
         self.formatComboBox.setEnabled(True)
+        self.intervals.clear()
+        self.update_intervals()
+        self.suggestPushButton.setEnabled(False)
+        for button in self.previewPushButtons:
+            button.setEnabled(False)
         self.goButton.turn_on(True)
 
     def set_duration(self, duration, url_time=None):
@@ -93,8 +138,33 @@ class TimeSpan(QWidget):
         self.toLineEdit.setToolTip(f"max {duration}")
         if url_time:
             self.fromLineEdit.setText(ut.to_hhmmss(url_time))
+        self.suggestPushButton.setEnabled(True)
+        for button in self.previewPushButtons:
+            button.setEnabled(True)
         self.goButton.setEnabled(True)
 
+    def set_live(self, live):
+        """Switch to choosing the last minutes of a live stream"""
+        self.live = live
+        if live:
+            self.fromLabel.setText("Last:")
+            self.fromLabel.setToolTip("Последние")
+            self.fromLineEdit.setPlaceholderText(ut.to_hhmmss(5*60))
+            self.fromLineEdit.setToolTip("Record from this time ago"
+                                         " / Записать начиная с этого"
+                                         " времени назад")
+            self.toLineEdit.setPlaceholderText("now / сейчас")
+            self.toLineEdit.setToolTip("Follow the stream until stopped"
+                                       " / Записывать до остановки")
+            self.toLineEdit.setReadOnly(True)
+            self.moveTimePushButton.setEnabled(False)
+            self.suggestPushButton.setEnabled(False)
+            for button in self.previewPushButtons:
+                button.setEnabled(False)
+        else:
+            self.fromLabel.setText("Cut from:")
+            self.fromLabel.setToolTip("Вырезать от")
+
     def get_format(self):
         return self.formatComboBox.currentText()
 
@@ -115,10 +185,53 @@ class TimeSpan(QWidget):
         self.fromLineEdit.setText(ut.to_hhmmss(start))
         self.toLineEdit.setText(ut.to_hhmmss(finish))
 
+    @pyqtSlot(float)
+    def set_from(self, t):
+        if self.goButton.on:
+            self.fromLineEdit.setText(ut.to_hhmmss(t))
+
+    @pyqtSlot(float)
+    def set_to(self, t):
+        if self.goButton.on:
+            self.toLineEdit.setText(ut.to_hhmmss(t))
+
     def clear_interval(self):
         self.fromLineEdit.setText("")
         self.toLineEdit.setText("")
 
+    def set_intervals(self, kind, intervals):
+        """Offer `intervals` of the `kind` as `(title, start, end)`
+           with times in seconds"""
+        self.intervals[kind] = intervals
+        self.update_intervals()
+
+    def update_intervals(self):
+        self.intervalsComboBox.clear()
+        self.intervalsComboBox.addItem("intervals / интервалы")
+        for kind, intervals in self.intervals.items():
+            self.intervalsComboBox.insertSeparator(
+                self.intervalsComboBox.count())
+            for title, start, end in intervals:
+                s, f = ut.to_hhmmss(start), ut.to_hhmmss(end)
+                self.intervalsComboBox.addItem(f"{kind}: {s} - {f} {title}",
+                                               (start, end))
+        self.intervalsComboBox.setEnabled(bool(self.intervals))
+
+    @pyqtSlot(int)
+    def interval_chosen(self, index):
+        interval = self.intervalsComboBox.itemData(index)
+        if interval is None or not self.goButton.on:
+            return  # placeholder or interval is fixed
+        self.set_interval(*interval)
+
+    @pyqtSlot()
+    def suggest_clicked(self):
+        self.suggestPushButton.setEnabled(False)
+        self.suggest.emit()
+
+    def suggest_done(self):
+        self.suggestPushButton.setEnabled(True)
+
     def move_time(self):
         s = self.fromLineEdit.text()
         si = ut.to_seconds(s)
@@ -128,6 +241,13 @@ class TimeSpan(QWidget):
             self.toLineEdit.setText(s)
 
     def check_and_beautify(self):
+        if self.live:
+            last = ut.to_seconds(com.getLineEditValue(self.fromLineEdit))
+            if last <= 0:
+                raise ValueError("Time must be positive!"
+                                 " / Время должно быть положительным!")
+            self.fromLineEdit.setText(ut.to_hhmmss(last))
+            return
         s, f = (com.getLineEditValue(self.fromLineEdit),
                 com.getLineEditValue(self.toLineEdit))
         si, fi = (ut.to_seconds(s),
@@ -161,9 +281,9 @@ class TimeSpan(QWidget):
             self.got_interval.emit(*self.get_interval())
         else:
             self.formatComboBox.setEnabled(True)
-            self.moveTimePushButton.setEnabled(True)
+            self.moveTimePushButton.setEnabled(not self.live)
             self.fromLineEdit.setReadOnly(False)
-            self.toLineEdit.setReadOnly(False)
+            self.toLineEdit.setReadOnly(self.live)
             self.edit_interval.emit()
         self.goButton.toggle()
 
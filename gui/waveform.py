@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+from array import array
+import json
+import math
+import operator
+import sys
+
+from PyQt6.QtCore import (pyqtSignal, pyqtSlot, Qt, QObject, QProcess,
+                          QRectF)
+from PyQt6.QtGui import QPainter
+from PyQt6.QtWidgets import QWidget
+
+import gui.ytvideo as ytv
+
+import utils as ut
+
+
+def _numpy():
+    """Return numpy if installed, it is left out of frozen builds
+       and imported on the first use to keep it off startup"""
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+class Envelope:
+    """RMS and peak envelopes of a mono `s16le` stream in `bins` bins
+
+       Samples are consumed by whole bins, so only an incomplete bin
+       is kept between calls of `feed()`."""
+    def __init__(self, duration, bins=1024, rate=8000):
+        self.np = _numpy()
+        self.bins = bins
+        self.per_bin = max(1, math.ceil(duration * rate / bins))
+        self.rms = []
+        self.peak = []
+        self.pending = array("h")
+        self.odd = b""
+
+    def feed(self, data):
+        data = self.odd + data
+        size = len(data) // 2 * 2
+        self.odd = data[size:]
+        samples = array("h", data[:size])
+        if sys.byteorder == "big":
+            samples.byteswap()
+        samples = self.pending + samples
+        whole = len(samples) // self.per_bin * self.per_bin
+        if self.np is not None:
+            self._add_blocks(samples[:whole])
+        else:
+            for i in range(0, whole, self.per_bin):
+                self._add(samples[i:i + self.per_bin])
+        self.pending = samples[whole:]
+
+    def _add_blocks(self, samples):
+        np = self.np
+        n = min(len(samples) // self.per_bin, self.bins - len(self.rms))
+        if n <= 0:
+            return
+        blocks = np.frombuffer(samples, dtype=np.int16)[:n * self.per_bin] \
+                   .astype(np.float32).reshape(n, self.per_bin) / 32768
+        sumsq = np.einsum("ij,ij->i", blocks, blocks)
+        self.rms.extend(np.sqrt(sumsq / self.per_bin).tolist())
+        self.peak.extend(np.abs(blocks).max(axis=1).tolist())
+
+    def _add(self, block):
+        if len(self.rms) >= self.bins:
+            return    # stream is longer than expected
+        # map() and sum() keep the loop over samples in C
+        sumsq = sum(map(operator.mul, block, block))
+        self.rms.append(math.sqrt(sumsq / len(block)) / 32768)
+        self.peak.append(max(max(block), -min(block)) / 32768)
+
+    def finish(self):
+        """Return RMS and peak envelopes"""
+        if self.pending:
+            self._add(self.pending)
+            self.pending = array("h")
+        missing = [0.0] * (self.bins - len(self.rms))
+        return self.rms + missing, self.peak + missing
+
+
+class WaveformLoader(QObject):
+    """Decode the audio-only stream to low rate mono PCM with ffmpeg
+       and compute its envelopes, cached per video id"""
+    loaded = pyqtSignal(object, object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, video, bins=1024, rate=8000):
+        super().__init__()
+        self.video = video
+        self.bins = bins
+        self.rate = rate
+        self.envelope = None
+        self.resolver = None
+        self.p = None
+
+    def _cache_file(self):
+        path = ut.user_dir("cache")/"waveform"
+        path.mkdir(exist_ok=True)
+        return path/f"{self.video.id}.json"
+
+    def start(self):
+        try:
+            js = json.loads(self._cache_file().read_text(encoding="utf8"))
+            self.loaded.emit(js["rms"], js["peak"])
+            return
+        except (OSError, ValueError, KeyError):
+            pass
+        import gui.analysis as ana     # needed on demand only
+        self.resolver = ytv.StreamUrls(self.video.url, ana.audio_filter)
+        self.resolver.resolved.connect(self.decode)
+        self.resolver.failed.connect(self._fail)
+        self.resolver.request()
+
+    @pyqtSlot(list)
+    def decode(self, urls):
+        self.resolver = None
+        duration = ut.to_seconds(self.video.duration)
+        self.envelope = Envelope(duration, self.bins, self.rate)
+        try:
+            ffmpeg = f"{ut.ffmpeg()}"
+        except RuntimeError as e:   # no ffmpeg found
+            self._fail(f"{e}")
+            return
+        self.p = QProcess()
+        self.p.readyReadStandardOutput.connect(self.read)
+        self.p.finished.connect(self.decoded)
+        self.p.start(ffmpeg,
+                     ["-hide_banner", "-loglevel", "error", "-nostdin",
+                      "-i", urls[-1], "-vn", "-sn",
+                      "-ac", "1", "-ar", f"{self.rate}",
+                      "-f", "s16le", "-"])
+
+    @pyqtSlot()
+    def read(self):
+        self.envelope.feed(bytes(self.p.readAllStandardOutput()))
+
+    @pyqtSlot()
+    def decoded(self):
+        p, self.p = self.p, None
+        self.envelope.feed(bytes(p.readAllStandardOutput()))
+        if p.exitStatus() != QProcess.ExitStatus.NormalExit or \
+           p.exitCode() != 0:
+            self._fail(f"ffmpeg failed\n"
+                       f"{ut.decode(p.readAllStandardError())[-1000:]}")
+            return
+        rms, peak = self.envelope.finish()
+        self.envelope = None
+        try:
+            self._cache_file().write_text(json.dumps({
+                "rms": [round(v, 4) for v in rms],
+                "peak": [round(v, 4) for v in peak],
+            }), encoding="utf8")
+        except OSError as e:
+            ut.logger().warning(f"{e}")
+        self.loaded.emit(rms, peak)
+
+    @pyqtSlot(str)
+    def _fail(self, msg):
+        self.cancel()
+        self.failed.emit(msg)
+
+    def cancel(self):
+        if self.resolver is not None:
+            self.resolver.cancel()
+            self.resolver = None
+        if self.p is not None:
+            self.p.finished.disconnect()
+            self.p.kill()
+            self.p = None
+        self.envelope = None
+
+
+class WaveformView(QWidget):
+    """Loudness overview of the whole video
+
+       Click starts loading when empty, then left click picks start
+       of the cut and right click picks its end."""
+    requested = pyqtSignal()
+    from_picked = pyqtSignal(float)
+    to_picked = pyqtSignal(float)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.duration = 0
+        self.rms = self.peak = None
+        self.loading = False
+        self.setFixedHeight(48)
+        self.setToolTip("Left click: cut from, right click: cut to /\n"
+                        "Левый щелчок: начало, правый щелчок: конец")
+
+    def set_duration(self, duration):
+        self.duration = duration
+        self.update()
+
+    @pyqtSlot(object, object)
+    def set_envelopes(self, rms, peak):
+        self.rms, self.peak = rms, peak
+        self.loading = False
+        self.update()
+
+    def set_loading(self, loading):
+        self.loading = loading
+        self.update()
+
+    def reset(self):
+        self.duration = 0
+        self.rms = self.peak = None
+        self.loading = False
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        palette = self.palette()
+        painter.fillRect(self.rect(), palette.base())
+        if self.peak is None:
+            if self.duration:
+                painter.setPen(palette.placeholderText().color())
+                painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter,
+                                 "Loading waveform... / Загрузка..."
+                                 if self.loading else
+                                 "Click to show waveform"
+                                 " / Щёлкните, чтобы показать звук")
+            return
+        width, middle = self.width(), self.height() / 2
+        step = width / len(self.peak)
+        for values, color in ((self.peak, palette.mid().color()),
+                              (self.rms, palette.highlight().color())):
+            for i, v in enumerate(values):
+                h = max(1.0, float(v) * middle)
+                painter.fillRect(QRectF(i * step, middle - h,
+                                        max(step, 1.0), 2 * h), color)
+
+    def mousePressEvent(self, event):
+        if not self.duration:
+            return
+        if self.peak is None:
+            if not self.loading:
+                self.requested.emit()
+            return
+        t = self.duration * event.position().x() / max(self.width(), 1)
+        t = max(0.0, min(t, float(self.duration)))
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.from_picked.emit(t)
+        elif event.button() == Qt.MouseButton.RightButton:
+            self.to_picked.emit(t)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""Headless worker running jobs claimed from a queue shared by
+   several hosts (see `jobqueue`), outputs go to shared storage
+
+   To try a farm locally start a few workers on one queue file
+
+       python main.py --queue /tmp/queue.db --worker --exit-when-idle &
+       python main.py --queue /tmp/queue.db --worker --exit-when-idle &
+       python main.py --queue /tmp/queue.db --enqueue URL1 URL2 ... \\
+                      --start 10 --end 20 --output /tmp/clips/
+"""
+
+import os
+import socket
+import sqlite3
+
+from PyQt6.QtCore import (pyqtSignal, pyqtSlot, QObject, QTimer)
+
+import gui.apiserver as aps
+import gui.scheduler as sch
+
+import utils as ut
+
+
+class Worker(QObject):
+    """Claim jobs while the scheduler can run more of them
+       and keep their leases until they are finished"""
+    idle = pyqtSignal()
+
+    lease = 60  # s
+    poll_interval = 5000    # ms
+
+    def __init__(self, queue, scheduler, name=None, exit_when_idle=False):
+        super().__init__()
+        self.queue = queue
+        self.scheduler = scheduler
+        self.name = name if name else f"{socket.gethostname()}:{os.getpid()}"
+        self.exit_when_idle = exit_when_idle
+        self.claimed = dict()   # job -> id in the queue
+        self.pollTimer = QTimer()
+        self.pollTimer.timeout.connect(self.poll)
+        self.heartbeatTimer = QTimer()
+        self.heartbeatTimer.timeout.connect(self.heartbeat)
+
+    def start(self):
+        ut.logger().info(f"worker {self.name} started")
+        self.pollTimer.start(self.poll_interval)
+        self.heartbeatTimer.start(self.lease * 1000 // 3)
+        self.poll()
+
+    @pyqtSlot()
+    def poll(self):
+        try:
+            while len(self.claimed) < self.scheduler.jobs_allowed:
+                if (claim := self.queue.claim(self.name, self.lease)) is None:
+                    break
+                self._submit(*claim)
+        except sqlite3.Error as e:
+            ut.logger().warning(f"queue: {e}")     # try on the next poll
+            return
+        if not self.claimed and self.exit_when_idle:
+            self.idle.emit()
+
+    def _submit(self, queue_id, spec):
+        try:
+            job = aps.make_job(spec)
+        except (ValueError, KeyError, TypeError) as e:
+            self.queue.finish(queue_id, self.name, False, f"{e}")
+            return
+        ut.logger().info(f"queued job {queue_id} is job {job.id}")
+        self.claimed[job] = queue_id
+        job.state_changed.connect(lambda: self._state_changed(job))
+        self.scheduler.submit(job)
+
+    def _state_changed(self, job):
+        if not job.is_finished() or job not in self.claimed:
+            return
+        queue_id = self.claimed.pop(job)
+        try:
+            if not self.queue.finish(queue_id, self.name,
+                                     job.state == sch.Job.done, job.error):
+                ut.logger().warning(f"lease of job {queue_id} was lost")
+        except sqlite3.Error as e:
+            ut.logger().warning(f"queue: {e}")
+        QTimer.singleShot(0, self.poll)
+
+    @pyqtSlot()
+    def heartbeat(self):
+        for job, queue_id in list(self.claimed.items()):
+            try:
+                kept = self.queue.heartbeat(queue_id, self.name, self.lease)
+            except sqlite3.Error as e:
+                ut.logger().warning(f"queue: {e}")
+                continue    # the lease is long enough to try again
+            if not kept:
+                # another worker took the job over
+                ut.logger().warning(f"lease of job {queue_id} was lost")
+                del self.claimed[job]
+                job.cancel()
+
+    def stop(self):
+        """Cancel running jobs returning them to the queue"""
+        self.pollTimer.stop()
+        self.heartbeatTimer.stop()
+        claimed, self.claimed = self.claimed, dict()
+        for job, queue_id in claimed.items():
+            job.cancel()
+            try:
+                self.queue.release(queue_id, self.name)
+            except sqlite3.Error as e:
+                ut.logger().warning(f"queue: {e}")
+        ut.logger().info(f"worker {self.name} stopped")
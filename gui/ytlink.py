@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 
-from PyQt6.QtCore import pyqtSignal, pyqtSlot, Qt
+from PyQt6.QtCore import pyqtSignal, pyqtSlot, Qt, QTimer
+from PyQt6.QtGui import QGuiApplication
 from PyQt6.QtWidgets import (
      QWidget, QLabel, QLineEdit,
      QMessageBox, QHBoxLayout, QVBoxLayout)
 
 import gui.common as com
+import gui.prefetch as pft
 import gui.ytvideo as ytv
 
 import utils as ut
@@ -22,6 +24,14 @@ class YoutubeLink(QWidget):
         label.setToolTip("Ссылка")
         self.linkLineEdit = QLineEdit()
         self.linkLineEdit.setPlaceholderText("video link / ссылка на видео")
+        self.linkLineEdit.textEdited.connect(self.link_typed)
+
+        self.prefetcher = pft.Prefetcher()
+        self.prefetchTimer = QTimer()
+        self.prefetchTimer.setSingleShot(True)
+        self.prefetchTimer.setInterval(300)    # wait for typing to stop
+        self.prefetchTimer.timeout.connect(self.prefetch_link)
+        QGuiApplication.clipboard().dataChanged.connect(self.clipboard_changed)
 
         self.goButton = com.GoButton()
         self.goButton.clicked.connect(self.link_edited)
@@ -66,6 +76,27 @@ class YoutubeLink(QWidget):
         self.goButton.setEnabled(True)
         self.goButton.turn_on(True)
 
+    def _prefetch_enabled(self, source):
+        options = ytv.options
+        return options is not None and options.prefetch[source]
+
+    @pyqtSlot(str)
+    def link_typed(self, text):
+        if self._prefetch_enabled("paste") and pft.looks_like_url(text):
+            self.prefetchTimer.start()
+
+    @pyqtSlot()
+    def prefetch_link(self):
+        url = self.linkLineEdit.text().strip()
+        if self.goButton.on and self.video is None:
+            self.prefetcher.prefetch(url)
+
+    @pyqtSlot()
+    def clipboard_changed(self):
+        text = QGuiApplication.clipboard().text()
+        if self._prefetch_enabled("clipboard") and pft.looks_like_url(text):
+            self.prefetcher.prefetch(text)
+
     @pyqtSlot()
     def link_edited(self):
         if not self.goButton.on:
@@ -77,18 +108,38 @@ class YoutubeLink(QWidget):
             self.edit_link.emit()
             return
 
-        url = self.linkLineEdit.text()
-        if not url:
+        text = self.linkLineEdit.text()
+        if not text:
             return
-        elif url.isspace():
+        elif text.isspace():
             self.linkLineEdit.clear()
             return
 
+        url = text.strip()      # as prefetched
+        self.lock()
+        self.prefetcher.cancel_all(keep=url)
+        if (pending := self.prefetcher.take(url)) is not None:
+            # take the result of speculative loading when it is ready
+            QGuiApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+            pending.formats_loaded.connect(lambda: self.take_prefetched(url))
+            pending.info_failed.connect(lambda _: self.take_prefetched(url))
+            return
+        self.request_info(url)
+
+    def take_prefetched(self, url):
+        QGuiApplication.restoreOverrideCursor()
+        self.request_info(url)    # from the metadata cache if loaded
+
+    def request_info(self, url):
         self.video = ytv.YoutubeVideo(url)
         self.video.info_loaded.connect(self.process_info)
         self.video.info_failed.connect(self.process_error)
-        self.video.request_info()
-        self.lock()
+        try:
+            self.video.request_info()
+        except RuntimeError as e:   # no yt-dlp found
+            ut.logger().exception(f"{e}")
+            self.video = None
+            self.process_error(f"{e}")
 
     @pyqtSlot(str)
     def process_error(self, msg):
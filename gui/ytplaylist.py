@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import json
+
+from PyQt6.QtCore import (pyqtSignal, pyqtSlot, QObject, QProcess)
+
+import gui.ytvideo as ytv
+
+import utils as ut
+
+
+class YoutubePlaylist(QObject):
+    """Enumerate playlist or channel entries as yt-dlp prints them"""
+    entry_found = pyqtSignal(dict)
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+        self.count = 0
+        self.p = None
+
+    def request_entries(self):
+        self.p = QProcess()
+        self.p.readyReadStandardOutput.connect(self.parse_entries)
+        self.p.finished.connect(self.finish_entries)
+        opts = ytv.ytdl_cookies()
+        self.p.start(f"{ut.yt_dlp()}",
+                     opts + ["--flat-playlist", "--lazy-playlist",
+                             "--print",
+                             '{ "id": %(id)j'
+                             ', "title": %(title)j'
+                             ', "url": %(url)j'
+                             ', "duration": %(duration)j }',
+                             f"{self.url}"])
+
+    @pyqtSlot()
+    def parse_entries(self):
+        while self.p.canReadLine():
+            line = ut.decode(self.p.readLine()).strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line.replace(' NA,', ' "NA",')
+                                       .replace(' NA }', ' "NA" }'))
+            except json.JSONDecodeError:
+                ut.logger().warning(f"bad playlist entry: {line}")
+                continue
+            if entry["url"] == "NA":
+                entry["url"] = entry["id"]
+            self.count += 1
+            self.entry_found.emit(entry)
+
+    @pyqtSlot(int, QProcess.ExitStatus)
+    def finish_entries(self, code, status):
+        self.parse_entries()
+        err = ut.decode(self.p.readAllStandardError())
+        ok = (status == QProcess.ExitStatus.NormalExit) and (code == 0)
+        if err and ok:
+            ut.logger().warning(err)
+        self.p = None
+        self.finished.emit(ok, "" if ok else err)
+
+    def cancel(self):
+        if self.p is not None:
+            self.p.kill()
@@ -1,13 +1,27 @@
 #!/usr/bin/env python3
 
+from collections import deque
 import json
+import math
 import re
 import pathlib
 import shutil
+import time
 
-from PyQt6.QtCore import (pyqtSignal, pyqtSlot, Qt, QObject, QProcess)
+from pathvalidate import sanitize_filename
+from PyQt6.QtCore import (pyqtSignal, pyqtSlot, Qt, QObject, QProcess,
+                          QTimer)
 from PyQt6.QtGui import QGuiApplication
 
+import gui.livedvr as dvr
+
+import containers as cnt
+import errors as ers
+import history as hst
+import metacache as mch
+import procmon as pmn
+import profiler as prof
+import sinks as snk
 import utils as ut
 
 
@@ -19,55 +33,164 @@ default_channel = "Channel / Канал"
 default_format = "best available format / наилучший доступный формат"
 
 
+# yt-dlp --print templates of video info and of every format
+info_template = ('{ "id": %(id)j'
+                 ', "channel": %(channel)j'
+                 ', "uploader": %(uploader)j'
+                 ', "title": %(title)j'
+                 ', "thumbnail": %(thumbnail)j'
+                 ', "chapters": %(chapters)j'
+                 ', "is_live": %(is_live)j'
+                 ', "duration": %(duration)j }')
+format_template = ('{ "format_id": %(format_id)j'
+                   ', "ext": %(ext)j'
+                   ', "resolution": %(resolution)j'
+                   ', "width": %(width)j'
+                   ', "height": %(height)j'
+                   ', "vbr": %(vbr)j'
+                   ', "vcodec": %(vcodec)j'
+                   ', "acodec": %(acodec)j'
+                   ', "size": %(filesize,filesize_approx)j'
+                   ', "format_note": %(format_note)j'
+                   ', "abr": %(abr)j'
+                   ', "urls": %(urls)j }')
+
+
+size_re = re.compile(r"\s*(\d+(?:\.\d+)?)\s*([KkMmGg])[Bb]\s*")
+
+
+def size_budget(vbr):
+    """Return output size in bytes if `vbr` sets it ("25MB"), else None"""
+    if not vbr or not (m := size_re.fullmatch(vbr)):
+        return None
+    return float(m.group(1)) * 1000**"_kmg".index(m.group(2).lower())
+
+
+def ytdl_cookies():
+    browser = options.browser if options else None
+    return ["--cookies-from-browser", browser] if browser else []
+
+
+def prefer_avc():
+    if options and options.prefer_avc:
+        return ["-S", "quality,vcodec:h264,acodec:mp3"]
+    return []
+
+
+def info_key(url):
+    return ("info", url)
+
+
+def formats_key(url, filter):
+    return ("formats", url, filter, *prefer_avc())
+
+
 class YoutubeVideo(QObject):
     info_loaded = pyqtSignal()
+    formats_loaded = pyqtSignal()
     progress = pyqtSignal(float, str)
+    throughput = pyqtSignal(float)
+    usage = pyqtSignal(dict)
     finished = pyqtSignal(bool, str)
     info_failed = pyqtSignal(str)
 
+    default_filter = "all[vcodec!=none]+ba/all[vcodec!=none][acodec!=none]/b*"
+    max_retries = 5
+    resumable = ("mkv", "webm")     # partial files stay readable
+    usage_interval = 1000   # ms
+    two_pass_codecs = ("h264", "mpeg4")
+    default_abr = 128   # kb/s of encoded audio
+    min_vbr = 100       # kb/s
+    mux_overhead = 0.02
+    passlog_age = 7 * 24 * 3600     # s
+
     def __init__(self, url):
         super().__init__()
         self.url = url
+        self.id = None
         self.title = default_title
         self.channel = default_channel
         self.thumbnail = None
         self.duration = "0"
+        self.chapters = []
+        self.is_live = False
+        self.live = None
         self.formats = None
         self.p = None
         self.progress_re = re.compile(r"\[download\]\s+(\d{1,3}.\d)[%]")
         self.time_re = re.compile(r"time=((\d\d[:]){2}\d\d[.]\d\d)")
-        self.err_re = re.compile(r"[Ee]rror")
+        self.rate_re = re.compile(r" at\s+(\d+(?:\.\d+)?)([KMG]?)i?B/s")
+        self.size_re = re.compile(r"size=\s*(\d+)([kKM]i?B)")
+        self.started_at = None
         self.debug = False
-        self.error = ""
+        self.errors = deque(maxlen=20)
+        self.retries = 0
+        self.retryTimer = QTimer()
+        self.retryTimer.setSingleShot(True)
+        self.retryTimer.timeout.connect(self._run_download)
+        self.sampler = pmn.ProcessSampler()
+        self.usageTimer = QTimer()
+        self.usageTimer.timeout.connect(self._sample_usage)
+        self.finished.connect(self.usageTimer.stop)
+        self.parts = []
+        self.offset = 0
+        self.last_time = 0.0
+        self.first_pass = False
+        self.urlsProcess = None     # refreshing URLs out of a download
+        self.urlsDone = []
+        self.cancelled = False
+        self.refreshed = False
+        self.job = None
+        self.segments = None
+        self.sink = None
+        self.log = ut.logger()
 
     def _ytdl_cookies(self):
-        browser = options.browser if options else None
-        return ["--cookies-from-browser", browser] if browser else []
+        return ytdl_cookies()
 
-    def request_info(self):
+    def _start_info(self):
         self.p = QProcess()
-        self.p.finished.connect(self.process_info)
         opts = self._ytdl_cookies()
         self.p.start(f"{ut.yt_dlp()}",
-                     opts + ["--no-playlist", "--print",
-                             '{ "channel": %(channel)j'
-                             ', "uploader": %(uploader)j'
-                             ', "title": %(title)j'
-                             ', "thumbnail": %(thumbnail)j'
-                             ', "duration": %(duration)j }',
+                     opts + ["--no-playlist", "--print", info_template,
                              f"{self.url}"])
+
+    def _set_info(self, out):
+        js = json.loads(out)
+        mch.cache.put(info_key(self.url), js)
+        self._apply_info(js)
+
+    def _restore_info(self):
+        if (js := mch.cache.get(info_key(self.url))) is None:
+            return False
+        self._apply_info(js)
+        return True
+
+    def _apply_info(self, js):
+        self.id = js["id"]
+        self.channel = js["channel"] if js["channel"] != "NA" \
+            else js["uploader"]
+        self.title = js["title"]
+        self.thumbnail = js["thumbnail"]
+        self.chapters = js["chapters"] if js["chapters"] != "NA" else []
+        self.is_live = js.get("is_live") is True
+        self.duration = ut.to_hhmmss(ut.int_or_none(js["duration"], 0))
+
+    @prof.span("request_info")
+    def request_info(self):
+        if self._restore_info():
+            QTimer.singleShot(0, self.info_loaded.emit)
+            return
+        self._start_info()
+        self.p.finished.connect(self.process_info)
         QGuiApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
 
     @pyqtSlot()
+    @prof.span("process_info")
     def process_info(self):
         QGuiApplication.restoreOverrideCursor()
         try:
-            js = json.loads(ut.check_output(self.p))
-            self.channel = js["channel"] if js["channel"] != "NA" \
-                else js["uploader"]
-            self.title = js["title"]
-            self.thumbnail = js["thumbnail"]
-            self.duration = ut.to_hhmmss(ut.int_or_none(js["duration"], 0))
+            self._set_info(ut.check_output(self.p))
             self.info_loaded.emit()
         except ut.CalledProcessFailed as e:
             ut.logger().exception(f"{e}")
@@ -76,65 +199,258 @@ class YoutubeVideo(QObject):
             self.p = None
 
     def _prefer_avc(self):
-        if options and options.prefer_avc:
-            return ["-S", "quality,vcodec:h264,acodec:mp3"]
-        return []
+        return prefer_avc()
 
-    def request_formats(self, filter="all[vcodec!=none]+ba"
-                                     "/all[vcodec!=none][acodec!=none]/b*"):
-        QGuiApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+    def _start_formats(self, filter):
         self.p = QProcess()
         opts = self._ytdl_cookies()
         opts += self._prefer_avc()
         opts += ["--format", filter] if filter else []
         self.p.start(f"{ut.yt_dlp()}",
                      opts + ["--no-playlist", "--print",
-                             '{ "format_id": %(format_id)j'
-                             ', "ext": %(ext)j'
-                             ', "resolution": %(resolution)j'
-                             ', "width": %(width)j'
-                             ', "height": %(height)j'
-                             ', "vbr": %(vbr)j'
-                             ', "vcodec": %(vcodec)j'
-                             ', "acodec": %(acodec)j'
-                             ', "size": %(filesize,filesize_approx)j'
-                             ', "format_note": %(format_note)j'
-                             ', "urls": %(urls)j }, ',
-                             f"{self.url}"])
+                             f"{format_template}, ", f"{self.url}"])
+
+    def _formats_key(self, filter):
+        return formats_key(self.url, filter)
+
+    def _set_formats(self, out, filter):
+        if result := out.rstrip(",\n\r \t"):
+            formats = json.loads(f'{{ "formats": [{result}] }}')["formats"]
+            mch.cache.put(self._formats_key(filter), formats)
+            self._apply_formats(formats)
+        else:
+            raise ut.CalledProcessFailed(self.p)
+
+    def _restore_formats(self, filter):
+        if (formats := mch.cache.get(self._formats_key(filter))) is None:
+            return False
+        self._apply_formats(formats)
+        return True
+
+    def _apply_formats(self, formats):
+        self.formats = dict()
+        for i, fmt in zip(range(len(formats)), formats):
+            desc = ut.make_description(fmt)
+            self.formats.update({f"{i+1:02d}. {desc}": fmt})
+
+    @prof.span("request_formats")
+    def request_formats(self, filter=default_filter):
+        if self._restore_formats(filter):
+            return
+        QGuiApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        self._start_formats(filter)
         if self.p.waitForFinished():
             QGuiApplication.restoreOverrideCursor()
-            if result := ut.check_output(self.p).rstrip(",\n\r \t"):
-                formats = json.loads(f'{{ "formats": [{result}] }}')["formats"]
-                self.formats = dict()
-                for i, fmt in zip(range(len(formats)), formats):
-                    desc = ut.make_description(fmt)
-                    self.formats.update({f"{i+1:02d}. {desc}": fmt})
-                return
-            else:
-                raise ut.CalledProcessFailed(self.p)
+            self._set_formats(ut.check_output(self.p), filter)
+            return
         QGuiApplication.restoreOverrideCursor()
         raise ut.TimeoutExpired(self.p)
 
+    def load(self, filter=default_filter):
+        """Request info and then formats in background
+           emitting `formats_loaded` or `info_failed` at the end"""
+        if self._restore_info():
+            QTimer.singleShot(0, self.info_loaded.emit)
+            self._load_formats(filter)
+            return
+        self._start_info()
+        self.p.finished.connect(lambda: self._info_for_load(filter))
+
+    def _info_for_load(self, filter):
+        try:
+            self._set_info(ut.check_output(self.p))
+            self.info_loaded.emit()
+            self._load_formats(filter)
+        except (ut.CalledProcessFailed, ValueError, RuntimeError) as e:
+            # also raised if no yt-dlp found or its output is broken
+            ut.logger().exception(f"{e}")
+            self.p = None
+            self.info_failed.emit(f"{e}")
+
+    def _load_formats(self, filter):
+        if self._restore_formats(filter):
+            self.p = None
+            QTimer.singleShot(0, self.formats_loaded.emit)
+            return
+        self._start_formats(filter)
+        self.p.finished.connect(lambda: self._formats_for_load(filter))
+
+    def _formats_for_load(self, filter):
+        try:
+            self._set_formats(ut.check_output(self.p), filter)
+            self.formats_loaded.emit()
+        except (ut.CalledProcessFailed, ValueError, RuntimeError) as e:
+            ut.logger().exception(f"{e}")
+            self.info_failed.emit(f"{e}")
+        finally:
+            self.p = None
+
+    def cancel_load(self):
+        if self.p is not None:
+            self.p.finished.disconnect()
+            self.p.kill()
+            self.p = None
+
     def get_formats(self):
         return list(self.formats.keys())
 
-    def get_suffix(self, start, finish, format):
-        res = ut.format_resolution(self.formats[format])
+    def get_suffix(self, start, finish, format, height=None):
+        res = self._output_resolution(format) if not height \
+            else self._rendition_resolution(format, height)
+        if self.is_live:
+            return f"_{res}_live_{time.strftime('%Y%m%d-%H%M%S')}"
         if self._is_full_video(start, finish):
             return f"_{res}"
         tm_code = ut.as_suffix(start, finish)
         return f"_{res}_{tm_code}"
 
+    def _sanitize(self, name):
+        name = sanitize_filename(name)
+        max_name_len = 64
+        if len(name) > max_name_len:
+            name = name[: max_name_len]
+        return name
+
+    def get_filename(self, start, finish, format):
+        name = self._sanitize(self.title)
+        suffix = self.get_suffix(start, finish, format)
+        return f"{name}{suffix}.{self.get_extension(format)}"
+
+    def get_chapter_filename(self, index, format):
+        title = self.chapters[index].get("title") or "chapter"
+        name = self._sanitize(f"{index+1:02d} {title}")
+        return f"{name}.{self.get_extension(format)}"
+
+    def _codecs(self, format):
+        codecs = options.codecs if options else {"video": "copy",
+                                                 "audio": "copy"}
+        if codecs["video"] == "copy" and \
+           (self.get_renditions(format) or self._geometry()):
+            codecs = dict(codecs, video="h264")   # scaling needs encoding
+        return codecs
+
+    def _geometry(self):
+        """Return options changing size or frame rate of the video"""
+        geometry = options.geometry if options else {}
+        return {key: val for key, val in geometry.items() if val}
+
+    def _source_size(self, format):
+        """Return width and height of the (cropped) source video"""
+        fmt = self.formats[format]
+        width, height = (ut.int_or_none(fmt["width"]),
+                         ut.int_or_none(fmt["height"]))
+        if crop := self._geometry().get("crop"):
+            w, h = (int(v) for v in crop.split(":")[:2])
+            width, height = min(w, width or w), min(h, height or h)
+        return width, height
+
+    def output_height(self, format):
+        """Return height of the output video, None if unknown"""
+        _, height = self._source_size(format)
+        if max_height := self._geometry().get("height"):
+            return min(max_height, height or max_height)
+        return height
+
+    def _output_resolution(self, format):
+        geometry = self._geometry()
+        if ("crop" in geometry or "height" in geometry) and \
+           (height := self.output_height(format)):
+            return self._rendition_resolution(format, height)
+        return ut.format_resolution(self.formats[format])
+
+    def get_renditions(self, format):
+        """Return heights of renditions not exceeding the output height"""
+        heights = options.renditions if options else []
+        source = self.output_height(format)
+        return [h for h in heights if source is None or h <= source]
+
+    def _rendition_resolution(self, format, height):
+        width, source = self._source_size(format)
+        if not width or not source:
+            return f"{height}p"
+        width = round(width * height / source / 2) * 2
+        return f"{width}x{height}"
+
+    def get_rendition_files(self, filename, format):
+        """Return output file names for renditions replacing resolution
+           in the `filename` made with `get_suffix()`"""
+        file = pathlib.Path(filename)
+        res = self._output_resolution(format)
+        files = []
+        for height in self.get_renditions(format):
+            rres = self._rendition_resolution(format, height)
+            stem = file.stem.replace(f"_{res}", f"_{rres}", 1) \
+                if f"_{res}" in file.stem else f"{file.stem}_{rres}"
+            files.append(f"{file.with_stem(stem)}")
+        return files
+
+    def get_container(self, format):
+        """Return output container and codecs to use with `format`"""
+        codecs = self._codecs(format)
+        container = options.container if options else cnt.containers[0]
+        fmt = self.formats[format]
+        return cnt.choose(fmt["vcodec"], fmt["acodec"], codecs, container)
+
     def get_extension(self, format):
-        return ut.str_or_none(self.formats[format]["ext"], "mp4")
+        ext, _ = self.get_container(format)
+        return ext
+
+    def get_settings(self, format):
+        """Return options affecting the content of an output file"""
+        ext, codecs = self.get_container(format)
+        settings = {
+            "container": ext,
+            "codecs": codecs,
+            "vbr": self._ffmpeg_set_vbr(format),
+        }
+        if budget := size_budget(options.vbr if options else None):
+            settings["size"] = budget
+        if geometry := self._geometry():
+            settings["geometry"] = geometry
+        return settings
 
-    def _ffmpeg_use_gpu(self):
-        codecs = options.codecs
+    def get_key(self, start, finish, format):
+        """Return key of the output file in jobs history,
+           None if there are several output files"""
+        if self.get_renditions(format) or self.is_live:
+            return None
+        return hst.job_key(self.id, start, finish,
+                           self.formats[format]["format_id"],
+                           self.get_settings(format))
+
+    def record_to(self, history, filename, start, finish, format, started):
+        """Add completed download to jobs `history`"""
+        if snk.is_sink(filename):
+            return
+        if (key := self.get_key(start, finish, format)) is None:
+            return
+        history.record_async(key,
+                             self.id, self.url, start, finish,
+                             self.formats[format]["format_id"],
+                             self.get_settings(format),
+                             filename, started, time.time())
+
+    def _need_conversion(self, format):
+        """Check if the container requires to convert some stream"""
+        _, codecs = self.get_container(format)
+        return codecs != self._codecs(format)
+
+    def _ffmpeg_use_gpu(self, format):
+        _, codecs = self.get_container(format)
         if not codecs or not codecs["video"].endswith("_nvenc"):
             return []
-        return ["-vsync", "0",
-                "-hwaccel", "cuda",
-                "-hwaccel_output_format", "cuda"]
+        opts = ["-vsync", "0",
+                "-hwaccel", "cuda"]
+        if self._gpu_frames(format):
+            opts += ["-hwaccel_output_format", "cuda"]
+        return opts
+
+    def _gpu_frames(self, format):
+        """Check if decoded frames stay in GPU memory for the encoder,
+           crop works on frames in RAM only"""
+        _, codecs = self.get_container(format)
+        return bool(codecs) and codecs["video"].endswith("_nvenc") and \
+            "crop" not in self._geometry()
 
     def _ffmpeg_source(self, start, end, format):
         time = []
@@ -142,7 +458,7 @@ class YoutubeVideo(QObject):
             time += ["-ss", f"{start}"]
         if end != self.duration:         # fix video trimming at the end
             time += ["-to", f"{end}"]
-        urls = self.formats[format]["urls"].split()
+        urls = self._media_urls(format)
         if len(urls) == 2:
             video, audio = urls
             return time + ["-i", f"{video}"] + \
@@ -152,23 +468,209 @@ class YoutubeVideo(QObject):
             return time + ["-i", f"{video}"]
         raise RuntimeError(f"download URLs: {urls}")
 
-    def _ffmpeg_codecs(self):
-        codecs = options.codecs if options else None
+    def _media_urls(self, format):
+        """Return media URLs of the `format` read through the local
+           range cache if enabled"""
+        urls = self.formats[format]["urls"].split()
+        format_ids = f"{self.formats[format]['format_id']}".split("+")
+        if not (options and options.range_cache) or \
+           len(format_ids) != len(urls):
+            return urls
+        import rangecache as rch    # pulls in http.server, often unused
+        return [rch.proxy_url(f"{self.id}/{format_id}", url)
+                if url.startswith("http") and ".m3u8" not in url else url
+                for url, format_id in zip(urls, format_ids)]
+
+    def _ffmpeg_codecs(self, format):
+        _, codecs = self.get_container(format)
         return ["-c:v", codecs["video"],
-                "-c:a", codecs["audio"]] if codecs else []
+                "-c:a", codecs["audio"]]
 
     def _ffmpeg_set_vbr(self, format):
         vbr = options.vbr if options else None
         if vbr == "original":
             val = ut.float_or_none(self.formats[format]["vbr"])
             vbr = f"{val}k" if val else None
-        elif vbr == "auto":
+        elif vbr == "auto" or size_budget(vbr) is not None:
             vbr = None
         return ["-b:v", f"{vbr}"] if vbr else []
 
+    def _budget_vbr(self, format):
+        """Return video bitrate (kb/s) fitting the interval into the size
+           budget with the audio, None if there is no budget"""
+        budget = size_budget(options.vbr if options else None)
+        if budget is None:
+            return None
+        _, start, end, *_ = self.job
+        seconds = max(ut.to_seconds(end) - ut.to_seconds(start), 1)
+        fmt = self.formats[format]
+        _, codecs = self.get_container(format)
+        if fmt["acodec"] == "none":
+            abr = 0
+        elif codecs["audio"] == "copy":
+            abr = ut.float_or_none(fmt.get("abr")) or self.default_abr
+        else:
+            abr = self.default_abr
+        kbps = budget * 8 / 1000 / seconds * (1 - self.mux_overhead) - abr
+        if kbps < self.min_vbr:
+            self.log.warning(f"{budget:.0f} bytes are too few for"
+                             f" {seconds} s, use {self.min_vbr} kb/s")
+        return int(max(kbps, self.min_vbr))
+
+    def _ffmpeg_budget(self, format):
+        """Constrain the rate so that no part of the output overshoots"""
+        if (kbps := self._budget_vbr(format)) is None:
+            return []
+        _, codecs = self.get_container(format)
+        opts = ["-rc", "vbr"] if codecs["video"].endswith("_nvenc") else []
+        return opts + ["-b:v", f"{kbps}k",
+                       "-maxrate", f"{kbps}k",
+                       "-bufsize", f"{2 * kbps}k"]
+
+    def _two_pass(self, format):
+        """Check if the size budget is met by two-pass encoding,
+           possible for a single output file only"""
+        _, codecs = self.get_container(format)
+        return size_budget(options.vbr if options else None) is not None \
+            and codecs["video"] in self.two_pass_codecs and \
+            self.segments is None and self.sink is None and \
+            not self.get_renditions(format)
+
+    def _passlog(self, format):
+        """Return prefix of the first pass log, the same for any size
+           of the interval output so that the log is reused"""
+        _, start, end, *_ = self.job
+        settings = self.get_settings(format)
+        settings.pop("size", None)
+        key = hst.job_key(self.id, start, end,
+                          self.formats[format]["format_id"], settings)
+        return ut.user_dir("cache")/"passlog"/key[:32]
+
+    def _passlog_done(self, format):
+        passlog = self._passlog(format)
+        return passlog.with_suffix(".done").exists() and \
+            passlog.with_name(f"{passlog.name}-0.log").exists()
+
+    def _prune_passlogs(self):
+        """Remove logs of first passes made long ago"""
+        directory = ut.user_dir("cache")/"passlog"
+        if not directory.is_dir():
+            return
+        for file in directory.iterdir():
+            try:
+                if time.time() - file.stat().st_mtime > self.passlog_age:
+                    file.unlink()
+            except OSError as e:
+                ut.logger().warning(f"{e}")
+
+    def _ffmpeg_pass(self, format):
+        passlog = self._passlog(format)
+        passlog.parent.mkdir(exist_ok=True)
+        opts = ["-pass", "1" if self.first_pass else "2",
+                "-passlogfile", f"{passlog}"]
+        # the first pass needs no audio and no output file
+        return opts + (["-an", "-f", "null", "-"] if self.first_pass
+                       else [])
+
+    def _ffmpeg_scaled_vbr(self, format, height):
+        """Return bitrate options of the output at `height`,
+           original bitrate is scaled to the picture area"""
+        if budget := self._ffmpeg_budget(format):
+            return budget
+        vbr = self._ffmpeg_set_vbr(format)
+        fmt = self.formats[format]
+        width, source = (ut.int_or_none(fmt["width"]),
+                         ut.int_or_none(fmt["height"]))
+        cropped_width, cropped = self._source_size(format)
+        if not (vbr and options.vbr == "original" and source and height):
+            return vbr
+        area = cropped / source * min(height / cropped, 1)**2
+        if width and cropped_width:
+            area *= cropped_width / width
+        if area < 1:
+            kbps = float(vbr[1][:-1]) * area
+            return ["-b:v", f"{int(kbps)}k"]
+        return vbr
+
+    def _ffmpeg_geometry(self, format, scale=True):
+        """Return video filters dropping frames, cropping and scaling,
+           cheapest first so that the costlier get less to process"""
+        geometry = self._geometry()
+        filters = []
+        if fps := geometry.get("fps"):
+            filters.append(f"fps={fps:g}")
+        if crop := geometry.get("crop"):
+            # keep the area within the frame of any size
+            w, h, *xy = crop.split(":")
+            crop = f"'min({w},iw)':'min({h},ih)'"
+            if xy:
+                crop += f":'min({xy[0]},iw-ow)':'min({xy[1]},ih-oh)'"
+            filters.append(f"crop={crop}")
+        max_height = geometry.get("height")
+        _, source = self._source_size(format)
+        if scale and max_height and (source is None or max_height < source):
+            scaler = "scale_cuda" if self._gpu_frames(format) else "scale"
+            filters.append(f"{scaler}=-2:'min({max_height},ih)'")
+        return filters
+
+    def _ffmpeg_filters(self, format):
+        filters = self._ffmpeg_geometry(format)
+        return ["-vf", ",".join(filters)] if filters else []
+
+    def _ffmpeg_renditions(self, filename, format):
+        """Decode source once and fan it out to scaled encoder outputs"""
+        heights = self.get_renditions(format)
+        files = self.get_rendition_files(filename, format)
+        scale = "scale_cuda" if self._gpu_frames(format) else "scale"
+        n = len(heights)
+        # renditions are scaled from the cropped source at once
+        chain = "".join(f"{f}," for f in self._ffmpeg_geometry(format,
+                                                              scale=False))
+        graph = f"[0:v]{chain}split={n}" + \
+            "".join(f"[s{i}]" for i in range(n))
+        for i, height in enumerate(heights):
+            graph += f";[s{i}]{scale}=-2:{height}[v{i}]"
+        audio = "1:a" if len(self.formats[format]["urls"].split()) == 2 \
+            else "0:a?"
+        opts = ["-filter_complex", graph]
+        for i, (height, file) in enumerate(zip(heights, files)):
+            opts += ["-map", f"[v{i}]", "-map", audio]
+            opts += self._ffmpeg_codecs(format)
+            opts += self._ffmpeg_scaled_vbr(format, height)
+            opts += ["-y", f"{file}"]
+        return opts
+
+    def _ffmpeg_segments(self, format):
+        """Split output at chapter boundaries with the segment muxer"""
+        times = ",".join(f"{t:.3f}" for t, _ in self.segments[1:])
+        if not times:
+            return ["-f", "segment", "-segment_time", "86400"]
+        _, codecs = self.get_container(format)
+        opts = ["-force_key_frames", times] \
+            if codecs["video"] != "copy" else []
+        return opts + ["-f", "segment",
+                       "-segment_times", times,
+                       "-reset_timestamps", "1"]
+
+    def _place_segments(self, pattern):
+        """Move segments of selected chapters to their files"""
+        files = [pathlib.Path(pattern.replace("%03d", f"{n:03d}"))
+                 for n in range(len(self.segments) + 1)]
+        if not files[-2].exists() or files[-1].exists():
+            # copied streams are split at key frames only
+            raise OSError(f"{pattern}: chapters shorter than key frame"
+                          " interval, enable encoding to split them /"
+                          " главы короче интервала ключевых кадров,"
+                          " включите перекодирование")
+        for file, (_, target) in zip(files, self.segments):
+            if target is None:
+                file.unlink()
+            else:
+                file.replace(target)
+
     def _ffmpeg_debug(self):
-        debug = options.debug if options else None
-        return ["-report"] if debug["ffmpeg"] else []
+        debug = options.debug if options else {}
+        return ["-report"] if debug.get("ffmpeg") else []
 
     def _ffmpeg_xerror(self):
         xerr = options.xerror if options else None
@@ -179,12 +681,26 @@ class YoutubeVideo(QObject):
 
     def _by_ffmpeg(self, filename, start, end, format):
         opts = []
-        opts += self._ffmpeg_use_gpu()
+        opts += self._ffmpeg_use_gpu(format)
         opts += self._ffmpeg_source(start, end, format)
-        opts += self._ffmpeg_codecs()
-        opts += self._ffmpeg_set_vbr(format)
         opts += self._ffmpeg_debug()
         opts += self._ffmpeg_xerror()
+        if self.get_renditions(format) and self.segments is None and \
+           self.sink is None:
+            opts += self._ffmpeg_renditions(filename, format)
+            return f"{ut.ffmpeg()}", opts
+        opts += self._ffmpeg_filters(format)
+        opts += self._ffmpeg_codecs(format)
+        opts += self._ffmpeg_scaled_vbr(format, self.output_height(format))
+        if self._two_pass(format):
+            opts += self._ffmpeg_pass(format)
+            if self.first_pass:
+                return f"{ut.ffmpeg()}", opts
+        if self.segments is not None:
+            opts += self._ffmpeg_segments(format)
+            return f"{ut.ffmpeg()}", opts + ["-y", f"{filename}"]
+        if self.sink is not None:
+            return f"{ut.ffmpeg()}", opts + self.sink.ffmpeg_args()
         return f"{ut.ffmpeg()}", opts + ["-y", f"{filename}"]
 
     def _by_yt_dlp(self, filename, start, end, format):
@@ -197,48 +713,382 @@ class YoutubeVideo(QObject):
                      "--embed-thumbnail"]
         except RuntimeError:
             pass
+        # resume own partial download when retrying
         opts += ["--no-playlist",
-                 "--force-overwrites",
+                 "--continue" if self.retries else "--force-overwrites",
                  "--format", self.formats[format]["format_id"],
-                 "--remux-video", "mp4",
+                 "--remux-video", self.get_extension(format),
                  "--paths", f"{path}",
                  "--output", f"{filename}.%(ext)s"]
         return f"{ut.yt_dlp()}", opts + [f"{self.url}"]
 
-    def start_download(self, filename, start, end, format):
+    @prof.span("start_download")
+    def start_download(self, filename, start, end, format, segments=None):
+        """Cut the interval to `filename` or stream it to the sink
+           given instead of the file name (see `sinks` module)"""
+        self.sink = snk.parse(filename) if segments is None else None
+        if self.sink is not None:
+            try:
+                self.sink.prepare()
+            except OSError as e:
+                ut.logger().exception(f"{e}")
+                err = f"{e}"
+                QTimer.singleShot(0, lambda: self.finished.emit(False, err))
+                return
+        by_yt_dlp = self._is_full_video(start, end) and \
+            not self._need_conversion(format) and \
+            not self.get_renditions(format) and not self._geometry() and \
+            segments is None and \
+            self.sink is None
+        self.job = (filename, start, end, format, by_yt_dlp)
+        self.segments = segments
+        self.cancelled = False
+        self.refreshed = False
+        self.errors.clear()
+        self.retries = 0
+        self.parts = []
+        self.offset = 0
+        self.last_time = 0.0
+        self.sampler = pmn.ProcessSampler()
+        # the first pass is kept for other attempts on the interval
+        self.first_pass = not by_yt_dlp and self._two_pass(format) and \
+            not self._passlog_done(format)
+        if self.first_pass:
+            self._prune_passlogs()
+        if not by_yt_dlp and self.urls_expire_soon(format):
+            self.refresh_urls(format)
+            return
+        self._run_download()
+
+    def start_chapters_download(self, directory, indices, format):
+        """Cut chapters with `indices` to separate files in `directory`
+           reading the source once, return names of the files"""
+        chapters = [self.chapters[i] for i in sorted(indices)]
+        first = chapters[0]["start_time"]
+        last = min(chapters[-1]["end_time"], ut.to_seconds(self.duration))
+        start, end = int(first), min(math.ceil(last),
+                                     ut.to_seconds(self.duration))
+        bounds = sorted({t for c in chapters
+                         for t in (c["start_time"], c["end_time"])
+                         if first < t < last})
+        directory = pathlib.Path(directory)
+        targets = {c["start_time"]:
+                   f"{directory/self.get_chapter_filename(i, format)}"
+                   for i, c in zip(sorted(indices), chapters)}
+        segments = [(t - start, targets.get(t)) for t in [first] + bounds]
+        pattern = directory/f".{self.id}-%03d.{self.get_extension(format)}"
+        self.start_download(f"{pattern}", ut.to_hhmmss(start),
+                            ut.to_hhmmss(end), format, segments)
+        return [file for _, file in segments if file is not None]
+
+    def start_live_download(self, filename, last, format, follow=True):
+        """Record the last `last` seconds of the live stream and
+           follow it if `follow` until `cancel_download()` is called"""
+        self.cancelled = False
+        self.live = dvr.LiveRecorder(self.formats[format]["urls"].split(),
+                                     filename, last, follow)
+        self.live.progress.connect(self.progress)
+        self.live.finished.connect(self._live_finished)
+        self.live.start()
+
+    @pyqtSlot(bool, str)
+    def _live_finished(self, ok, err):
+        self.live = None
+        self.finished.emit(ok, err)
+
+    def _run_download(self):
+        filename, start, end, format, by_yt_dlp = self.job
+        if self.segments is not None:
+            self._remove_segments()     # of a failed attempt
+        if self.offset:     # resume after the part kept on failure
+            start = ut.to_hhmmss(ut.to_seconds(start) + self.offset)
         cmd, opts = self._by_yt_dlp(filename, start, end, format) \
-                    if self._is_full_video(start, end) else \
-                    self._by_ffmpeg(filename, start, end, format)
-        ut.logger().debug(f"{cmd} {opts}")
+            if by_yt_dlp else \
+            self._by_ffmpeg(filename, start, end, format)
+        self.log.debug(f"{cmd} {opts}")
+        self.started_at = time.monotonic()
         self.p = QProcess()
         mode = QProcess.ProcessChannelMode
-        self.p.setProcessChannelMode(mode.MergedChannels)
-        self.p.readyRead.connect(self.parse_progress)
+        if self.sink is not None and self.sink.kind == "stdout":
+            # media goes to our stdout, progress is read from stderr
+            self.p.setProcessChannelMode(mode.ForwardedOutputChannel)
+            self.p.setReadChannel(QProcess.ProcessChannel.StandardError)
+            self.p.readyReadStandardError.connect(self.parse_progress)
+        else:
+            self.p.setProcessChannelMode(mode.MergedChannels)
+            self.p.readyRead.connect(self.parse_progress)
         self.p.finished.connect(self.finish_download)
         self.p.start(cmd, opts)
+        if pmn.available and not self.usageTimer.isActive():
+            self.usageTimer.start(self.usage_interval)
+
+    @pyqtSlot()
+    def _sample_usage(self):
+        """Emit CPU, memory and I/O usage of the running tool"""
+        if self.p is None or \
+           self.p.state() != QProcess.ProcessState.Running:
+            return
+        if usage := self.sampler.sample(self.p.processId()):
+            self.usage.emit(usage)
+
+    def urls_expire_soon(self, format, margin=5*60):
+        expire = ut.urls_expire(self.formats[format]["urls"].split())
+        return expire is not None and expire - time.time() < margin
+
+    def refresh_urls(self, format, done=None):
+        """Re-resolve expired media URLs of the `format` only and go on
+           with the download, or call `done(ok, err)` if it is given"""
+        if done is not None:
+            self.urlsDone.append(done)
+            if self.urlsProcess is not None:
+                return  # being refreshed already
+        self.log.info(f"refresh URLs of format {format}")
+        p = QProcess()
+        if done is None:
+            self.refreshed = True
+            self.p = p
+            p.finished.connect(self.process_urls)
+        else:
+            self.urlsProcess = p
+            p.finished.connect(lambda: self._urls_refreshed(format))
+        opts = self._ytdl_cookies()
+        try:
+            p.start(f"{ut.yt_dlp()}",
+                    opts + ["--no-playlist",
+                            "--format", self.formats[format]["format_id"],
+                            "--print", "%(urls)j",
+                            f"{self.url}"])
+        except RuntimeError as e:   # no yt-dlp found
+            if done is None:
+                raise
+            self.urlsProcess = None
+            self._urls_done(False, f"{e}")
+
+    def _urls_refreshed(self, format):
+        p, self.urlsProcess = self.urlsProcess, None
+        try:
+            self.formats[format]["urls"] = json.loads(ut.check_output(p))
+        except (ut.CalledProcessFailed, json.JSONDecodeError) as e:
+            ut.logger().exception(f"{e}")
+            self._urls_done(False, f"{e}")
+            return
+        self._urls_done(True, "")
+
+    def _urls_done(self, ok, err):
+        callbacks, self.urlsDone = self.urlsDone, []
+        for done in callbacks:
+            done(ok, err)
 
     @pyqtSlot()
+    def process_urls(self):
+        *_, format, _ = self.job
+        try:
+            if self.cancelled:
+                raise ut.CalledProcessFailed(self.p, "")
+            self.formats[format]["urls"] = json.loads(ut.check_output(self.p))
+        except (ut.CalledProcessFailed, json.JSONDecodeError) as e:
+            ut.logger().exception(f"{e}")
+            self.p = None
+            self._remove_parts()
+            self.finished.emit(False, "" if self.cancelled else f"{e}")
+            return
+        self._run_download()
+
+    @pyqtSlot()
+    @prof.span("parse_progress")
     def parse_progress(self):
         result = ut.decode(self.p.readAll())
-        ut.logger().debug(result)
+        self.log.debug(result, extra={"sample": "progress"})
+        self._parse_throughput(result)
         if m := re.search(self.progress_re, result):
             val = float(m.group(1))
             self.progress.emit(val, "%")
         elif m := re.search(self.time_re, result):
-            time = m.group(1)
-            self.progress.emit(ut.from_ffmpeg_time(time), "s")
-        elif m := re.search(self.err_re, result):
-            self.error = result
+            self.last_time = ut.from_ffmpeg_time(m.group(1))
+            self.progress.emit(self.offset + self.last_time, "s")
+        if lines := ers.error_lines(result):
+            self.errors.extend(lines)
+
+    def _parse_throughput(self, result):
+        """Emit download rate in bytes per second"""
+        units = {"": 1, "K": 1024, "k": 1024, "M": 1024**2, "G": 1024**3}
+        if m := re.search(self.rate_re, result):
+            self.throughput.emit(float(m.group(1)) * units[m.group(2)])
+        elif m := re.search(self.size_re, result):
+            elapsed = time.monotonic() - self.started_at
+            if elapsed > 0:
+                size = int(m.group(1)) * units[m.group(2)[0]]
+                self.throughput.emit(size / elapsed)
 
     def cancel_download(self):
-        if self.p.state() == QProcess.ProcessState.NotRunning:
+        if self.live is not None:
+            self.live.stop()    # keep what is recorded so far
+            return
+        self.cancelled = True
+        if self.retryTimer.isActive():
+            self.retryTimer.stop()
+            self._remove_parts()
+            self.finished.emit(False, "")
+        elif self.p is None:
+            pass    # URLs are being refreshed or parts are being joined
+        elif self.p.state() == QProcess.ProcessState.NotRunning:
             self.finish_download(self.p.exitCode(), self.p.exitStatus())
         else:
             self.p.kill()
 
     @pyqtSlot(int, QProcess.ExitStatus)
+    @prof.span("finish_download")
     def finish_download(self, code, status):
         self.p = None
         ok = (status == QProcess.ExitStatus.NormalExit) and (code == 0)
-        err, self.error = self.error, ""
+        err = "\n".join(self.errors)
+        self.errors.clear()
+        category = None if ok or self.cancelled else \
+            ers.classify(err) or ers.fatal
+        if ok and self.first_pass and not self.cancelled:
+            *_, format, _ = self.job
+            self._passlog(format).with_suffix(".done").touch()
+            self.first_pass = False
+            self.log.info("first pass done")
+            self._run_download()
+            return
+        if category == ers.expired and not self.refreshed:
+            *_, format, _ = self.job
+            self.refresh_urls(format)   # and try again once
+            return
+        if category == ers.transient and self.sink is None and \
+           self.retries < self.max_retries:
+            self._retry(err)
+            return
+        if self.cancelled or not ok:
+            self._remove_parts()
+        elif self.parts:
+            self._join_parts()
+            return
+        if self.cancelled:
+            err = ""
+        elif category is not None:
+            err = f"[{category}] {err}"
+        if ok and self.segments is not None:
+            try:
+                self._place_segments(self.job[0])
+            except OSError as e:
+                ok, err = False, f"{e}"
+                self._remove_segments()
+        self.finished.emit(ok, err)
+
+    def _resumable(self):
+        filename, *_, format, by_yt_dlp = self.job
+        return not by_yt_dlp and self.sink is None and \
+            self.segments is None and not self.get_renditions(format) and \
+            not self._two_pass(format) and \
+            self.get_extension(format) in self.resumable
+
+    def _retry(self, err):
+        """Run the download again later keeping its completed part"""
+        filename = pathlib.Path(self.job[0])
+        if self._resumable() and int(self.last_time) > 0 and \
+           filename.exists():
+            part = filename.with_name(f"{filename.name}"
+                                      f".part{len(self.parts)}")
+            filename.replace(part)
+            self.parts.append(part)
+            self.offset += int(self.last_time)
+        self.last_time = 0.0
+        delay = ers.backoff(self.retries)
+        self.retries += 1
+        self.log.warning(f"retry {self.retries} in {delay:.1f} s"
+                         f" from {self.offset} s: {err}")
+        self.retryTimer.start(int(delay * 1000))
+
+    def _join_parts(self):
+        """Concatenate parts kept on retries with the last one"""
+        filename = pathlib.Path(self.job[0])
+        last = filename.with_name(f"{filename.name}.part{len(self.parts)}")
+        filename.replace(last)
+        self.parts.append(last)
+        listing = filename.with_name(f"{filename.name}.parts")
+        listing.write_text("".join(
+            f"file '{part.resolve().as_posix()}'\n" for part in self.parts),
+            encoding="utf8")
+        self.parts.append(listing)
+        self.p = QProcess()
+        self.p.finished.connect(self._parts_joined)
+        self.p.start(f"{ut.ffmpeg()}",
+                     ["-hide_banner", "-loglevel", "error", "-nostdin",
+                      "-f", "concat", "-safe", "0", "-i", f"{listing}",
+                      "-c", "copy", "-y", f"{filename}"])
+
+    @pyqtSlot(int, QProcess.ExitStatus)
+    def _parts_joined(self, code, status):
+        p, self.p = self.p, None
+        ok = (status == QProcess.ExitStatus.NormalExit) and (code == 0)
+        err = "" if ok else ut.decode(p.readAllStandardError())
+        self._remove_parts()
         self.finished.emit(ok, err)
+
+    def _remove_parts(self):
+        """Remove files of the unfinished download"""
+        if self.segments is not None:
+            self._remove_segments()
+        for part in self.parts:
+            try:
+                part.unlink(missing_ok=True)
+            except OSError as e:
+                ut.logger().warning(f"{e}")
+        self.parts = []
+
+    def _remove_segments(self):
+        """Remove segments written by the segment muxer so far"""
+        pattern = pathlib.Path(self.job[0])
+        for file in pattern.parent.glob(
+                pattern.name.replace("%03d", "[0-9][0-9][0-9]")):
+            try:
+                file.unlink(missing_ok=True)
+            except OSError as e:
+                ut.logger().warning(f"{e}")
+
+
+class StreamUrls(QObject):
+    """Resolve media URLs of the format chosen by `filter`"""
+    resolved = pyqtSignal(list)
+    failed = pyqtSignal(str)
+
+    def __init__(self, url, filter):
+        super().__init__()
+        self.url = url
+        self.filter = filter
+        self.p = None
+
+    def _key(self):
+        return ("urls", self.url, self.filter)
+
+    def request(self):
+        if (urls := mch.cache.get(self._key())) is not None:
+            QTimer.singleShot(0, lambda: self.resolved.emit(urls))
+            return
+        self.p = QProcess()
+        self.p.finished.connect(self.process_urls)
+        self.p.start(f"{ut.yt_dlp()}",
+                     ytdl_cookies() + ["--no-playlist",
+                                       "--format", self.filter,
+                                       "--print", "%(urls)j",
+                                       f"{self.url}"])
+
+    @pyqtSlot()
+    def process_urls(self):
+        try:
+            urls = json.loads(ut.check_output(self.p)).split()
+            mch.cache.put(self._key(), urls)
+            self.resolved.emit(urls)
+        except (ut.CalledProcessFailed, json.JSONDecodeError) as e:
+            ut.logger().exception(f"{e}")
+            self.failed.emit(f"{e}")
+        finally:
+            self.p = None
+
+    def cancel(self):
+        if self.p is not None:
+            self.p.finished.disconnect()
+            self.p.kill()
+            self.p = None
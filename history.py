@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+"""History of completed jobs to reuse already downloaded clips"""
+
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import sqlite3
+import threading
+
+import utils as ut
+
+
+def job_key(video_id, start, finish, format_id, settings):
+    """Return hash of everything defining the content of an output file"""
+    params = json.dumps([video_id, start, finish, format_id, settings],
+                        sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(params.encode("utf8")).hexdigest()
+
+
+def checksum(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def link_or_copy(source, target):
+    """Make a hard link `target` to `source` or copy it if not possible"""
+    target = pathlib.Path(target)
+    if target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class JobHistory:
+    def __init__(self, path=None):
+        self.path = path if path else ut.user_dir("data")/"history.sqlite"
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                            key TEXT PRIMARY KEY,
+                            video_id TEXT,
+                            url TEXT,
+                            start TEXT,
+                            finish TEXT,
+                            format_id TEXT,
+                            settings TEXT,
+                            path TEXT,
+                            size INTEGER,
+                            checksum TEXT,
+                            started REAL,
+                            finished REAL)""")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def lookup(self, key):
+        """Return completed job with the `key` if its file is still intact"""
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE key = ?",
+                             (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            if os.path.getsize(row["path"]) != row["size"]:
+                return None
+        except OSError:
+            return None
+        return dict(row)
+
+    def record(self, key, video_id, url, start, finish, format_id,
+               settings, path, started, finished):
+        try:
+            size = os.path.getsize(path)
+            digest = checksum(path)
+        except OSError as e:
+            ut.logger().warning(f"not recorded to history: {e}")
+            return
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO jobs VALUES"
+                       " (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (key, video_id, url, start, finish, format_id,
+                        json.dumps(settings, sort_keys=True),
+                        f"{pathlib.Path(path).resolve()}",
+                        size, digest, started, finished))
+
+    def record_async(self, *args):
+        """Record in background since checksum of large files takes time"""
+        threading.Thread(target=self.record, args=args, daemon=True).start()
+
+    def entries(self, limit=100):
+        """Return recently completed jobs"""
+        with self._connect() as db:
+            rows = db.execute("SELECT * FROM jobs ORDER BY finished DESC"
+                              " LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""Minimal parser of HLS playlists to clip live streams"""
+
+import re
+from urllib.parse import urljoin
+
+
+attr_re = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def attributes(line):
+    _, _, attrs = line.partition(":")
+    return {name: value.strip('"') for name, value in attr_re.findall(attrs)}
+
+
+class Segment:
+    def __init__(self, uri, duration, sequence):
+        self.uri = uri
+        self.duration = duration
+        self.sequence = sequence
+
+    def __repr__(self):
+        return f"Segment({self.sequence}, {self.duration}, {self.uri})"
+
+
+class Playlist:
+    """Media playlist, i.e. a sliding window of a live stream"""
+    def __init__(self):
+        self.target_duration = 0.0
+        self.media_sequence = 0
+        self.segments = []
+        self.map_uri = None
+        self.endlist = False
+
+    def duration(self):
+        return sum(s.duration for s in self.segments)
+
+
+def is_master(text):
+    return "#EXT-X-STREAM-INF" in text
+
+
+def parse_master(text, base=""):
+    """Return variant URIs of a master playlist by bandwidth descending"""
+    variants = []
+    bandwidth = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF"):
+            bandwidth = int(attributes(line).get("BANDWIDTH", 0))
+        elif line and not line.startswith("#") and bandwidth is not None:
+            variants.append((bandwidth, urljoin(base, line)))
+            bandwidth = None
+    return [uri for _, uri in sorted(variants, key=lambda v: -v[0])]
+
+
+def parse_media(text, base=""):
+    lines = [line.strip() for line in text.splitlines()]
+    if not lines or lines[0] != "#EXTM3U":
+        raise ValueError("not an HLS playlist")
+    playlist = Playlist()
+    duration = None
+    for line in lines[1:]:
+        if line.startswith("#EXT-X-TARGETDURATION:"):
+            playlist.target_duration = float(line.partition(":")[2])
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            playlist.media_sequence = int(line.partition(":")[2])
+        elif line.startswith("#EXT-X-MAP:"):
+            playlist.map_uri = urljoin(base, attributes(line)["URI"])
+        elif line.startswith("#EXT-X-KEY:"):
+            if attributes(line).get("METHOD", "NONE") != "NONE":
+                raise ValueError("encrypted HLS is not supported")
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            raise ValueError("HLS byte ranges are not supported")
+        elif line.startswith("#EXT-X-ENDLIST"):
+            playlist.endlist = True
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.partition(":")[2].split(",")[0])
+        elif line and not line.startswith("#") and duration is not None:
+            sequence = playlist.media_sequence + len(playlist.segments)
+            playlist.segments.append(
+                Segment(urljoin(base, line), duration, sequence))
+            duration = None
+    return playlist
+
+
+def trailing(playlist, seconds):
+    """Return the last segments covering at least `seconds`"""
+    total = 0.0
+    for i in range(len(playlist.segments) - 1, -1, -1):
+        total += playlist.segments[i].duration
+        if total >= seconds:
+            return playlist.segments[i:]
+    return list(playlist.segments)
+
+
+if __name__ == "__main__":
+    master = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360
+low/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720
+high/index.m3u8
+"""
+    assert is_master(master)
+    assert parse_master(master, "http://host/live/master.m3u8") == \
+        ["http://host/live/high/index.m3u8", "http://host/live/low/index.m3u8"]
+
+    media = "#EXTM3U\n#EXT-X-TARGETDURATION:2\n" \
+            "#EXT-X-MEDIA-SEQUENCE:100\n" + \
+            "".join(f"#EXTINF:2.000,\nseg{100 + i}.ts\n" for i in range(10))
+    playlist = parse_media(media, "file:///tmp/live/index.m3u8")
+    assert not is_master(media)
+    assert playlist.target_duration == 2 and not playlist.endlist
+    assert playlist.segments[0].sequence == 100
+    assert playlist.segments[-1].uri == "file:///tmp/live/seg109.ts"
+    assert [s.sequence for s in trailing(playlist, 5)] == [107, 108, 109]
+    assert len(trailing(playlist, 60)) == 10
+    assert parse_media(media + "#EXT-X-ENDLIST\n").endlist
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+"""Job queue shared by workers on several hosts, an SQLite database
+   on a shared filesystem (rollback journal, WAL needs shared memory)
+
+   A worker claims a job under a lease and renews the lease with
+   heartbeats while the job runs; jobs of workers which died are
+   claimed again once their leases expire. Jobs are specified as
+   for the control API: {url, start, end, format, output}."""
+
+from contextlib import contextmanager
+import json
+import sqlite3
+import time
+
+
+queued = "queued"
+leased = "leased"
+done = "done"
+failed = "failed"
+
+schema = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    spec TEXT NOT NULL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT NOT NULL DEFAULT '',
+    updated REAL NOT NULL
+)"""
+
+
+class JobQueue:
+    max_attempts = 3    # claims of a job whose workers are lost
+
+    def __init__(self, path, timeout=30.0):
+        self.db = sqlite3.connect(path, timeout=timeout,
+                                  isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute(schema)
+
+    def close(self):
+        self.db.close()
+
+    @contextmanager
+    def _transaction(self):
+        # take the write lock at once so that claims do not race
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def enqueue(self, spec):
+        """Add job given by `spec` dictionary, return its id"""
+        with self._transaction():
+            cursor = self.db.execute(
+                "INSERT INTO jobs (spec, state, updated) VALUES (?, ?, ?)",
+                (json.dumps(spec, ensure_ascii=False), queued, time.time()))
+        return cursor.lastrowid
+
+    def claim(self, worker, lease):
+        """Lease the oldest available job to `worker` for `lease` seconds,
+           return its id and spec or None if there are no jobs"""
+        with self._transaction():
+            while True:
+                now = time.time()
+                row = self.db.execute(
+                    "SELECT id, spec, attempts FROM jobs"
+                    " WHERE state = ? OR (state = ? AND lease_until < ?)"
+                    " ORDER BY id LIMIT 1", (queued, leased, now)).fetchone()
+                if row is None:
+                    return None
+                if row["attempts"] < self.max_attempts:
+                    break
+                self.db.execute(
+                    "UPDATE jobs SET state = ?, error = ?, updated = ?"
+                    " WHERE id = ?",
+                    (failed, "workers lost / исполнители потеряны", now,
+                     row["id"]))
+            self.db.execute(
+                "UPDATE jobs SET state = ?, worker = ?, lease_until = ?,"
+                " attempts = attempts + 1, updated = ? WHERE id = ?",
+                (leased, worker, now + lease, now, row["id"]))
+        return row["id"], json.loads(row["spec"])
+
+    def _update(self, job_id, worker, assignments, values):
+        with self._transaction():
+            cursor = self.db.execute(
+                f"UPDATE jobs SET {assignments}, updated = ?"
+                " WHERE id = ? AND worker = ? AND state = ?",
+                (*values, time.time(), job_id, worker, leased))
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_id, worker, lease):
+        """Extend the lease, return False if it is lost"""
+        return self._update(job_id, worker, "lease_until = ?",
+                            (time.time() + lease,))
+
+    def finish(self, job_id, worker, ok, error=""):
+        """Record result, return False if the lease is lost"""
+        return self._update(job_id, worker, "state = ?, error = ?",
+                            (done if ok else failed, error))
+
+    def release(self, job_id, worker):
+        """Return unfinished job to the queue, e.g. on worker shutdown"""
+        return self._update(job_id, worker,
+                            "state = ?, attempts = attempts - 1",
+                            (queued,))
+
+    def jobs(self):
+        return [dict(row) for row in self.db.execute(
+            "SELECT id, spec, state, worker, attempts, error FROM jobs"
+            " ORDER BY id")]
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp)/"queue.db"
+        q1, q2 = JobQueue(path), JobQueue(path)
+        ids = [q1.enqueue({"url": f"https://host/{i}"}) for i in range(2)]
+        first = q1.claim("w1", 0.2)
+        assert first == (ids[0], {"url": "https://host/0"})
+        assert q2.claim("w2", 60)[0] == ids[1]
+        assert q2.claim("w2", 60) is None
+        assert q1.heartbeat(ids[0], "w1", 0.2)
+        time.sleep(0.3)     # w1 is lost
+        assert q2.claim("w2", 60)[0] == ids[0]
+        assert not q1.heartbeat(ids[0], "w1", 0.2)
+        assert not q1.finish(ids[0], "w1", True)
+        assert q2.finish(ids[0], "w2", True)
+        assert q2.release(ids[1], "w2")
+        assert [job["state"] for job in q1.jobs()] == [done, queued]
+        q1.close()
+        q2.close()
+    print("[OK]")
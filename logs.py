@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+"""Logging off the GUI thread to a size-rotated file
+   in the per-user log directory"""
+
+import atexit
+from collections import Counter
+import logging
+import logging.handlers
+import queue
+import time
+
+import utils as ut
+
+
+log_format = "%(asctime)s:%(module)s:%(levelname)s: %(message)s"
+
+_listener = None
+
+
+class SamplingFilter(logging.Filter):
+    """Pass at most one record per `interval` seconds of those logged
+       with `extra={"sample": kind}` for every logger, job and kind"""
+    def __init__(self, interval=1.0):
+        super().__init__()
+        self.interval = interval
+        self.last = dict()
+        self.dropped = Counter()
+        self.pruned = time.monotonic()
+
+    def filter(self, record):
+        kind = getattr(record, "sample", None)
+        if kind is None:
+            return True
+        key = (record.name, getattr(record, "job", None), kind)
+        now = time.monotonic()
+        if now - self.pruned > 60 * self.interval:
+            self._prune(now)
+        if now - self.last.get(key, 0) < self.interval:
+            self.dropped[key] += 1
+            return False
+        self.last[key] = now
+        if dropped := self.dropped.pop(key, 0):
+            record.msg = f"{record.msg}\n({dropped} similar records skipped)"
+        return True
+
+    def _prune(self, now):
+        """Forget kinds not logged lately, e.g. of finished jobs"""
+        self.pruned = now
+        for key, last in list(self.last.items()):
+            if now - last >= self.interval:
+                del self.last[key]
+                self.dropped.pop(key, None)
+
+
+class JobLogger(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**kwargs.get("extra", {}), **self.extra}
+        return f"[job {self.extra['job']}] {msg}", kwargs
+
+
+def job_logger(job_id):
+    """Return logger of the job writing to the application log,
+       one logger serves all jobs since loggers are never freed"""
+    return JobLogger(logging.getLogger("yt-cut.job"), {"job": job_id})
+
+
+def setup(level=logging.CRITICAL, path=None,
+          max_bytes=5 << 20, backup_count=3):
+    """Route `yt-cut` loggers through a queue to a file writer thread"""
+    global _listener
+    if _listener is not None:
+        return
+    path = path if path else ut.user_dir("log")/"yt-cut.log"
+    handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count,
+        encoding="utf-8", delay=True)
+    handler.setFormatter(logging.Formatter(log_format))
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    atexit.register(shutdown)
+
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(SamplingFilter())
+    logger = ut.logger()
+    logger.addHandler(queue_handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def shutdown():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
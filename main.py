@@ -1,14 +1,23 @@
 #!/usr/bin/env python3
 
+import startup  # first to time the imports below
+
 from argparse import ArgumentParser
 import json
+import logging
+import signal
 import sys
 import traceback
 
-from PyQt6.QtCore import (QObject, pyqtSignal)
+from PyQt6.QtCore import (QCoreApplication, QObject, QTimer, pyqtSignal)
 from PyQt6.QtWidgets import (QApplication, QMessageBox)
 
 import gui.mainwindow as mw
+import gui.scheduler as sch
+import gui.ytvideo as ytv
+import logs
+import options as opt
+import profiler as prof
 import utils as ut
 import version as vrs
 
@@ -69,6 +78,40 @@ class UncaughtHook(QObject):
             restore_on_error()
 
 
+def enqueue(args):
+    """Add jobs to the shared queue and print their ids"""
+    import jobqueue as jbq
+    queue = jbq.JobQueue(args.queue)
+    for url in args.enqueue:
+        spec = {"url": url, "start": args.start, "end": args.end,
+                "output": args.output, "format": args.format}
+        print(queue.enqueue({k: v for k, v in spec.items() if v}))
+    queue.close()
+
+
+def run_worker(args):
+    """Run jobs from the shared queue without GUI until interrupted"""
+    import gui.worker as wrk
+    import jobqueue as jbq
+    app = QCoreApplication(sys.argv)
+    logs.setup(logging.INFO)
+    ut.args = args
+    ytv.options = opt.ToolOptions()
+    scheduler = sch.Scheduler(max_jobs=args.max_jobs)
+    worker = wrk.Worker(jbq.JobQueue(args.queue), scheduler,
+                        exit_when_idle=args.exit_when_idle)
+    worker.idle.connect(app.quit)
+    app.aboutToQuit.connect(worker.stop)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: app.quit())
+    # let the interpreter handle signals while the event loop runs
+    timer = QTimer()
+    timer.timeout.connect(lambda: None)
+    timer.start(500)
+    worker.start()
+    return app.exec()
+
+
 if __name__ == "__main__":
     yt_dlp_default = "tools/yt-dlp.exe" if ut.under_windows() else "yt-dlp"
     ffmpeg_default = "tools/ffmpeg.exe" if ut.under_windows() else "ffmpeg"
@@ -80,9 +123,59 @@ if __name__ == "__main__":
                         help="path to yt-dlp program [default: %(default)s]")
     parser.add_argument("--ffmpeg", default=ffmpeg_default,
                         help="path to ffmpeg program [default: %(default)s]")
+    parser.add_argument("--api-port", type=int, default=0,
+                        help="serve local control API on the port"
+                        " [default: disabled]")
+    parser.add_argument("--api-token",
+                        help="token to access control API"
+                        " [default: generated and kept in user data]")
+
+    parser.add_argument("--profile", action="store_true",
+                        help="detect event loop stalls and time slow calls,"
+                        " write report on exit")
+    parser.add_argument("--stall-ms", type=int, default=100,
+                        help="event loop stall threshold in --profile mode"
+                        " [default: %(default)s]")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="add cProfile statistics to --profile report")
+    parser.add_argument("--startup-timing", action="store_true",
+                        help="report durations of startup phases and"
+                        " the slowest imports after the window is shown")
+
+    farm = parser.add_argument_group("worker farm")
+    farm.add_argument("--queue", metavar="FILE",
+                      help="job queue shared by workers (SQLite database)")
+    farm.add_argument("--worker", action="store_true",
+                      help="run jobs from --queue without GUI")
+    farm.add_argument("--max-jobs", type=int, default=4,
+                      help="parallel jobs of the worker"
+                      " [default: %(default)s]")
+    farm.add_argument("--exit-when-idle", action="store_true",
+                      help="stop the worker when the queue is empty")
+    farm.add_argument("--enqueue", nargs="+", metavar="URL",
+                      help="add jobs to --queue and exit")
+    farm.add_argument("--start", help="start of the enqueued cuts")
+    farm.add_argument("--end", help="end of the enqueued cuts")
+    farm.add_argument("--output",
+                      help="directory or file of the enqueued cuts,"
+                      " shared by workers")
+    farm.add_argument("--format", help="format id of the enqueued cuts")
+
+    startup.mark("imports")
+    args = parser.parse_args()
+    if (args.worker or args.enqueue) and not args.queue:
+        parser.error("--queue is required")
+    if args.enqueue:
+        enqueue(args)
+        sys.exit(0)
+
+    if args.worker:
+        sys.exit(run_worker(args))
 
     app = QApplication(sys.argv)
-    args = parser.parse_args()
+    startup.mark("application")
+
+    logs.setup()
 
     # to register the hook
     qt_exception_hook = UncaughtHook()
@@ -90,7 +183,21 @@ if __name__ == "__main__":
     # access to other modules
     ut.args = args
 
+    if args.profile:
+        prof.start(args.stall_ms, args.cprofile)
+        app.aboutToQuit.connect(prof.stop)
+
     window = mw.MainWindow()
+    startup.mark("main window")
     window.show()
+    startup.mark("show")
+
+    if args.startup_timing:
+        def report_startup():
+            startup.mark("first paint")
+            text = startup.report()
+            print(text, file=sys.stderr)
+            ut.logger().info(text)
+        window.first_painted.connect(report_startup)
 
     app.exec()
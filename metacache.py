@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+"""In-memory cache of video metadata shared by all requesters"""
+
+from collections import OrderedDict
+import copy
+import time
+
+import utils as ut
+
+
+class MetadataCache:
+    """LRU cache of yt-dlp info and formats keyed by request"""
+    def __init__(self, size=1024, margin=10*60):
+        self.size = size
+        self.margin = margin    # drop formats with URLs expiring soon
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        value = self.entries[key]
+        if key[0] in ("formats", "urls") and self._expiring(key, value):
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def put(self, key, value):
+        self.entries[key] = copy.deepcopy(value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def _expiring(self, key, value):
+        urls = value if key[0] == "urls" else \
+            [url for fmt in value for url in f"{fmt.get('urls', '')}".split()]
+        expire = ut.urls_expire(urls)
+        return expire is not None and expire - time.time() < self.margin
+
+    def clear(self):
+        self.entries.clear()
+
+
+cache = MetadataCache()
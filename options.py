@@ -3,12 +3,13 @@
 import logging
 import re
 
-from PyQt6.QtCore import (pyqtSlot, Qt, QProcess)
-from PyQt6.QtGui import QGuiApplication
+from PyQt6.QtCore import (pyqtSlot, Qt, QProcess, QRegularExpression)
+from PyQt6.QtGui import QGuiApplication, QRegularExpressionValidator
 from PyQt6.QtWidgets import (
-     QWidget, QLabel, QComboBox, QMessageBox, QCheckBox,
+     QWidget, QLabel, QComboBox, QMessageBox, QCheckBox, QLineEdit,
      QPushButton, QGroupBox, QGridLayout, QVBoxLayout)
 
+import containers as cnt
 import utils as ut
 
 
@@ -28,6 +29,14 @@ audio_codecs = {
     "mp3": "MPEG audio layer 3",
 }
 
+containers = {
+    "auto": "Choose container keeping stream copy possible"
+            " / Выбрать контейнер без лишней конвертации",
+    "mp4": "MPEG-4 Part 14, convert incompatible streams",
+    "webm": "WebM, convert incompatible streams",
+    "mkv": "Matroska, holds any codec",
+}
+
 log_level = {
     "disable": None,
     "critical": logging.CRITICAL,
@@ -44,10 +53,18 @@ class ToolOptions:
 
     def reset(self):
         self.browser = browsers[0]
+        self.prefetch = {"paste": True,
+                         "clipboard": False}
         self.prefer_avc = True
+        self.range_cache = False
         self.codecs = {"video": "copy",
                        "audio": "copy"}
+        self.container = cnt.containers[0]
+        self.renditions = []
         self.vbr = VideoBitrate.default_value
+        self.geometry = {"height": 0,     # max height, 0 keeps source
+                         "fps": 0.0,
+                         "crop": ""}      # W:H[:X:Y]
         self.debug = {"ffmpeg": False,
                       "logLevel": "critical"}
         self.xerror = True
@@ -55,9 +72,14 @@ class ToolOptions:
     def dump(self):
         return {
             "browser": self.browser,
+            "prefetch": self.prefetch,
             "prefer_avc": self.prefer_avc,
+            "range_cache": self.range_cache,
             "codecs": self.codecs,
+            "container": self.container,
+            "renditions": self.renditions,
             "vbr": self.vbr,
+            "geometry": self.geometry,
             "debug": self.debug,
             "xerror": self.xerror,
         }
@@ -66,7 +88,8 @@ class ToolOptions:
 class VideoBitrate(QComboBox):
     """Tuned `QComboBox` class to get video bitrate from user"""
     default_value = "original"
-    vbr_pat = re.compile(r"(^\s*\d+[KkMm]?$)|(auto)|(original)")
+    vbr_pat = re.compile(r"(^\s*\d+[KkMm]?$)|(auto)|(original)"
+                         r"|(^\s*\d+(\.\d+)?\s*[KkMmGg][Bb]\s*$)")
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -87,7 +110,9 @@ class VideoBitrate(QComboBox):
 
 
 class Options(QWidget, ToolOptions):
-    def __init__(self):
+    """Tab of settings, built when first shown taking `values`
+       of `ToolOptions` used until then"""
+    def __init__(self, values=None):
         super().__init__()
 
         authGroup = QGroupBox("Auth via")
@@ -106,6 +131,34 @@ class Options(QWidget, ToolOptions):
         authLayout.setRowStretch(1, 1)
         authGroup.setLayout(authLayout)
 
+        prefetchGroup = QGroupBox("Prefetch")
+        self.pastePrefetchCheckBox = QCheckBox("On paste")
+        self.pastePrefetchCheckBox.setToolTip(
+                "Load video info as soon as a link is pasted /\n"
+                "Загружать информацию о видео сразу после вставки ссылки")
+        self.pastePrefetchCheckBox.toggled.connect(
+                lambda ok: self.toggle_prefetch("paste", ok))
+        self.clipboardPrefetchCheckBox = QCheckBox("From clipboard")
+        self.clipboardPrefetchCheckBox.setToolTip(
+                "Load video info for links copied to clipboard /\n"
+                "Загружать информацию о видео для скопированных ссылок")
+        self.clipboardPrefetchCheckBox.toggled.connect(
+                lambda ok: self.toggle_prefetch("clipboard", ok))
+
+        self.rangeCacheCheckBox = QCheckBox("Cache media")
+        self.rangeCacheCheckBox.setToolTip(
+                "Keep downloaded parts of videos on disk to cut them again"
+                " faster /\n"
+                "Хранить загруженные части видео на диске, чтобы быстрее"
+                " вырезать их снова")
+        self.rangeCacheCheckBox.toggled.connect(self.toggle_range_cache)
+
+        prefetchLayout = QVBoxLayout()
+        prefetchLayout.addWidget(self.pastePrefetchCheckBox)
+        prefetchLayout.addWidget(self.clipboardPrefetchCheckBox)
+        prefetchLayout.addWidget(self.rangeCacheCheckBox)
+        prefetchGroup.setLayout(prefetchLayout)
+
         codecGroup = QGroupBox("Codecs")
         self.premiereCheckBox = QCheckBox("Prefer AVC/AAC")
         self.premiereCheckBox.setToolTip(
@@ -135,14 +188,64 @@ class Options(QWidget, ToolOptions):
         self.acodecComboBox.setToolTip(audio_codecs[self.codecs["audio"]])
         self.acodecComboBox.currentTextChanged.connect(self.set_audio_codec)
 
+        containerLabel = QLabel("Container:")
+        containerLabel.setToolTip("Output file format / Формат файла")
+        self.containerComboBox = QComboBox()
+        self.containerComboBox.setEditable(False)
+        for container in containers:
+            self.containerComboBox.addItem(container)
+        self.containerComboBox.setToolTip(containers[self.container])
+        self.containerComboBox.currentTextChanged.connect(self.set_container)
+
+        renditionsLabel = QLabel("Renditions:")
+        renditionsLabel.setToolTip(
+            "Heights of videos made from one download (1080, 720, 360) /\n"
+            "Высоты видео, получаемых из одной загрузки")
+        self.renditionsLineEdit = QLineEdit()
+        self.renditionsLineEdit.setPlaceholderText("source / источник")
+        self.renditionsLineEdit.setValidator(QRegularExpressionValidator(
+            QRegularExpression(r"(\d{1,4}[, ]+)*\d{0,4}")))
+        self.renditionsLineEdit.textChanged.connect(self.set_renditions)
+
         vbrLabel = QLabel("VBR:")
         vbrLabel.setToolTip(
-            "Set video bitrate when converting (100K, 15M, ...) /\n"
-            "Установить качество видео при конвертировании")
+            "Set video bitrate when converting (100K, 15M, ...)"
+            " or output size (25MB, ...) /\n"
+            "Установить качество видео при конвертировании"
+            " или размер файла")
         self.vbrComboBox = VideoBitrate()
         self.vbrComboBox.currentTextChanged.connect(self.set_video_bitrate)
         self.vbrComboBox.setEnabled(False)
 
+        heightLabel = QLabel("Max height:")
+        heightLabel.setToolTip("Downscale taller video when converting /\n"
+                               "Уменьшить более высокое видео"
+                               " при конвертировании")
+        self.heightLineEdit = QLineEdit()
+        self.heightLineEdit.setPlaceholderText("source / источник")
+        self.heightLineEdit.setValidator(QRegularExpressionValidator(
+            QRegularExpression(r"\d{0,4}")))
+        self.heightLineEdit.textChanged.connect(self.set_max_height)
+
+        fpsLabel = QLabel("FPS:")
+        fpsLabel.setToolTip("Reduce frame rate when converting /\n"
+                            "Уменьшить частоту кадров при конвертировании")
+        self.fpsLineEdit = QLineEdit()
+        self.fpsLineEdit.setPlaceholderText("source / источник")
+        self.fpsLineEdit.setValidator(QRegularExpressionValidator(
+            QRegularExpression(r"\d{0,3}(\.\d{0,3})?")))
+        self.fpsLineEdit.textChanged.connect(self.set_fps)
+
+        cropLabel = QLabel("Crop:")
+        cropLabel.setToolTip("Keep W:H area at X:Y, centered by default /\n"
+                             "Оставить область W:H в точке X:Y,"
+                             " по умолчанию в центре")
+        self.cropLineEdit = QLineEdit()
+        self.cropLineEdit.setPlaceholderText("W:H[:X:Y]")
+        self.cropLineEdit.setValidator(QRegularExpressionValidator(
+            QRegularExpression(r"\d{0,5}(:\d{0,5}){0,3}")))
+        self.cropLineEdit.textChanged.connect(self.set_crop)
+
         codecLayout = QGridLayout()
         codecLayout.addWidget(self.premiereCheckBox, 0, 0, 1, 2)
         codecLayout.addWidget(vcodecLabel, 1, 0)
@@ -152,6 +255,16 @@ class Options(QWidget, ToolOptions):
         codecLayout.addWidget(vbrLabel, 3, 0,
                               alignment=Qt.AlignmentFlag.AlignRight)
         codecLayout.addWidget(self.vbrComboBox, 3, 1)
+        codecLayout.addWidget(containerLabel, 4, 0)
+        codecLayout.addWidget(self.containerComboBox, 4, 1)
+        codecLayout.addWidget(renditionsLabel, 5, 0)
+        codecLayout.addWidget(self.renditionsLineEdit, 5, 1)
+        codecLayout.addWidget(heightLabel, 6, 0)
+        codecLayout.addWidget(self.heightLineEdit, 6, 1)
+        codecLayout.addWidget(fpsLabel, 7, 0)
+        codecLayout.addWidget(self.fpsLineEdit, 7, 1)
+        codecLayout.addWidget(cropLabel, 8, 0)
+        codecLayout.addWidget(self.cropLineEdit, 8, 1)
         codecGroup.setLayout(codecLayout)
 
         debugGroup = QGroupBox("Debug")
@@ -200,31 +313,58 @@ class Options(QWidget, ToolOptions):
         layout.addWidget(debugGroup, 1, 0)
         layout.setRowStretch(2, 1)
         layout.addWidget(thirdPartyGroup, 0, 3)
+        layout.addWidget(prefetchGroup, 1, 3)
         layout.addWidget(self.xerrorCheckBox, 3, 0)
         layout.addWidget(self.resetPushButton, 3, 3)
         self.setLayout(layout)
 
         self.set_defaults()
+        if values is not None:
+            self.show_values(values)
 
     def set_defaults(self):
         super().reset()
-        self.browserComboBox.setCurrentText(self.browser)
-        self.premiereCheckBox.setChecked(self.prefer_avc)
-        self.vcodecComboBox.setCurrentText(self.codecs["video"])
-        self.acodecComboBox.setCurrentText(self.codecs["audio"])
-        self.vbrComboBox.setCurrentText(self.vbr)
-        self.logCheckBox.setChecked(self.debug["ffmpeg"])
-        self.logLevelComboBox.setCurrentText(self.debug["logLevel"])
-        self.xerrorCheckBox.setChecked(self.xerror)
+        self.show_values(self)
+
+    def show_values(self, values):
+        """Set widgets, and so the options, to `values`"""
+        self.browserComboBox.setCurrentText(values.browser)
+        self.pastePrefetchCheckBox.setChecked(values.prefetch["paste"])
+        self.clipboardPrefetchCheckBox.setChecked(
+            values.prefetch["clipboard"])
+        self.premiereCheckBox.setChecked(values.prefer_avc)
+        self.rangeCacheCheckBox.setChecked(values.range_cache)
+        self.vcodecComboBox.setCurrentText(values.codecs["video"])
+        self.acodecComboBox.setCurrentText(values.codecs["audio"])
+        self.vbrComboBox.setCurrentText(values.vbr)
+        self.containerComboBox.setCurrentText(values.container)
+        self.renditionsLineEdit.setText(
+            ", ".join(f"{h}" for h in values.renditions))
+        geometry = dict(values.geometry)
+        self.heightLineEdit.setText(
+            f"{geometry['height']}" if geometry["height"] else "")
+        self.fpsLineEdit.setText(
+            f"{geometry['fps']:g}" if geometry["fps"] else "")
+        self.cropLineEdit.setText(geometry["crop"])
+        self.logCheckBox.setChecked(values.debug["ffmpeg"])
+        self.logLevelComboBox.setCurrentText(values.debug["logLevel"])
+        self.xerrorCheckBox.setChecked(values.xerror)
 
     @pyqtSlot(str)
     def set_browser(self, name):
         self.browser = name
 
+    def toggle_prefetch(self, source, ok):
+        self.prefetch[source] = ok
+
     @pyqtSlot(bool)
     def toggle_premiere(self, ok):
         self.prefer_avc = ok
 
+    @pyqtSlot(bool)
+    def toggle_range_cache(self, ok):
+        self.range_cache = ok
+
     @pyqtSlot(str)
     def set_video_codec(self, name):
         if name != "copy":
@@ -244,6 +384,31 @@ class Options(QWidget, ToolOptions):
         self.codecs["audio"] = name
         self.acodecComboBox.setToolTip(audio_codecs[name])
 
+    @pyqtSlot(str)
+    def set_container(self, name):
+        self.container = name
+        self.containerComboBox.setToolTip(containers[name])
+
+    @pyqtSlot(str)
+    def set_renditions(self, text):
+        heights = [int(h) for h in re.split(r"[, ]+", text) if h]
+        self.renditions = sorted(set(h for h in heights if h > 0),
+                                 reverse=True)
+
+    @pyqtSlot(str)
+    def set_max_height(self, text):
+        self.geometry["height"] = int(text) if text else 0
+
+    @pyqtSlot(str)
+    def set_fps(self, text):
+        self.geometry["fps"] = ut.float_or_none(text) or 0.0
+
+    @pyqtSlot(str)
+    def set_crop(self, text):
+        # incomplete text keeps the whole frame
+        self.geometry["crop"] = text \
+            if re.fullmatch(r"[1-9]\d*:[1-9]\d*(:\d+:\d+)?", text) else ""
+
     @pyqtSlot(bool)
     def toggle_logging(self, ok):
         self.debug["ffmpeg"] = ok
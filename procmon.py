@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""CPU, memory and I/O usage of child processes and the system
+read from /proc (Linux only, other systems report nothing)"""
+
+import os
+import time
+
+
+available = os.path.exists("/proc/self/stat")
+_ticks = os.sysconf("SC_CLK_TCK") if available else 100
+
+
+def _read(path):
+    try:
+        with open(path, encoding="ascii", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def cpu_ticks(pid):
+    """Return user and system time of the process in clock ticks"""
+    if (stat := _read(f"/proc/{pid}/stat")) is None:
+        return None
+    fields = stat[stat.rindex(")") + 2:].split()
+    return int(fields[11]) + int(fields[12])
+
+
+def rss(pid):
+    """Return resident set size of the process in bytes"""
+    if (status := _read(f"/proc/{pid}/status")) is None:
+        return None
+    for line in status.splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) * 1024
+    return None
+
+
+def io(pid):
+    """Return bytes read and written by the process (storage layer)"""
+    if (text := _read(f"/proc/{pid}/io")) is None:
+        return None
+    values = dict(line.split(": ") for line in text.splitlines()
+                  if ": " in line)
+    return int(values.get("read_bytes", 0)), int(values.get("write_bytes", 0))
+
+
+def children(pid):
+    """Return the process and its descendants"""
+    pids = [pid]
+    for p in pids:
+        text = _read(f"/proc/{p}/task/{p}/children")
+        if text:
+            pids.extend(int(c) for c in text.split())
+    return pids
+
+
+class ProcessSampler:
+    """Usage of a process tree between consecutive samples"""
+    def __init__(self):
+        self.pid = None
+        self.last = None
+        self.peak_rss = 0
+        self.cpu_done = 0.0     # of the processes sampled before
+        self.cpu_time = 0.0
+
+    def sample(self, pid):
+        if not available or not pid:
+            return None
+        if pid != self.pid:
+            self.pid, self.last = pid, None
+            self.cpu_done = self.cpu_time
+        ticks, memory, read, written = 0, 0, 0, 0
+        for p in children(pid):
+            if (t := cpu_ticks(p)) is None:
+                continue
+            ticks += t
+            memory += rss(p) or 0
+            r, w = io(p) or (0, 0)
+            read, written = read + r, written + w
+        now = time.monotonic()
+        usage = {"cpu": 0.0, "rss": memory, "read": 0.0, "write": 0.0}
+        if self.last is not None:
+            t0, ticks0, read0, written0 = self.last
+            elapsed = max(now - t0, 1e-3)
+            usage["cpu"] = max(ticks - ticks0, 0) / _ticks / elapsed * 100
+            usage["read"] = max(read - read0, 0) / elapsed
+            usage["write"] = max(written - written0, 0) / elapsed
+        self.last = (now, ticks, read, written)
+        self.peak_rss = max(self.peak_rss, memory)
+        self.cpu_time = self.cpu_done + ticks / _ticks
+        return usage
+
+
+class SystemSampler:
+    """Load average per CPU and share of time waiting for I/O"""
+    def __init__(self):
+        self.last = None
+
+    def sample(self):
+        if not available:
+            return None
+        fields = _read("/proc/stat").splitlines()[0].split()[1:]
+        values = [int(v) for v in fields]
+        total, iowait = sum(values), values[4]
+        last, self.last = self.last, (total, iowait)
+        wait = 0.0
+        if last is not None and total > last[0]:
+            wait = (iowait - last[1]) / (total - last[0])
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        return {"load": load, "iowait": wait}
+
+
+def describe(usage):
+    """Return current usage if sampled, or totals"""
+    if not usage:
+        return ""
+    mb = 1024 * 1024
+    if "cpu" not in usage:
+        return f"CPU {usage['cpu_time']:.1f} s," \
+               f" peak RSS {usage['peak_rss'] / mb:.0f} MB"
+    return f"CPU {usage['cpu']:.0f}%, RSS {usage['rss'] / mb:.0f} MB," \
+           f" I/O {usage['read'] / mb:.1f}/{usage['write'] / mb:.1f} MB/s"
+
+
+if __name__ == "__main__":
+    if available:
+        sampler = ProcessSampler()
+        sampler.sample(os.getpid())
+        sum(i * i for i in range(10**6))
+        print(describe(sampler.sample(os.getpid())))
+        system = SystemSampler()
+        system.sample()
+        time.sleep(0.1)
+        print(system.sample())
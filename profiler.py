@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+"""Event-loop stall detector and profiling spans (`--profile` mode)
+
+Spans measure the time spent synchronously in the GUI thread, that is
+the time the event loop is blocked by the wrapped call."""
+
+from collections import Counter, defaultdict
+import functools
+import io
+import sys
+import threading
+import time
+import traceback
+
+from PyQt6.QtCore import QObject, QTimer
+
+import utils as ut
+
+
+enabled = False
+_spans = defaultdict(lambda: [0, 0.0, 0.0])    # count, total, max
+_lock = threading.Lock()
+
+
+def span(name):
+    """Decorator accounting time spent in the function when profiling"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with _lock:
+                    stat = _spans[name]
+                    stat[0] += 1
+                    stat[1] += elapsed
+                    stat[2] = max(stat[2], elapsed)
+        return wrapper
+    return decorator
+
+
+class StallDetector(QObject):
+    """Measure event loop lag with a timer ticking in the GUI thread
+       and sample GUI thread stack from a watchdog thread when the loop
+       does not tick longer than `threshold` seconds"""
+    def __init__(self, threshold=0.1, interval=0.02, max_samples=1000):
+        super().__init__()
+        self.threshold = threshold
+        self.interval = interval
+        self.main_id = threading.main_thread().ident
+        self.beat = time.monotonic()
+        self.stalls = []
+        self.samples = Counter()
+        self.max_samples = max_samples
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(interval * 1000))
+        self.timer.timeout.connect(self.tick)
+        self.stopped = threading.Event()
+        self.watchdog = threading.Thread(target=self.watch, daemon=True,
+                                         name="stall-watchdog")
+
+    def start(self):
+        self.beat = time.monotonic()
+        self.timer.start()
+        self.watchdog.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.stopped.set()
+
+    def tick(self):
+        now = time.monotonic()
+        lag = now - self.beat - self.interval
+        self.beat = now
+        if lag > self.threshold:
+            self.stalls.append(lag)
+            ut.logger().warning(f"event loop stalled for {lag*1000:.0f} ms")
+
+    def watch(self):
+        while not self.stopped.wait(self.threshold / 2):
+            if time.monotonic() - self.beat < self.threshold:
+                continue
+            frame = sys._current_frames().get(self.main_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            with _lock:
+                if len(self.samples) < self.max_samples or \
+                   stack in self.samples:
+                    self.samples[stack] += 1
+
+    def report(self):
+        lines = [f"Event loop stalls > {self.threshold*1000:.0f} ms:"
+                 f" {len(self.stalls)}"]
+        if self.stalls:
+            lines.append(f"  total {sum(self.stalls):.3f} s,"
+                         f" max {max(self.stalls):.3f} s")
+        lines.append("\nStack samples of the stalled GUI thread:")
+        with _lock:
+            for stack, count in self.samples.most_common(20):
+                lines.append(f"--- {count} sample(s)\n{stack}")
+        return "\n".join(lines)
+
+
+_detector = None
+_profile = None
+
+
+def start(stall_ms=100, use_cprofile=False):
+    global enabled, _detector, _profile
+    enabled = True
+    _detector = StallDetector(stall_ms / 1000)
+    _detector.start()
+    if use_cprofile:
+        import cProfile     # slow to import, rarely used
+        _profile = cProfile.Profile()
+        _profile.enable()
+
+
+def report():
+    lines = ["Spans (calls, total s, max s):"]
+    with _lock:
+        for name, (count, total, longest) in \
+                sorted(_spans.items(), key=lambda x: -x[1][1]):
+            lines.append(f"  {name:<24} {count:>8} {total:>10.3f}"
+                         f" {longest:>8.3f}")
+    if _detector is not None:
+        lines.append("\n" + _detector.report())
+    if _profile is not None:
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(_profile, stream=out) \
+              .sort_stats("cumulative").print_stats(40)
+        lines.append("\ncProfile:\n" + out.getvalue())
+    return "\n".join(lines)
+
+
+def stop():
+    """Stop profiling and dump the report, return its path"""
+    global enabled
+    if not enabled:
+        return None
+    enabled = False
+    if _detector is not None:
+        _detector.stop()
+    if _profile is not None:
+        _profile.disable()
+    path = ut.user_dir("data")/time.strftime("profile-%Y%m%d-%H%M%S.txt")
+    path.write_text(report(), encoding="utf8")
+    ut.logger().info(f"profile report written to {path}")
+    print(f"Profile report: {path}", file=sys.stderr)
+    return path
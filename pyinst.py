@@ -45,6 +45,9 @@ def main():
         '--windowed',
         '--icon=icons/ytcut.png',
         '--upx-exclude=vcruntime140.dll',
+        # used to draw the icon only, the waveform does without numpy
+        '--exclude-module=matplotlib',
+        '--exclude-module=numpy',
         '--noconfirm',
         *opts,
         'main.py',
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+"""Local HTTP proxy keeping byte ranges of media URLs in a sparse
+on-disk cache, so that cuts of other intervals of the same video
+are read mostly from the disk
+
+ffmpeg is given http://127.0.0.1:<port>/<key>?url=<media URL> where
+the key names the stream (video id and format id), since signed media
+URLs change when they are resolved again."""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import pathlib
+import re
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import utils as ut
+
+
+block_size = 1 << 20
+max_run = 64    # blocks fetched by one upstream request
+range_re = re.compile(r"bytes=(\d*)-(\d*)")
+content_range_re = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class Entry:
+    """Sparse file of a stream with the set of blocks present in it"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.size = None
+        self.blocks = set()
+        self.used = time.time()
+        self.readers = 0
+        try:
+            js = json.loads((path/"index.json").read_text(encoding="utf8"))
+            self.size, self.blocks = js["size"], set(js["blocks"])
+            self.used = js["used"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        with self.lock:
+            js = {"size": self.size, "blocks": sorted(self.blocks),
+                  "used": self.used}
+        (self.path/"index.json").write_text(json.dumps(js), encoding="utf8")
+
+    def cached_bytes(self):
+        return len(self.blocks) * block_size
+
+    def block_length(self, index):
+        return min(block_size, self.size - index * block_size)
+
+    def read(self, index):
+        with open(self.path/"data", "rb") as f:
+            f.seek(index * block_size)
+            return f.read(self.block_length(index))
+
+    def write(self, index, data):
+        with self.lock:
+            data_file = self.path/"data"
+            with open(data_file, "r+b" if data_file.exists() else "wb") as f:
+                f.seek(index * block_size)     # holes stay unallocated
+                f.write(data)
+            self.blocks.add(index)
+
+
+class RangeCache:
+    """Entries of streams under `root` taking at most `max_bytes`,
+       the least recently used ones not being read are evicted"""
+    def __init__(self, root, max_bytes=2 << 30):
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = {path.name: Entry(path)
+                        for path in self.root.iterdir() if path.is_dir()}
+
+    def acquire(self, key):
+        name = quote(key, safe="")
+        with self.lock:
+            if (entry := self.entries.get(name)) is None:
+                path = self.root/name
+                path.mkdir(exist_ok=True)
+                entry = self.entries[name] = Entry(path)
+            entry.readers += 1
+            entry.used = time.time()
+        return entry
+
+    def release(self, entry):
+        try:
+            entry.save()
+        except OSError as e:
+            ut.logger().warning(f"{e}")
+        with self.lock:
+            entry.readers -= 1
+        self.evict()
+
+    def evict(self):
+        with self.lock:
+            total = sum(e.cached_bytes() for e in self.entries.values())
+            for name, entry in sorted(self.entries.items(),
+                                      key=lambda item: item[1].used):
+                if total <= self.max_bytes:
+                    break
+                if entry.readers:
+                    continue
+                total -= entry.cached_bytes()
+                del self.entries[name]
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        ut.logger().debug(f"range cache: {format % args}")
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        key = unquote(parts.path[1:])
+        url = parse_qs(parts.query).get("url", [""])[0]
+        if not key or not url.startswith(("http://", "https://")):
+            self.send_error(400)
+            return
+        self.responded = False
+        entry = self.server.cache.acquire(key)
+        try:
+            self.serve(entry, url)
+        except (BrokenPipeError, ConnectionResetError):
+            pass    # ffmpeg seeks by reconnecting
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            ut.logger().warning(f"range cache: {e}")
+            if not self.responded:
+                self.send_error(502, f"{e}")
+            self.close_connection = True
+        finally:
+            self.server.cache.release(entry)
+
+    def _upstream(self, url, first, last):
+        request = urllib.request.Request(url, headers={
+            "Range": f"bytes={first}-{last}",
+            "User-Agent": self.headers.get("User-Agent", "yt-cut")})
+        return urllib.request.urlopen(request, timeout=30)
+
+    def _size(self, url):
+        with self._upstream(url, 0, 0) as reply:
+            if m := content_range_re.match(
+                    reply.headers.get("Content-Range", "")):
+                return int(m.group(3))
+            if reply.status == 200 and reply.headers.get("Content-Length"):
+                return int(reply.headers["Content-Length"])
+        raise ValueError(f"size of {urlsplit(url).netloc} stream unknown")
+
+    def serve(self, entry, url):
+        if entry.size is None:
+            entry.size = self._size(url)
+        size = entry.size
+        start, end = 0, size - 1
+        m = range_re.fullmatch(self.headers.get("Range", "").strip())
+        if m and m.group(1):
+            start = int(m.group(1))
+            end = min(int(m.group(2)), end) if m.group(2) else end
+        elif m and m.group(2):  # suffix
+            start = max(size - int(m.group(2)), 0)
+        if start > end:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(206 if m else 200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", f"{end - start + 1}")
+        if m:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        self.responded = True
+
+        pos = start
+        while pos <= end:
+            index = pos // block_size
+            if index in entry.blocks:
+                pos = self._send(entry.read(index), index, pos, end)
+                continue
+            # fetch the run of missing blocks up to the next cached one
+            last = index
+            while last < end // block_size and last - index < max_run and \
+                    last + 1 not in entry.blocks:
+                last += 1
+            first_byte = index * block_size
+            last_byte = min((last + 1) * block_size, size) - 1
+            with self._upstream(url, first_byte, last_byte) as reply:
+                if reply.status != 206 and first_byte:
+                    raise ValueError("upstream ignores ranges")
+                for i in range(index, last + 1):
+                    block = reply.read(entry.block_length(i))
+                    if len(block) != entry.block_length(i):
+                        raise ValueError("upstream closed early")
+                    entry.write(i, block)
+                    pos = self._send(block, i, pos, end)
+
+    def _send(self, block, index, pos, end):
+        offset = index * block_size
+        self.wfile.write(block[pos - offset:end - offset + 1])
+        return offset + len(block)
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, cache):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.cache = cache
+
+
+_server = None
+
+
+def start(max_bytes=2 << 30, root=None):
+    """Start the proxy in a background thread once"""
+    global _server
+    if _server is None:
+        root = root if root else ut.user_dir("cache")/"ranges"
+        _server = Server(RangeCache(root, max_bytes))
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+def proxy_url(key, url):
+    """Return URL of the media `url` read through the proxy"""
+    port = start().server_port
+    return f"http://127.0.0.1:{port}/{quote(key, safe='')}" \
+           f"?url={quote(url, safe='')}"
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    content = os.urandom(3 * block_size + 12345)
+    requests = []
+
+    class Upstream(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            first, last = range_re.fullmatch(self.headers["Range"]).groups()
+            first, last = int(first), min(int(last), len(content) - 1)
+            requests.append((first, last))
+            self.send_response(206)
+            self.send_header("Content-Range",
+                             f"bytes {first}-{last}/{len(content)}")
+            self.send_header("Content-Length", f"{last - first + 1}")
+            self.end_headers()
+            self.wfile.write(content[first:last + 1])
+
+    upstream = ThreadingHTTPServer(("127.0.0.1", 0), Upstream)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    media = f"http://127.0.0.1:{upstream.server_port}/video?expire=1"
+
+    def get(first=None, last=""):
+        request = urllib.request.Request(proxy_url("id/137", media))
+        if first is not None:
+            request.add_header("Range", f"bytes={first}-{last}")
+        with urllib.request.urlopen(request) as reply:
+            return reply.read()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start(root=tmp)
+        assert get(block_size + 10, 2 * block_size + 20) == \
+            content[block_size + 10:2 * block_size + 21]
+        fetched = len(requests)
+        assert get(block_size + 100, block_size + 200) == \
+            content[block_size + 100:block_size + 201]
+        assert len(requests) == fetched     # served from the disk
+        assert get() == content
+        assert get(len(content) - 5) == content[-5:]
+        time.sleep(0.1)     # for the handler to release the entry
+        _server.cache.max_bytes = block_size
+        _server.cache.evict()
+        assert not _server.cache.entries
+        _server.shutdown()
+    upstream.shutdown()
+    print("[OK]")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""Output sinks streaming a cut to a consumer instead of a file
+
+   -, stdout            standard output of ffmpeg
+   fifo:<path>, <fifo>  named pipe, created if missing
+   http://localhost/... chunked HTTP PUT to a local endpoint
+
+   Output is fragmented MP4, or MPEG-TS if the target ends with `.ts`."""
+
+import os
+import stat
+from urllib.parse import urlsplit
+
+
+loopback = ("localhost", "127.0.0.1", "::1")
+
+
+class Sink:
+    """Non-seekable output of ffmpeg"""
+    def __init__(self, kind, target):
+        self.kind = kind
+        self.target = target
+
+    def is_mpegts(self):
+        return urlsplit(self.target).path.endswith(".ts")
+
+    def prepare(self):
+        if self.kind == "fifo" and not os.path.exists(self.target):
+            os.mkfifo(self.target)
+
+    def ffmpeg_args(self):
+        if self.is_mpegts():
+            opts = ["-f", "mpegts"]
+        else:
+            # moov atom goes first and then self-contained fragments
+            opts = ["-f", "mp4", "-movflags",
+                    "frag_keyframe+empty_moov+default_base_moof"]
+        if self.kind == "stdout":
+            return opts + ["pipe:1"]
+        if self.kind == "http":
+            return opts + ["-method", "PUT", "-chunked_post", "1",
+                           self.target]
+        return opts + ["-y", self.target]
+
+    def __str__(self):
+        return f"{self.kind}:{self.target}"
+
+
+def parse(output):
+    """Return `Sink` for streaming `output`, None for a regular file"""
+    output = f"{output}"
+    if output in ("-", "stdout", "stdout.ts"):
+        return Sink("stdout", output)
+    if output.startswith("fifo:"):
+        return Sink("fifo", output[len("fifo:"):])
+    parts = urlsplit(output)
+    if parts.scheme in ("http", "https"):
+        if parts.hostname not in loopback:
+            raise ValueError(f"{output}: only local HTTP endpoints"
+                             " are allowed")
+        return Sink("http", output)
+    try:
+        if stat.S_ISFIFO(os.stat(output).st_mode):
+            return Sink("fifo", output)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def is_sink(output):
+    try:
+        return parse(output) is not None
+    except ValueError:
+        return True
+
+
+if __name__ == "__main__":
+    assert parse("/tmp/clip.mp4") is None
+    assert parse("-").ffmpeg_args()[-1] == "pipe:1"
+    assert parse("stdout.ts").ffmpeg_args()[:2] == ["-f", "mpegts"]
+    assert parse("fifo:/tmp/clip.ts").ffmpeg_args() == \
+        ["-f", "mpegts", "-y", "/tmp/clip.ts"]
+    sink = parse("http://127.0.0.1:8080/upload/clip.mp4")
+    assert sink.kind == "http" and "PUT" in sink.ffmpeg_args()
+    try:
+        parse("http://example.com/clip.mp4")
+        assert False
+    except ValueError:
+        pass
+    assert is_sink("http://example.com/clip.mp4")
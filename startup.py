@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""Cold start timing (`--startup-timing` mode): durations of startup
+phases and the slowest imports, reported after the first paint
+
+Imported before anything else by the main module, so it uses the
+standard library only."""
+
+import builtins
+import sys
+import threading
+import time
+
+
+started = time.perf_counter()
+enabled = "--startup-timing" in sys.argv
+_phases = []    # name, time of the end
+_imports = dict()   # module name -> cumulative and own time
+_nested = []
+_import = builtins.__import__
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if name in sys.modules or threading.current_thread() is not \
+       threading.main_thread():
+        return _import(name, globals, locals, fromlist, level)
+    start = time.perf_counter()
+    _nested.append(0.0)
+    try:
+        return _import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        inner = _nested.pop()
+        if _nested:
+            _nested[-1] += elapsed
+        _imports[name] = (elapsed, elapsed - inner)
+
+
+def mark(phase):
+    """Note the end of startup `phase`"""
+    if enabled:
+        _phases.append((phase, time.perf_counter()))
+
+
+def report(top=15):
+    """Stop timing and return the report"""
+    builtins.__import__ = _import
+    lines = [f"startup {(_phases[-1][1] - started) * 1000:.0f} ms"
+             if _phases else "startup"]
+    last = started
+    for phase, end in _phases:
+        lines.append(f"  {phase:<28}{(end - last) * 1000:8.1f} ms")
+        last = end
+    lines.append("slowest imports (cumulative, own):")
+    slowest = sorted(_imports.items(), key=lambda i: -i[1][0])[:top]
+    for name, (total, own) in slowest:
+        lines.append(f"  {name:<28}{total * 1000:8.1f} ms"
+                     f"{own * 1000:8.1f} ms")
+    return "\n".join(lines)
+
+
+if enabled:
+    builtins.__import__ = _timed_import
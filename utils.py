@@ -2,6 +2,7 @@
 
 import logging
 import math
+import os
 import re
 import pathlib
 import platform
@@ -9,16 +10,14 @@ import shutil
 import sys
 from urllib.parse import urlparse, parse_qs
 
-from PyQt6.QtCore import QProcess
+from PyQt6.QtCore import QProcess, QStandardPaths
+
+import errors as ers
 
 
 package_dir = pathlib.Path(sys.argv[0]).parent
 args = None     # set in main module
 
-logging.basicConfig(filename="yt-cut.log", encoding="utf-8",
-                    format="%(asctime)s:%(module)s:%(levelname)s: %(message)s",
-                    level=logging.CRITICAL)
-
 
 def logger():
     return logging.getLogger("yt-cut")
@@ -28,6 +27,27 @@ def application_path():
     return pathlib.Path(sys.argv[0]).parent
 
 
+def user_dir(kind="data"):
+    """Return per-user directory for application data, cache or logs"""
+    if kind == "log" and platform.system() == "Darwin":
+        path = pathlib.Path.home()/"Library"/"Logs"/"yt-cut"
+    elif kind == "log" and under_windows():
+        path = user_dir("data")/"logs"
+    elif kind == "log":
+        state = os.environ.get("XDG_STATE_HOME",
+                               pathlib.Path.home()/".local"/"state")
+        path = pathlib.Path(state)/"yt-cut"
+    else:
+        location = {
+            "data": QStandardPaths.StandardLocation.GenericDataLocation,
+            "cache": QStandardPaths.StandardLocation.GenericCacheLocation,
+        }[kind]
+        path = pathlib.Path(QStandardPaths.writableLocation(location)) \
+            / "yt-cut"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
 def as_command(s):
     """Return command `s` as pathlib.Path object
        if available from the command line"""
@@ -98,11 +118,19 @@ def get_url_time(url):
     return None
 
 
-err_pat = re.compile(r"error", re.IGNORECASE)
+expire_pat = re.compile(r"[?&/]expire[=/](\d+)")
+
+
+def urls_expire(urls):
+    """Return the earliest expiration time (seconds since the epoch)
+       of signed media `urls` or None if not known"""
+    times = [int(m.group(1)) for url in urls
+             if (m := expire_pat.search(url))]
+    return min(times) if times else None
 
 
 def has_error(msg):
-    return err_pat.search(msg) is not None
+    return ers.has_error(msg)
 
 
 class CalledProcessError(RuntimeError):
@@ -135,7 +163,9 @@ def check_output(process):
             logger().warning(err)
         out = decode(process.readAllStandardOutput())
         out = re.sub(r' NA,', ' "NA",', out)  # NOTE: seems this is due to YT-DLP bug in JSON
-        logger().debug(out)
+        if logger().isEnabledFor(logging.DEBUG):
+            logger().debug(out if len(out) < 2000
+                           else f"{out[:2000]}... ({len(out)} chars)")
         return out
     raise CalledProcessFailed(process, err)
 
@@ -226,8 +256,10 @@ if __name__ == "__main__":
         ("SomeError:", True),
         ("ERROR:", True),
         ("Err", False),
-        ("SomeWarning:", True),
+        ("SomeWarning:", False),
         ("WARNING", False),
+        ("WARNING: ignoring error", False),
+        ("[h264 @ 0x1] error while decoding MB 1 2", False),
     ]
     print("Test has_error(): ",
-          ok(any([has_error(msg) == ans for msg, ans in tests])))
+          ok(all([has_error(msg) == ans for msg, ans in tests])))